@@ -3,7 +3,8 @@ set -e
 
 if [ "$1" = "gunicorn" ]; then
     python manage.py migrate --noinput
-    exec gunicorn ${PROJ_NAME}.wsgi:application --bind [::]:$PORT --timeout 300
+    # uvicorn workers serving the ASGI app, GraphQL queries are handled by the async view
+    exec gunicorn ${PROJ_NAME}.asgi:application -k uvicorn_worker.UvicornWorker --bind [::]:$PORT --timeout 300
 else
     # Run any other command
     exec "$@"
@@ -0,0 +1,80 @@
+"""
+GraphQL backend of the /graphql view.
+
+GraphQLCoreBackend parses and validates the query text on every request. CachedDocumentBackend keeps the
+parsed document, its validation errors and its cost plan (see complexity.py) in a process-local LRU keyed
+by the sha256 of the query, so repeated queries go straight to the depth/cost check and execution.
+"""
+
+import hashlib
+import threading
+from collections import OrderedDict
+from functools import partial
+
+from django.conf import settings
+from graphql.backend.base import GraphQLDocument
+from graphql.backend.core import GraphQLCoreBackend
+from graphql.execution import ExecutionResult, execute
+from graphql.language.base import parse
+from graphql.validation import validate
+
+from .complexity import plan_operations, check_query_cost
+
+
+def query_hash(query):
+    return hashlib.sha256(query.encode()).hexdigest()
+
+
+def document_errors(document, operation_name=None, variables=None):
+    """
+    Validation errors of a document from CachedDocumentBackend, or the errors of the operation
+    going over the query budgets.
+    """
+    if document.validation_errors:
+        return document.validation_errors
+    return check_query_cost(document.plans, operation_name, variables)
+
+
+def execute_validated(document, *args, **kwargs):
+    """
+    Execute a document validated beforehand, unless it is invalid or over the query budgets.
+    """
+    errors = document_errors(document, kwargs.get("operation_name"), kwargs.get("variable_values"))
+    if errors:
+        return ExecutionResult(errors=errors, invalid=True)
+    return execute(document.schema, document.document_ast, *args, **kwargs)
+
+
+class CachedDocumentBackend(GraphQLCoreBackend):
+    """
+    GraphQLCoreBackend caching the parsed and validated documents,
+    and rejecting the operations over the depth/cost budgets before executing them.
+    """
+
+    def __init__(self, executor=None, cache_size=None):
+        super().__init__(executor)
+        self.cache_size = cache_size or settings.GRAPHQL_DOCUMENT_CACHE_SIZE
+        self.documents = OrderedDict()
+        self.lock = threading.Lock()
+
+    def document_from_string(self, schema, document_string):
+        key = (id(schema), query_hash(document_string))
+        with self.lock:
+            document = self.documents.get(key)
+            if document is not None:
+                self.documents.move_to_end(key)
+                return document
+
+        # syntax errors are raised (and not cached), the view reports them
+        document_ast = parse(document_string)
+        validation_errors = validate(schema, document_ast)
+        plans = plan_operations(schema, document_ast) if not validation_errors else {}
+        document = GraphQLDocument(schema=schema, document_string=document_string, document_ast=document_ast, execute=None)
+        document.validation_errors = validation_errors
+        document.plans = plans
+        document.execute = partial(execute_validated, document, **self.execute_params)
+        with self.lock:
+            self.documents[key] = document
+            if len(self.documents) > self.cache_size:
+                self.documents.popitem(last=False)
+        return document
@@ -0,0 +1,205 @@
+"""
+Query depth and cost limits, checked after validation and before anything is executed.
+
+Recursive fields (PostNode.comments, ProfileNode.followers, ...) let a small query expand to millions
+of rows. Every operation is turned once into a cost plan, cached with the parsed document per query hash
+(see backend.py), and the plan is then evaluated against the variables of each request:
+
+- depth: nesting level of the fields (introspection fields are not counted)
+- cost: estimated number of rows, every object costs its field weight (1 by default) and lists multiply
+  the cost of their items by their size: first/last for connections and lists taking them, else
+  the connection max limit or LIST_SIZES
+
+Operations over GRAPHQL_QUERY_MAX_DEPTH or GRAPHQL_QUERY_MAX_COST are rejected.
+"""
+
+from django.conf import settings
+from graphene_django.settings import graphene_settings
+from graphql import GraphQLError
+from graphql.language import ast
+from graphql.type import GraphQLList, GraphQLNonNull, get_named_type
+
+
+# rows fetched per object, fields not listed cost 1 (objects) or 0 (scalars)
+FIELD_WEIGHTS = {
+    "ProfileNode.mutualFollowers": 2, # self join on follows
+}
+
+# expected size of the lists without a first/last argument
+DEFAULT_LIST_SIZE = 20
+# (the follow lists take first, capped by the loaders, see loaders.py)
+LIST_SIZES = {
+    "PostNode.media": 4,
+    "ThreadNode.replies": 5,
+}
+
+
+class CostNode:
+    """
+    Cost of a field selection: size is an int or the name of the variable giving it (with a fallback).
+    """
+    __slots__ = ("weight", "size", "variable", "children")
+
+    def __init__(self, weight, size, variable=None, children=()):
+        self.weight = weight
+        self.size = size
+        self.variable = variable
+        self.children = children
+
+    def cost(self, variables):
+        size = self.size
+        if self.variable is not None:
+            value = variables.get(self.variable)
+            if isinstance(value, int) and not isinstance(value, bool):
+                size = max(value, 0)
+        return size * (self.weight + sum(child.cost(variables) for child in self.children))
+
+
+class OperationPlan:
+    __slots__ = ("depth", "nodes")
+
+    def __init__(self, depth, nodes):
+        self.depth = depth
+        self.nodes = nodes
+
+    def cost(self, variables):
+        return sum(node.cost(variables or {}) for node in self.nodes)
+
+
+def _is_connection(graphql_type):
+    fields = getattr(graphql_type, "fields", None) or {}
+    return "edges" in fields and "pageInfo" in fields
+
+
+def _is_list(graphql_type):
+    if isinstance(graphql_type, GraphQLNonNull):
+        graphql_type = graphql_type.of_type
+    return isinstance(graphql_type, GraphQLList)
+
+
+class _Planner:
+    def __init__(self, schema, document_ast, operation):
+        self.schema = schema
+        self.fragments = {
+            definition.name.value: definition
+            for definition in document_ast.definitions
+            if isinstance(definition, ast.FragmentDefinition)
+        }
+        self.variable_defaults = {}
+        for definition in operation.variable_definitions or ():
+            if isinstance(definition.default_value, ast.IntValue):
+                self.variable_defaults[definition.variable.name.value] = max(int(definition.default_value.value), 0)
+
+    def fields(self, parent_type, selection_set):
+        """
+        Yield (field, parent type) of a selection set, fragments expanded.
+        """
+        for selection in selection_set.selections:
+            if isinstance(selection, ast.Field):
+                yield selection, parent_type
+                continue
+            if isinstance(selection, ast.FragmentSpread):
+                fragment = self.fragments.get(selection.name.value)
+                if fragment is None:
+                    continue
+                type_condition, selection_set_ = fragment.type_condition, fragment.selection_set
+            else:
+                type_condition, selection_set_ = selection.type_condition, selection.selection_set
+            fragment_type = self.schema.get_type(type_condition.name.value) if type_condition else parent_type
+            yield from self.fields(fragment_type, selection_set_)
+
+    def size(self, field, field_def, limit):
+        """
+        Return (size, variable) of a list field.
+        """
+        if "first" in field_def.args and field_def.args["first"].default_value is not None:
+            limit = field_def.args["first"].default_value
+        arguments = {argument.name.value: argument.value for argument in field.arguments or ()}
+        for name in ("first", "last"):
+            value = arguments.get(name)
+            if isinstance(value, ast.IntValue):
+                # negative sizes would lower the cost of the sibling fields
+                return max(int(value.value), 0), None
+            if isinstance(value, ast.Variable):
+                variable = value.name.value
+                return self.variable_defaults.get(variable, limit), variable
+        return limit, None
+
+    def plan(self, parent_type, selection_set, connection_size=(1, None)):
+        """
+        Return (depth, cost nodes) of a selection set.
+        connection_size: size of the edges list when parent_type is a connection.
+        """
+        depth, nodes = 0, []
+        if selection_set is None:
+            return depth, nodes
+        for field, field_parent in self.fields(parent_type, selection_set):
+            name = field.name.value
+            if name.startswith("__"):
+                continue
+            field_def = getattr(field_parent, "fields", {}).get(name)
+            if field_def is None:
+                continue
+            field_type = get_named_type(field_def.type)
+            key = "{}.{}".format(field_parent.name, name)
+
+            size, variable = 1, None
+            child_connection_size = (1, None)
+            if _is_connection(field_type):
+                child_connection_size = self.size(field, field_def, graphene_settings.RELAY_CONNECTION_MAX_LIMIT)
+            elif _is_connection(field_parent) and name == "edges":
+                size, variable = connection_size
+            elif _is_list(field_def.type):
+                size, variable = self.size(field, field_def, LIST_SIZES.get(key, DEFAULT_LIST_SIZE))
+
+            child_depth, children = self.plan(field_type, field.selection_set, child_connection_size)
+            is_object = hasattr(field_type, "fields") and not _is_connection(field_type) and name != "edges"
+            weight = FIELD_WEIGHTS.get(key, 1 if is_object else 0)
+            depth = max(depth, child_depth + 1)
+            nodes.append(CostNode(weight, size, variable, tuple(children)))
+        return depth, nodes
+
+
+def plan_operations(schema, document_ast):
+    """
+    Return the cost plan of every operation of the document, by operation name.
+    """
+    root_types = {
+        "query": schema.get_query_type(),
+        "mutation": schema.get_mutation_type(),
+        "subscription": schema.get_subscription_type(),
+    }
+    plans = {}
+    for definition in document_ast.definitions:
+        if not isinstance(definition, ast.OperationDefinition):
+            continue
+        planner = _Planner(schema, document_ast, definition)
+        depth, nodes = planner.plan(root_types[definition.operation], definition.selection_set)
+        plans[definition.name.value if definition.name else None] = OperationPlan(depth, nodes)
+    return plans
+
+
+def check_query_cost(plans, operation_name=None, variables=None):
+    """
+    Return a list of errors when the operation goes over the depth or cost budget.
+    plans: plan_operations of the document.
+    """
+    if operation_name is None and len(plans) == 1:
+        plan = next(iter(plans.values()))
+    else:
+        plan = plans.get(operation_name)
+    if plan is None:
+        # unknown operation, the executor reports it
+        return []
+
+    if plan.depth > settings.GRAPHQL_QUERY_MAX_DEPTH:
+        return [GraphQLError(
+            "Query is too deep: depth {} exceeds the maximum of {}.".format(plan.depth, settings.GRAPHQL_QUERY_MAX_DEPTH)
+        )]
+    cost = plan.cost(variables)
+    if cost > settings.GRAPHQL_QUERY_MAX_COST:
+        return [GraphQLError(
+            "Query is too expensive: estimated cost {} exceeds the maximum of {}. "
+            "Request smaller pages or fewer nested lists.".format(cost, settings.GRAPHQL_QUERY_MAX_COST)
+        )]
+    return []
@@ -0,0 +1,225 @@
+"""
+Home timeline backed by per-user redis sorted sets (fan-out-on-write).
+
+Every user has a sorted set feed:<user_id> holding the ids of the top level posts of the
+people they follow (and their own), scored by the post creation timestamp.
+The celery tasks in tasks.py push new posts into the followers' feeds and keep them in sync
+on delete/follow/unfollow.
+Authors with more followers than HOME_FEED_FANOUT_FOLLOWER_LIMIT are not fanned out (one post
+would mean millions of writes), their posts are pulled from the database and merged in at read time.
+"""
+
+import logging
+
+from django.conf import settings
+from django_redis import get_redis_connection
+
+from .models import Post, Follow
+
+logger = logging.getLogger(__name__)
+
+FEED_KEY = "feed:{}"
+CELEBRITIES_KEY = "feed:celebrities"
+FANOUT_BATCH_SIZE = 1000
+
+
+def feed_key(user_id):
+    return FEED_KEY.format(user_id)
+
+
+def get_connection():
+    return get_redis_connection("default")
+
+
+def feed_posts():
+    """
+    Posts eligible for the home feed: live top level posts (same as allPosts).
+    """
+    return Post.objects.filter(deleted=False, parent_post=None)
+
+
+def is_celebrity(follower_count):
+    return follower_count > settings.HOME_FEED_FANOUT_FOLLOWER_LIMIT
+
+
+def push_to_feeds(user_ids, entries, only_existing=True):
+    """
+    Add {post_id: score} entries to the feeds of user_ids and trim them to the max feed length.
+    only_existing: skip users without a feed, a partial feed would stop it from being rebuilt on read.
+    """
+    redis = get_connection()
+    if only_existing:
+        pipe = redis.pipeline(transaction=False)
+        for user_id in user_ids:
+            pipe.exists(feed_key(user_id))
+        user_ids = [user_id for user_id, exists in zip(user_ids, pipe.execute()) if exists]
+        if not user_ids:
+            return
+    pipe = redis.pipeline(transaction=False)
+    for user_id in user_ids:
+        key = feed_key(user_id)
+        pipe.zadd(key, entries)
+        # keep only the newest HOME_FEED_MAX_LENGTH entries
+        pipe.zremrangebyrank(key, 0, -settings.HOME_FEED_MAX_LENGTH - 1)
+        pipe.expire(key, settings.HOME_FEED_TTL)
+    pipe.execute()
+
+
+def remove_from_feeds(user_ids, post_ids):
+    if not post_ids:
+        return
+    redis = get_connection()
+    pipe = redis.pipeline(transaction=False)
+    for user_id in user_ids:
+        pipe.zrem(feed_key(user_id), *post_ids)
+    pipe.execute()
+
+
+def follower_batches(author_id):
+    """
+    Yield the follower ids of author_id in batches of FANOUT_BATCH_SIZE.
+    """
+    last_id = None
+    while True:
+        follows = Follow.objects.filter(user_id=author_id).order_by("followed_by_id")
+        if last_id is not None:
+            follows = follows.filter(followed_by_id__gt=last_id)
+        batch = list(follows.values_list("followed_by_id", flat=True)[:FANOUT_BATCH_SIZE])
+        if not batch:
+            return
+        last_id = batch[-1]
+        yield batch
+
+
+def fan_out_post(post):
+    """
+    Push a new post into the author's feed and into the feeds of all their followers,
+    unless the author has too many followers, in which case they're flagged for fan-out-on-read.
+    """
+    fan_out_author_posts(post.author_id, [post])
+
+
+def fan_out_author_posts(author_id, posts):
+    """
+    fan_out_post for several new posts of the same author, the followers are only walked once.
+    """
+    entries = {str(post.id): post.created_at.timestamp() for post in posts}
+    push_to_feeds([author_id], entries)
+
+    follower_count = Follow.objects.filter(user_id=author_id).count()
+    if is_celebrity(follower_count):
+        get_connection().sadd(CELEBRITIES_KEY, str(author_id))
+        return
+
+    get_connection().srem(CELEBRITIES_KEY, str(author_id))
+    for batch in follower_batches(author_id):
+        push_to_feeds(batch, entries)
+
+
+def retract_post(post):
+    """
+    Remove a (soft) deleted post from every feed it was pushed to.
+    """
+    remove_from_feeds([post.author_id], [str(post.id)])
+    for batch in follower_batches(post.author_id):
+        remove_from_feeds(batch, [str(post.id)])
+
+
+def recent_post_entries(author_ids, limit, before=None):
+    """
+    Return (post_id, score) of the newest feed posts of author_ids, newest first.
+    """
+    posts = feed_posts().filter(author_id__in=author_ids)
+    if before is not None:
+        posts = posts.filter(created_at__lt=before)
+    return [
+        (str(post_id), created_at.timestamp())
+        for post_id, created_at in posts.order_by("-created_at").values_list("id", "created_at")[:limit]
+    ]
+
+
+def add_author_to_feed(user_id, author_id):
+    """
+    Backfill the recent posts of a newly followed author into the follower's feed.
+    """
+    add_authors_to_feed(user_id, [author_id])
+
+
+def add_authors_to_feed(user_id, author_ids):
+    entries = dict(recent_post_entries(author_ids, settings.HOME_FEED_MAX_LENGTH))
+    if entries:
+        push_to_feeds([user_id], entries)
+
+
+def remove_author_from_feed(user_id, author_id):
+    post_ids = [post_id for post_id, _ in recent_post_entries([author_id], settings.HOME_FEED_MAX_LENGTH)]
+    remove_from_feeds([user_id], post_ids)
+
+
+def feed_author_ids(user_id):
+    """
+    Authors whose posts make up the feed of user_id: the people they follow and themselves.
+    """
+    author_ids = list(Follow.objects.filter(followed_by_id=user_id).values_list("user_id", flat=True))
+    author_ids.append(user_id)
+    return author_ids
+
+
+def rebuild_feed(user_id):
+    """
+    Rebuild a feed that expired or was never built from the database.
+    """
+    entries = dict(recent_post_entries(feed_author_ids(user_id), settings.HOME_FEED_MAX_LENGTH))
+    if entries:
+        push_to_feeds([user_id], entries, only_existing=False)
+
+
+def get_home_feed(user, first=20, before=None):
+    """
+    Return the posts of the user's home feed, newest first.
+    first: number of posts to return.
+    before: only return posts created strictly before this datetime (cursor for the next page).
+    Served from the database when redis is unavailable.
+    """
+    try:
+        entries = read_feed_entries(user, first, before)
+    except Exception:
+        logger.warning("Could not read the home feed of %s, reading it from the database", user.id, exc_info=True)
+        entries = recent_post_entries(feed_author_ids(user.id), first, before)
+
+    post_ids = [post_id for post_id, _ in entries[:first]]
+    posts = feed_posts().select_related("author__profile").in_bulk(post_ids)
+    # in_bulk keys are UUIDs, entries come back from redis as strings
+    posts = {str(post_id): post for post_id, post in posts.items()}
+    return [posts[post_id] for post_id in post_ids if post_id in posts]
+
+
+def read_feed_entries(user, first, before):
+    """
+    Return (post_id, score) of a page of the redis feed of user, merged with the posts of the celebrities they follow.
+    """
+    redis = get_connection()
+    key = feed_key(user.id)
+    if not redis.exists(key):
+        rebuild_feed(user.id)
+
+    max_score = "({}".format(before.timestamp()) if before is not None else "+inf"
+    entries = [
+        (post_id.decode(), score)
+        for post_id, score in redis.zrevrangebyscore(key, max_score, "-inf", start=0, num=first, withscores=True)
+    ]
+
+    # fan-out-on-read: merge in the posts of followed authors that are too big to fan out
+    celebrities = redis.smembers(CELEBRITIES_KEY)
+    if celebrities:
+        followed_celebrities = list(
+            Follow.objects.filter(
+                followed_by=user, user_id__in=[celebrity.decode() for celebrity in celebrities]
+            ).values_list("user_id", flat=True)
+        )
+        if followed_celebrities:
+            # dict merge drops posts already fanned out before the author crossed the limit
+            merged = dict(entries)
+            merged.update(recent_post_entries(followed_celebrities, first, before))
+            entries = sorted(merged.items(), key=lambda entry: entry[1], reverse=True)
+    return entries
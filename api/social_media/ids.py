@@ -0,0 +1,55 @@
+"""
+Time ordered UUIDs (version 7, RFC 9562) for the primary keys of the write heavy tables.
+
+uuid4 keys land on random pages of the primary key index, every insert dirties a different page and splits
+half-full ones. uuid7 keys start with the creation time in milliseconds, new rows are appended to the right
+edge of the index like with a sequence, while ids stay unguessable (74 random bits) and can still be
+generated without asking the database.
+
+Layout: 48 bits unix time in ms | version 7 | 12 bits counter | variant | 62 random bits.
+The counter starts at a random value every millisecond and is incremented for the ids generated within
+the same millisecond, so the ids of a process are strictly increasing.
+Rows created before the switch keep their uuid4 ids, only new rows get uuid7 ones.
+"""
+
+import os
+import threading
+import time
+import uuid
+
+_lock = threading.Lock()
+_last_ms = 0
+_counter = 0
+
+COUNTER_BITS = 12
+COUNTER_MAX = (1 << COUNTER_BITS) - 1
+
+
+def uuid7():
+    global _last_ms, _counter
+    with _lock:
+        ms = time.time_ns() // 1_000_000
+        if ms > _last_ms:
+            _last_ms = ms
+            # leave room to count up within the millisecond
+            _counter = int.from_bytes(os.urandom(2), "big") & (COUNTER_MAX >> 1)
+        else:
+            # same millisecond (or the clock went back): keep increasing
+            _counter += 1
+            if _counter > COUNTER_MAX:
+                _last_ms += 1
+                _counter = 0
+        ms, counter = _last_ms, _counter
+
+    random_bits = int.from_bytes(os.urandom(8), "big") & ((1 << 62) - 1)
+    value = (ms & ((1 << 48) - 1)) << 80 | 0x7 << 76 | counter << 64 | 0b10 << 62 | random_bits
+    return uuid.UUID(int=value)
+
+
+def uuid7_time(value):
+    """
+    Creation time of a uuid7 in seconds since the epoch, None for the other versions.
+    """
+    if value.version != 7:
+        return None
+    return (value.int >> 80) / 1000
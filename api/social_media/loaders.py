@@ -0,0 +1,180 @@
+"""
+Per-request DataLoaders for the nested PostNode / ProfileNode / FollowNode fields.
+
+Every loader collects the keys (post ids or user ids) requested while a level of the
+query is being resolved and fetches all of them with a single query, so a page of 50 posts
+costs one query per nested field instead of one query per post.
+The loaders live on info.context (the request) so their cache never outlives the request.
+The follow lists are capped to the FOLLOW_LIST_MAX newest follows per user, newest first, ProfileNode pages
+through them with its first argument (FOLLOW_LIST_SIZE by default).
+"""
+
+import logging
+from collections import defaultdict
+
+from django.db.models import F, Q, Window
+from django.db.models.functions import RowNumber
+from promise import Promise
+from promise.dataloader import DataLoader
+
+from .models import Profile, Post, PostMedia, Interaction, Follow, Bookmark
+from . import social_graph
+
+logger = logging.getLogger(__name__)
+
+
+FOLLOW_LIST_SIZE = 50
+FOLLOW_LIST_MAX = 100
+
+
+class GroupedLoader(DataLoader):
+    """
+    Base loader returning a list of rows per key.
+    key_attr: attribute of the fetched rows holding the key they belong to.
+    limit: rows kept per key, the first ones in `ordering`, None for all of them.
+    ordering: order of the rows of each key.
+    """
+    key_attr = None
+    limit = None
+    ordering = None
+
+    def get_queryset(self, keys):
+        raise NotImplementedError
+
+    def transform(self, obj):
+        return obj
+
+    def batch_load_fn(self, keys):
+        return self.group(keys, self.get_queryset(keys))
+
+    def group(self, keys, queryset):
+        if self.ordering is not None:
+            queryset = queryset.order_by(*self.ordering)
+        if self.limit is not None:
+            queryset = queryset.annotate(
+                row_number=Window(RowNumber(), partition_by=F(self.key_attr), order_by=list(self.ordering))
+            ).filter(row_number__lte=self.limit)
+        grouped = defaultdict(list)
+        for obj in queryset:
+            grouped[getattr(obj, self.key_attr)].append(self.transform(obj))
+        return Promise.resolve([grouped.get(key, []) for key in keys])
+
+
+class PostMediaLoader(GroupedLoader):
+    key_attr = "post_id"
+
+    def get_queryset(self, keys):
+        return PostMedia.objects.filter(post_id__in=keys)
+
+
+class PostEngagementsLoader(GroupedLoader):
+    key_attr = "post_id"
+
+    def get_queryset(self, keys):
+        return Interaction.objects.filter(post_id__in=keys)
+
+
+class PostCommentsLoader(GroupedLoader):
+    key_attr = "parent_post_id"
+
+    def get_queryset(self, keys):
+        return Post.objects.select_related("author__profile").filter(parent_post_id__in=keys)
+
+
+class FollowersLoader(GroupedLoader):
+    """
+    Profiles following each user id.
+    """
+    key_attr = "user_id"
+    limit = FOLLOW_LIST_MAX
+    ordering = ("-created_at",)
+
+    def get_queryset(self, keys):
+        return Follow.objects.select_related("followed_by__profile").filter(user_id__in=keys)
+
+    def transform(self, follow):
+        return follow.followed_by.profile
+
+
+class FollowingLoader(GroupedLoader):
+    """
+    Profiles each user id is following.
+    """
+    key_attr = "followed_by_id"
+    limit = FOLLOW_LIST_MAX
+    ordering = ("-created_at",)
+
+    def get_queryset(self, keys):
+        return Follow.objects.select_related("user__profile").filter(followed_by_id__in=keys)
+
+    def transform(self, follow):
+        return follow.user.profile
+
+
+class MutualFollowersLoader(FollowersLoader):
+    """
+    Profiles following each user id that the user also follows back, newest follows first.
+    The ids come from the intersection of the redis follower/following sets (see social_graph.py),
+    their follows are then fetched with a single query (the sets don't know when the follows were made).
+    """
+
+    def batch_load_fn(self, keys):
+        try:
+            mutual_ids = social_graph.mutual_follower_ids(keys)
+        except Exception:
+            logger.warning("Social graph sets unavailable, computing mutual followers in SQL", exc_info=True)
+            return super().batch_load_fn(keys)
+        pairs = [Q(user_id=key, followed_by_id__in=ids) for key, ids in mutual_ids.items() if ids]
+        if not pairs:
+            return Promise.resolve([[] for key in keys])
+        condition = pairs[0]
+        for pair in pairs[1:]:
+            condition |= pair
+        return self.group(keys, super().get_queryset(keys).filter(condition))
+
+    def get_queryset(self, keys):
+        return super().get_queryset(keys).filter(
+            followed_by__followers__followed_by_id=F("user_id")
+        )
+
+
+class UserBookmarksLoader(GroupedLoader):
+    key_attr = "user_id"
+
+    def get_queryset(self, keys):
+        return Bookmark.objects.filter(user_id__in=keys)
+
+
+class ProfileByUserLoader(DataLoader):
+    def batch_load_fn(self, keys):
+        # ProfileNode.user is asked for along with the profile most of the time
+        profiles = Profile.objects.select_related("user").filter(user_id__in=keys)
+        profiles = {profile.user_id: profile for profile in profiles}
+        return Promise.resolve([profiles.get(key) for key in keys])
+
+
+class Loaders:
+    """
+    Container for all the loaders of a single request.
+    """
+    def __init__(self):
+        self.post_media = PostMediaLoader()
+        self.post_engagements = PostEngagementsLoader()
+        self.post_comments = PostCommentsLoader()
+        self.followers = FollowersLoader()
+        self.following = FollowingLoader()
+        self.mutual_followers = MutualFollowersLoader()
+        self.user_bookmarks = UserBookmarksLoader()
+        self.profile_by_user = ProfileByUserLoader()
+
+
+def get_loaders(info):
+    """
+    Return the loaders attached to the request, creating them on first use.
+    """
+    context = info.context
+    loaders = getattr(context, "loaders", None)
+    if loaders is None:
+        loaders = Loaders()
+        context.loaders = loaders
+    return loaders
@@ -0,0 +1,265 @@
+import json
+import math
+import random
+import re
+import time
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import AnonymousUser
+from django.core.management.base import BaseCommand, CommandError
+from django.test import RequestFactory, override_settings
+from graphene import Node
+from graphql_jwt.settings import jwt_settings
+from graphql_jwt.shortcuts import get_token
+
+from social_media.backend import CachedDocumentBackend
+from social_media.models import Post, Profile
+from social_media.views import CachedGraphQLView
+
+
+User = get_user_model()
+
+POST_FIELDS = """
+fragment PostFields on PostNode {
+  id content createdAt likeCount shareCount commentCount bookmarkCount
+  author { username profile { firstName lastName } }
+  media { mediaUrl type }
+}
+"""
+
+# name: (weight, document, variables(sampler)), roughly the traffic of a feed based app
+OPERATIONS = {
+    "homeFeed": (20, """
+        query homeFeed { homeFeed(first: 20) { ...PostFields } }
+    """ + POST_FIELDS, lambda sample: {}),
+    "allPosts": (15, """
+        query allPosts { allPosts(first: 20) { edges { node { ...PostFields } } pageInfo { endCursor hasNextPage } } }
+    """ + POST_FIELDS, lambda sample: {}),
+    "post": (10, """
+        query post($id: ID!) { post(id: $id) { ...PostFields comments { ...PostFields } } }
+    """ + POST_FIELDS, lambda sample: {"id": sample.post_id()}),
+    "thread": (8, """
+        query thread($rootId: ID!) {
+          thread(rootId: $rootId, maxDepth: 3, perLevel: 10) {
+            post { ...PostFields }
+            replies { post { ...PostFields } hasMoreReplies replies { post { ...PostFields } hasMoreReplies } }
+          }
+        }
+    """ + POST_FIELDS, lambda sample: {"rootId": sample.post_id()}),
+    "trendingPosts": (8, """
+        query trendingPosts { trendingPosts(first: 20) { totalCount edges { node { ...PostFields } } } }
+    """ + POST_FIELDS, lambda sample: {}),
+    "profile": (8, """
+        query profile($id: ID!) {
+          profile(id: $id) {
+            id firstName lastName bio followerCount followingCount user { username }
+            mutualFollowers { id firstName user { username } }
+          }
+        }
+    """, lambda sample: {"id": sample.profile_id()}),
+    "searchPosts": (5, """
+        query searchPosts($query: String!) { searchPosts(query: $query, first: 20) { edges { node { ...PostFields } } } }
+    """ + POST_FIELDS, lambda sample: {"query": sample.word()}),
+    "searchProfiles": (3, """
+        query searchProfiles($query: String!) {
+          searchProfiles(query: $query, first: 20) { edges { node { id firstName lastName user { username } } } }
+        }
+    """, lambda sample: {"query": sample.name()}),
+    "suggestedProfiles": (4, """
+        query suggestedProfiles { suggestedProfiles(first: 20) { id firstName followerCount user { username } } }
+    """, lambda sample: {}),
+    "allBookmarks": (4, """
+        query allBookmarks { allBookmarks(first: 20) { edges { node { bookmarkedAt post { ...PostFields } } } } }
+    """ + POST_FIELDS, lambda sample: {}),
+    "like": (8, """
+        mutation like($postId: ID!) { createInteraction(postId: $postId, type: "LIKE") { interaction { id } } }
+    """, lambda sample: {"postId": sample.post_id()}),
+    "createPost": (2, """
+        mutation createPost($content: String!) { createPost(content: $content, isPublished: true) { post { id } } }
+    """, lambda sample: {"content": sample.content()}),
+    "createComment": (2, """
+        mutation createComment($content: String!, $parentPostId: ID!) {
+          createPost(content: $content, isPublished: true, parentPostId: $parentPostId) { post { id } }
+        }
+    """, lambda sample: {"content": sample.content(), "parentPostId": sample.post_id()}),
+    "followUser": (2, """
+        mutation followUser($username: String!) { followUser(usernameToFollow: $username) { success } }
+    """, lambda sample: {"username": sample.username()}),
+    "bookmark": (2, """
+        mutation bookmark($postId: ID!) { addPostToBookmark(postId: $postId) { success } }
+    """, lambda sample: {"postId": sample.post_id()}),
+}
+
+
+def is_mutation(document):
+    return document.lstrip().startswith("mutation")
+
+
+def percentile(ordered, p):
+    # nearest rank
+    return ordered[max(0, math.ceil(p / 100 * len(ordered)) - 1)]
+
+
+class Sampler:
+    """
+    Random arguments for the operations, drawn from a sample of the existing rows.
+    """
+
+    def __init__(self, rng, size):
+        self.rng = rng
+        posts = list(
+            Post.objects.filter(deleted=False, parent_post=None).order_by("?").values_list("id", "content")[:size]
+        )
+        profiles = list(
+            Profile.objects.order_by("?").values_list("id", "first_name", "user__username")[:size]
+        )
+        if not posts or not profiles:
+            raise CommandError("No posts or profiles found, seed the database first (seed_social_graph).")
+        self.post_ids = [Node.to_global_id("PostNode", post_id) for post_id, _ in posts]
+        self.profile_ids = [Node.to_global_id("ProfileNode", profile_id) for profile_id, _, _ in profiles]
+        self.usernames = [username for _, _, username in profiles]
+        self.names = [first_name for _, first_name, _ in profiles if first_name] or self.usernames
+        self.words = sorted({word for _, content in posts for word in re.findall(r"[a-z]{4,}", content.lower())})
+        self.words = self.words or ["post"]
+
+    def post_id(self):
+        return self.rng.choice(self.post_ids)
+
+    def profile_id(self):
+        return self.rng.choice(self.profile_ids)
+
+    def username(self):
+        return self.rng.choice(self.usernames)
+
+    def name(self):
+        return self.rng.choice(self.names)
+
+    def word(self):
+        return self.rng.choice(self.words)
+
+    def content(self):
+        return " ".join(self.rng.choices(self.words, k=12)).capitalize() + "."
+
+
+class BenchmarkView(CachedGraphQLView):
+    def finish_metrics(self, request, metrics, query, result):
+        super().finish_metrics(request, metrics, query, result)
+        # read back by the command
+        request.benchmark_metrics = metrics
+
+
+class Command(BaseCommand):
+    help = (
+        "Replay a weighted mix of SocialMediaQuery and SocialMediaMutation operations, as random viewers, "
+        "through the GraphQL view (JWT authentication, response cache, metrics) in this process, "
+        "and report p50/p95/p99 latency and SQL queries per operation. "
+        "Mutations write to the database: run it against a seeded database (seed_social_graph)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--requests", type=int, default=1000, help="Operations measured.")
+        parser.add_argument("--warmup", type=int, default=50, help="Operations run before measuring.")
+        parser.add_argument("--viewers", type=int, default=100, help="Random users the operations are run as.")
+        parser.add_argument("--sample-size", type=int, default=1000, help="Random posts and profiles used as arguments.")
+        parser.add_argument(
+            "--operation", action="append", dest="operations", choices=sorted(OPERATIONS),
+            help="Only replay these operations, repeatable.",
+        )
+        parser.add_argument("--read-only", action="store_true", help="Leave the mutations out of the mix.")
+        parser.add_argument("--no-cache", action="store_true", help="Disable the response cache.")
+        parser.add_argument("--seed", type=int, default=None, help="Random seed, for a reproducible mix.")
+        parser.add_argument("--json", dest="json_path", help="Also write the report to this file, as JSON.")
+
+    def handle(self, *args, **options):
+        if options["requests"] < 1 or options["warmup"] < 0 or options["viewers"] < 1 or options["sample_size"] < 1:
+            raise CommandError("--requests, --viewers and --sample-size must be positive, --warmup can't be negative.")
+        operations = {
+            name: operation for name, operation in OPERATIONS.items()
+            if (not options["operations"] or name in options["operations"])
+            and not (options["read_only"] and is_mutation(operation[1]))
+        }
+        if not operations:
+            raise CommandError("No operation left to replay.")
+
+        rng = random.Random(options["seed"])
+        sampler = Sampler(rng, options["sample_size"])
+        viewers = [
+            f"{jwt_settings.JWT_AUTH_HEADER_PREFIX} {get_token(user)}"
+            for user in User.objects.filter(is_active=True).order_by("?")[:options["viewers"]]
+        ]
+        self.factory = RequestFactory()
+        self.view = BenchmarkView.as_view(backend=CachedDocumentBackend())
+
+        names = list(operations)
+        weights = [operations[name][0] for name in names]
+        samples = {name: {"latency": [], "queries": [], "cache_hits": 0, "errors": 0} for name in names}
+        cache_settings = {"GRAPHQL_RESPONSE_CACHE_TIMEOUT": 0} if options["no_cache"] else {}
+
+        with override_settings(**cache_settings):
+            for index in range(options["warmup"] + options["requests"]):
+                name = rng.choices(names, weights=weights)[0]
+                _, document, variables = operations[name]
+                elapsed, metrics, errors = self.run_operation(
+                    rng.choice(viewers), name, document, variables(sampler)
+                )
+                if index < options["warmup"]:
+                    continue
+                stats = samples[name]
+                stats["latency"].append(elapsed * 1000)
+                stats["queries"].append(metrics.total.queries if metrics else 0)
+                stats["cache_hits"] += bool(metrics and metrics.total.cache_hits)
+                stats["errors"] += bool(errors)
+
+        report = self.report(samples, operations)
+        self.print_report(report)
+        if options["json_path"]:
+            with open(options["json_path"], "w") as f:
+                json.dump(report, f, indent=2)
+
+    def run_operation(self, authorization, name, document, variables):
+        request = self.factory.post(
+            "/graphql",
+            data=json.dumps({"query": document, "variables": variables, "operationName": name}),
+            content_type="application/json",
+            HTTP_AUTHORIZATION=authorization,
+        )
+        # what AuthenticationMiddleware would set, the JWT middleware replaces it
+        request.user = AnonymousUser()
+        started = time.perf_counter()
+        response = self.view(request)
+        elapsed = time.perf_counter() - started
+        body = json.loads(response.content)
+        return elapsed, getattr(request, "benchmark_metrics", None), body.get("errors")
+
+    def report(self, samples, operations):
+        report = {}
+        for name, stats in samples.items():
+            if not stats["latency"]:
+                continue
+            latency = sorted(stats["latency"])
+            queries = stats["queries"]
+            report[name] = {
+                "type": "mutation" if is_mutation(operations[name][1]) else "query",
+                "count": len(latency),
+                "errors": stats["errors"],
+                "cacheHits": stats["cache_hits"],
+                "p50Ms": round(percentile(latency, 50), 3),
+                "p95Ms": round(percentile(latency, 95), 3),
+                "p99Ms": round(percentile(latency, 99), 3),
+                "maxMs": round(latency[-1], 3),
+                "avgQueries": round(sum(queries) / len(queries), 2),
+                "maxQueries": max(queries),
+            }
+        return report
+
+    def print_report(self, report):
+        self.stdout.write(
+            f"{'operation':<20}{'type':<10}{'count':>7}{'errors':>8}{'cached':>8}"
+            f"{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}{'queries':>9}{'max q':>7}"
+        )
+        for name, row in sorted(report.items(), key=lambda item: item[1]["p95Ms"], reverse=True):
+            self.stdout.write(
+                f"{name:<20}{row['type']:<10}{row['count']:>7}{row['errors']:>8}{row['cacheHits']:>8}"
+                f"{row['p50Ms']:>10.1f}{row['p95Ms']:>10.1f}{row['p99Ms']:>10.1f}{row['maxMs']:>10.1f}"
+                f"{row['avgQueries']:>9.1f}{row['maxQueries']:>7}"
+            )
@@ -0,0 +1,96 @@
+import time
+import uuid
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from social_media.ids import uuid7
+
+
+GENERATORS = {
+    "uuid4": uuid.uuid4,
+    "uuid7": uuid7,
+}
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare insert throughput and primary key index size of uuid4 and uuid7 keys, "
+        "by filling a scratch table (dropped afterwards) with each of them."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rows", type=int, default=200000, help="Rows inserted per key version.")
+        parser.add_argument("--batch-size", type=int, default=1000, help="Rows per INSERT (one transaction each).")
+        parser.add_argument(
+            "--preload", type=int, default=0,
+            help="Rows inserted before the timed run, to measure inserts into an index that no longer fits in cache.",
+        )
+
+    def handle(self, *args, **options):
+        if connection.vendor not in ("postgresql", "sqlite"):
+            raise CommandError("Only PostgreSQL and SQLite are supported.")
+        rows, batch_size = options["rows"], options["batch_size"]
+        if rows < 1 or batch_size < 1:
+            raise CommandError("--rows and --batch-size must be positive.")
+
+        self.stdout.write(f"{connection.vendor}, {rows} rows per version, batches of {batch_size}")
+        self.stdout.write(f"{'keys':<8}{'rows/s':>12}{'index size':>14}{'bytes/row':>12}{'table size':>14}")
+        for name, generate in GENERATORS.items():
+            table = f"uuid_bench_{name}"
+            self.create_table(table)
+            try:
+                self.insert(table, generate, options["preload"], batch_size)
+                started = time.perf_counter()
+                self.insert(table, generate, rows, batch_size)
+                elapsed = time.perf_counter() - started
+                index_size, table_size = self.sizes(table)
+            finally:
+                with connection.cursor() as cursor:
+                    cursor.execute(f"DROP TABLE {table}")
+            total_rows = rows + options["preload"]
+            self.stdout.write(
+                f"{name:<8}{rows / elapsed:>12.0f}{self.human(index_size):>14}"
+                f"{index_size / total_rows:>12.1f}{self.human(table_size):>14}"
+            )
+
+    def create_table(self, table):
+        id_type = "uuid" if connection.vendor == "postgresql" else "char(32)"
+        created_at = "timestamptz NOT NULL DEFAULT now()" if connection.vendor == "postgresql" else "text NOT NULL DEFAULT CURRENT_TIMESTAMP"
+        with connection.cursor() as cursor:
+            cursor.execute(f"DROP TABLE IF EXISTS {table}")
+            cursor.execute(
+                f"CREATE TABLE {table} (id {id_type} PRIMARY KEY, created_at {created_at}, payload text NOT NULL)"
+            )
+
+    def insert(self, table, generate, rows, batch_size):
+        # ids as the UUIDField would send them
+        prepare = str if connection.vendor == "postgresql" else (lambda value: value.hex)
+        payload = "x" * 100
+        for start in range(0, rows, batch_size):
+            values = [(prepare(generate()), payload) for _ in range(min(batch_size, rows - start))]
+            with transaction.atomic(), connection.cursor() as cursor:
+                cursor.executemany(f"INSERT INTO {table} (id, payload) VALUES (%s, %s)", values)
+
+    def sizes(self, table):
+        """
+        Return (primary key index size, table size) in bytes.
+        """
+        with connection.cursor() as cursor:
+            if connection.vendor == "postgresql":
+                cursor.execute("SELECT pg_relation_size(%s), pg_relation_size(%s)", [f"{table}_pkey", table])
+                return cursor.fetchone()
+            # the primary key of a table without rowid alias is the sqlite_autoindex_<table>_1 b-tree
+            cursor.execute(
+                "SELECT name, SUM(pgsize) FROM dbstat WHERE name IN (%s, %s) GROUP BY name",
+                [f"sqlite_autoindex_{table}_1", table],
+            )
+            sizes = dict(cursor.fetchall())
+            return sizes.get(f"sqlite_autoindex_{table}_1", 0), sizes.get(table, 0)
+
+    @staticmethod
+    def human(size):
+        for unit in ("B", "kB", "MB", "GB"):
+            if size < 1024 or unit == "GB":
+                return f"{size:.0f} {unit}" if unit == "B" else f"{size:.1f} {unit}"
+            size /= 1024
@@ -0,0 +1,114 @@
+from types import SimpleNamespace
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import QuerySet
+from django.utils import timezone
+from datetime import timedelta
+
+from graphene_django.filter import DjangoFilterConnectionField
+from graphql.execution.base import ResolveInfo
+
+from social_media.models import Post, Interaction
+from social_media.pagination import KeysetConnectionField
+from social_media.schema import SocialMediaQuery
+
+
+User = get_user_model()
+
+
+def extra_querysets(user):
+    """
+    Querysets issued outside of the query resolvers that should also hit an index.
+    """
+    return {
+        "clean_soft_deleted_posts": Post.objects.filter(
+            deleted=True, updated_at__lt=timezone.now() - timedelta(days=30)
+        ).values_list("id", flat=True),
+        "home_feed_rebuild": Post.objects.filter(
+            deleted=False, parent_post=None, author=user
+        ).order_by("-created_at").values_list("id", "created_at"),
+        "post_likes": Interaction.objects.filter(post__author=user, type="LIKE"),
+    }
+
+
+class Command(BaseCommand):
+    help = (
+        "Print the EXPLAIN plan of the queryset of every SocialMediaQuery list resolver "
+        "(paginated the way the connection field does it), to check index usage on a seeded database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--username", help="Viewer to resolve the querysets for (defaults to the first user).")
+        parser.add_argument("--page-size", type=int, default=20)
+        parser.add_argument("--field", action="append", dest="fields", help="Only explain these fields (snake_case), repeatable.")
+        parser.add_argument("--analyze", action="store_true", help="Run EXPLAIN ANALYZE (PostgreSQL only).")
+        parser.add_argument("--search", default="post", help="Query passed to the search fields (default: post).")
+
+    def handle(self, *args, **options):
+        if options["username"]:
+            try:
+                user = User.objects.get(username=options["username"])
+            except User.DoesNotExist:
+                raise CommandError(f"User {options['username']} not found.")
+        else:
+            user = User.objects.order_by("username").first()
+            if user is None:
+                raise CommandError("No users found, seed the database first.")
+
+        explain_options = {}
+        if options["analyze"]:
+            if connection.vendor != "postgresql":
+                raise CommandError("--analyze is only supported on PostgreSQL.")
+            explain_options = {"analyze": True, "buffers": True}
+
+        context = SimpleNamespace(user=user)
+        page_size = options["page_size"]
+        resolvers = {
+            name: (field, getattr(SocialMediaQuery, f"resolve_{name}"))
+            for name, field in SocialMediaQuery._meta.fields.items()
+            if isinstance(field, DjangoFilterConnectionField) and hasattr(SocialMediaQuery, f"resolve_{name}")
+        }
+        extra = extra_querysets(user)
+
+        names = list(resolvers) + list(extra)
+        if options["fields"]:
+            unknown = set(options["fields"]) - set(names)
+            if unknown:
+                raise CommandError(f"Unknown fields: {', '.join(sorted(unknown))}")
+            names = options["fields"]
+
+        for name in names:
+            self.stdout.write(self.style.MIGRATE_HEADING(f"== {name}"))
+            if name in extra:
+                queryset = extra[name]
+            else:
+                queryset = self.resolve(name, *resolvers[name], context, page_size, options["search"])
+                if isinstance(queryset, str):
+                    # the reason it was skipped
+                    self.stdout.write(queryset)
+                    self.stdout.write("")
+                    continue
+            self.stdout.write(str(queryset.query))
+            self.stdout.write(queryset.explain(**explain_options))
+            self.stdout.write("")
+
+    def resolve(self, name, field, resolver, context, page_size, search):
+        """
+        Queryset of a connection field, paginated like the field does it. A message instead when it can't be resolved.
+        """
+        # login_required only needs a ResolveInfo carrying the context
+        info = ResolveInfo(name, None, None, None, None, None, None, None, {}, context)
+        # the search fields require their query argument
+        arguments = {"query": search} if "query" in field.args else {}
+        try:
+            queryset = resolver(None, info, **arguments)
+        except TypeError:
+            return "skipped (requires arguments)"
+        if not isinstance(queryset, QuerySet):
+            return "skipped (not a queryset)"
+        if isinstance(field, KeysetConnectionField):
+            ordering = field.ordering_field
+            queryset = queryset.order_by(f"-{ordering}", "-id")
+        return queryset[:page_size]
@@ -0,0 +1,311 @@
+import random
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone as dt_timezone
+from itertools import accumulate, islice
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Count, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from graphql_auth.models import UserStatus
+
+from social_media import search
+from social_media.models import Profile, Post, Interaction, Bookmark, Follow
+
+
+User = get_user_model()
+
+WORDS = (
+    "today", "finally", "coffee", "morning", "weekend", "music", "travel", "football", "match", "launch",
+    "release", "python", "django", "graphql", "database", "postgres", "redis", "celery", "deploy", "bug",
+    "feature", "design", "startup", "meeting", "remote", "office", "city", "beach", "mountain", "summer",
+    "winter", "rain", "sunset", "dinner", "recipe", "pizza", "movie", "series", "book", "podcast",
+    "concert", "festival", "photo", "camera", "running", "gym", "training", "marathon", "game", "win",
+    "lost", "great", "amazing", "tired", "happy", "excited", "new", "old", "first", "last",
+    "friends", "family", "team", "community", "open", "source", "learning", "tutorial", "thread", "question",
+)
+FIRST_NAMES = (
+    "Ada", "Alan", "Amara", "Bola", "Chen", "Chidi", "Dana", "Elena", "Emeka", "Fatima", "Grace", "Hugo",
+    "Ines", "Ivan", "Jon", "Kemi", "Lars", "Lina", "Marco", "Mei", "Nia", "Omar", "Priya", "Rui",
+    "Sara", "Tariq", "Uche", "Vera", "Wei", "Yara", "Zoe",
+)
+LAST_NAMES = (
+    "Adeyemi", "Bianchi", "Costa", "Dubois", "Eze", "Fischer", "Garcia", "Hansen", "Ibrahim", "Jensen",
+    "Kim", "Lopez", "Martin", "Nakamura", "Okafor", "Petrov", "Quinn", "Rossi", "Silva", "Tanaka",
+    "Usman", "Vogel", "Wang", "Xu", "Yilmaz", "Zhang",
+)
+
+
+def batches(iterable, size):
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+
+def heavy_tailed(rng, mean, limit=None):
+    """
+    Random count with the given mean and a long tail (Pareto, shape 2): most draws are close to
+    the mean, a few are a hundred times bigger.
+    """
+    if mean <= 0:
+        return 0
+    # Pareto(2) has a mean of 2, the random part rounds up as often as needed to keep the mean
+    count = int(mean * rng.paretovariate(2) / 2 + rng.random())
+    return count if limit is None else min(count, limit)
+
+
+def subquery_count(queryset, column):
+    counts = queryset.order_by().values(column).annotate(total=Count("pk")).values("total")
+    return Coalesce(Subquery(counts, output_field=IntegerField()), 0)
+
+
+@contextmanager
+def explicit_timestamps(*models):
+    """
+    Let bulk_create store the created_at/updated_at set on the objects instead of the current time.
+    """
+    fields = [
+        field for model in models for field in model._meta.concrete_fields
+        if getattr(field, "auto_now", False) or getattr(field, "auto_now_add", False)
+    ]
+    saved = [(field, field.auto_now, field.auto_now_add) for field in fields]
+    for field in fields:
+        field.auto_now = field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field, auto_now, auto_now_add in saved:
+            field.auto_now, field.auto_now_add = auto_now, auto_now_add
+
+
+class Command(BaseCommand):
+    help = (
+        "Bulk-generate a production-like dataset: users with profiles, a power-law follow graph, posts with "
+        "comment trees, likes, shares and bookmarks spread over the last --days days. "
+        "Popular accounts (a Zipf distribution over the users) get most of the followers and engagement."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=1000)
+        parser.add_argument("--avg-follows", type=float, default=20, help="Accounts followed per user, on average.")
+        parser.add_argument("--avg-posts", type=float, default=5, help="Top level posts per user, on average.")
+        parser.add_argument("--avg-comments", type=float, default=2, help="Comments per top level post, on average.")
+        parser.add_argument("--avg-likes", type=float, default=20, help="Posts liked per user, on average.")
+        parser.add_argument("--avg-shares", type=float, default=2, help="Posts shared per user, on average.")
+        parser.add_argument("--avg-bookmarks", type=float, default=5, help="Posts bookmarked per user, on average.")
+        parser.add_argument("--max-depth", type=int, default=4, help="Deepest comment nesting level.")
+        parser.add_argument(
+            "--popularity-exponent", type=float, default=0.8,
+            help="Zipf exponent of the account popularity, higher means a few accounts get almost everything.",
+        )
+        parser.add_argument("--days", type=int, default=30, help="Time span of the generated activity.")
+        parser.add_argument("--batch-size", type=int, default=5000, help="Rows per INSERT.")
+        parser.add_argument("--prefix", default="seed", help="Usernames are <prefix>_<n>.")
+        parser.add_argument("--password", default="seed-password", help="Password of every generated user.")
+        parser.add_argument("--seed", type=int, default=None, help="Random seed, for a reproducible dataset.")
+        parser.add_argument(
+            "--precompute", action="store_true",
+            help="Compute the trending posts and the profile suggestions afterwards (needs redis).",
+        )
+
+    def handle(self, *args, **options):
+        self.users = options["users"]
+        self.batch_size = options["batch_size"]
+        self.prefix = options["prefix"] + "_"
+        if self.users < 2:
+            raise CommandError("--users must be at least 2.")
+        if self.batch_size < 1 or options["days"] < 1 or options["max_depth"] < 1:
+            raise CommandError("--batch-size, --days and --max-depth must be positive.")
+        averages = ("avg_follows", "avg_posts", "avg_comments", "avg_likes", "avg_shares", "avg_bookmarks")
+        if any(options[name] < 0 for name in averages):
+            raise CommandError("The --avg-* options can't be negative.")
+        if User.objects.filter(username__startswith=self.prefix).exists():
+            raise CommandError(f"Users named {self.prefix}* already exist, pick another --prefix.")
+
+        self.options = options
+        self.rng = random.Random(options["seed"])
+        self.now = timezone.now().timestamp()
+        self.start = self.now - options["days"] * 86400
+        # account i is the i-th most popular one
+        self.popularity = [1 / (rank + 1) ** options["popularity_exponent"] for rank in range(self.users)]
+        self.user_ids = []
+        # every post (comments included), for the likes, shares and bookmarks
+        self.post_ids, self.post_times, self.post_weights = [], [], []
+
+        started = time.perf_counter()
+        self.step("users", User, self.generate_users())
+        self.step("profiles", Profile, self.generate_profiles())
+        self.step("user statuses", UserStatus, self.generate_statuses())
+        with explicit_timestamps(Post, Follow, Interaction, Bookmark):
+            self.step("follows", Follow, self.generate_follows())
+            self.step("posts and comments", Post, self.generate_posts())
+            post_cum_weights = list(accumulate(self.post_weights))
+            self.step("interactions", Interaction, self.generate_interactions(post_cum_weights))
+            self.step("bookmarks", Bookmark, self.generate_bookmarks(post_cum_weights))
+
+        step_started = time.perf_counter()
+        self.recount()
+        self.stdout.write(f"{'counters':<20}{'':>12}{time.perf_counter() - step_started:>10.1f}s")
+
+        if options["precompute"]:
+            from social_media.tasks import compute_trending_posts, compute_profile_suggestions
+            self.stdout.write(compute_trending_posts())
+            self.stdout.write(compute_profile_suggestions())
+        self.stdout.write(self.style.SUCCESS(f"Seeded in {time.perf_counter() - started:.1f}s."))
+
+    def step(self, name, model, objects):
+        started = time.perf_counter()
+        total = 0
+        for batch in batches(objects, self.batch_size):
+            with transaction.atomic():
+                model.objects.bulk_create(batch)
+                # bulk_create doesn't send post_save, keep the SQLite search index in sync here
+                if model is Post:
+                    search.index_posts(batch, replace=False)
+                elif model is Profile:
+                    search.index_profiles(batch, replace=False)
+            total += len(batch)
+        elapsed = time.perf_counter() - started
+        self.stdout.write(f"{name:<20}{total:>12}{elapsed:>10.1f}s{total / max(elapsed, 1e-9):>12.0f} rows/s")
+
+    def random_time(self, after=None):
+        after = self.start if after is None else after
+        return after + self.rng.random() * (self.now - after)
+
+    @staticmethod
+    def as_datetime(timestamp):
+        return datetime.fromtimestamp(timestamp, tz=dt_timezone.utc)
+
+    def sentence(self, words=None):
+        return " ".join(self.rng.choices(WORDS, k=words or self.rng.randint(4, 20))).capitalize() + "."
+
+    def generate_users(self):
+        # hashing is deliberately slow, every user shares the same hash
+        password = make_password(self.options["password"])
+        for index in range(self.users):
+            username = f"{self.prefix}{index}"
+            user = User(username=username, email=f"{username}@example.com", password=password)
+            self.user_ids.append(user.id)
+            yield user
+
+    def generate_profiles(self):
+        for index, user_id in enumerate(self.user_ids):
+            # the search index needs the username, don't let it fetch the user
+            user = User(id=user_id, username=f"{self.prefix}{index}")
+            yield Profile(
+                user=user,
+                first_name=self.rng.choice(FIRST_NAMES),
+                last_name=self.rng.choice(LAST_NAMES),
+                bio=self.sentence(),
+            )
+
+    def generate_statuses(self):
+        for user_id in self.user_ids:
+            yield UserStatus(user_id=user_id, verified=True)
+
+    def generate_follows(self):
+        cum_weights = list(accumulate(self.popularity))
+        accounts = range(self.users)
+        for follower in accounts:
+            count = heavy_tailed(self.rng, self.options["avg_follows"], self.users - 1)
+            if not count:
+                continue
+            # popular accounts are drawn more than once, the duplicates are dropped
+            followed = set(self.rng.choices(accounts, cum_weights=cum_weights, k=count))
+            followed.discard(follower)
+            for account in followed:
+                yield Follow(
+                    user_id=self.user_ids[account],
+                    followed_by_id=self.user_ids[follower],
+                    created_at=self.as_datetime(self.random_time()),
+                )
+
+    def generate_posts(self):
+        """
+        Top level posts, each one followed by its comment tree (parents before their replies).
+        """
+        for author in range(self.users):
+            for _ in range(heavy_tailed(self.rng, self.options["avg_posts"])):
+                root = self.new_post(author, self.random_time())
+                yield root
+                # posts that can still be replied to
+                open_posts = [root]
+                for _ in range(heavy_tailed(self.rng, self.options["avg_comments"])):
+                    parent = self.rng.choice(open_posts)
+                    # most replies come soon after the post
+                    created = parent.created_at.timestamp()
+                    created += self.rng.random() ** 3 * (self.now - created)
+                    comment = self.new_post(self.rng.randrange(self.users), created, parent)
+                    if comment.depth < self.options["max_depth"]:
+                        open_posts.append(comment)
+                    yield comment
+
+    def new_post(self, author, created, parent=None):
+        created_at = self.as_datetime(created)
+        post = Post(
+            content=self.sentence(),
+            author_id=self.user_ids[author],
+            parent_post=parent,
+            is_published=True,
+            created_at=created_at,
+            updated_at=created_at,
+        )
+        post.place_in_thread(parent)
+        self.post_ids.append(post.id)
+        self.post_times.append(created)
+        self.post_weights.append(self.popularity[author])
+        return post
+
+    def pick_posts(self, cum_weights, mean):
+        """
+        Distinct posts to engage with, the posts of popular accounts first.
+        """
+        count = heavy_tailed(self.rng, mean, len(self.post_ids))
+        if not count:
+            return set()
+        return set(self.rng.choices(range(len(self.post_ids)), cum_weights=cum_weights, k=count))
+
+    def generate_interactions(self, cum_weights):
+        if not self.post_ids:
+            return
+        for user in range(self.users):
+            user_id = self.user_ids[user]
+            for type, mean in (("LIKE", self.options["avg_likes"]), ("SHARE", self.options["avg_shares"])):
+                for post in self.pick_posts(cum_weights, mean):
+                    yield Interaction(
+                        user_id=user_id,
+                        post_id=self.post_ids[post],
+                        type=type,
+                        created_at=self.as_datetime(self.random_time(self.post_times[post])),
+                    )
+
+    def generate_bookmarks(self, cum_weights):
+        if not self.post_ids:
+            return
+        for user in range(self.users):
+            for post in self.pick_posts(cum_weights, self.options["avg_bookmarks"]):
+                yield Bookmark(
+                    user_id=self.user_ids[user],
+                    post_id=self.post_ids[post],
+                    bookmarked_at=self.as_datetime(self.random_time(self.post_times[post])),
+                )
+
+    def recount(self):
+        """
+        Set the denormalized counters of the generated posts and profiles, one UPDATE per counter.
+        """
+        posts = Post.objects.filter(author__username__startswith=self.prefix)
+        for type, field in Post.INTERACTION_COUNTERS.items():
+            posts.update(**{field: subquery_count(Interaction.objects.filter(post=OuterRef("pk"), type=type), "post")})
+        posts.update(
+            comment_count=subquery_count(Post.objects.filter(parent_post=OuterRef("pk"), deleted=False), "parent_post"),
+            bookmark_count=subquery_count(Bookmark.objects.filter(post=OuterRef("pk")), "post"),
+        )
+        Profile.objects.filter(user__username__startswith=self.prefix).update(
+            follower_count=subquery_count(Follow.objects.filter(user=OuterRef("user")), "user"),
+            following_count=subquery_count(Follow.objects.filter(followed_by=OuterRef("user")), "followed_by"),
+        )
@@ -0,0 +1,436 @@
+"""
+Attachment processing, run by the process_post_media celery task once a post is created.
+
+CreatePost stores the attachments as the client describes them. The task reads every file (from the media
+storage when its url is under MEDIA_URL, over http(s) otherwise, at most MEDIA_MAX_BYTES), tells its MIME type
+from the first bytes instead of trusting the client, and fills metadata with what feed clients need to render
+a preview without downloading the file: dimensions, a few EXIF tags (never the GPS position), the duration of
+animations and videos, JPEG thumbnails (MEDIA_THUMBNAIL_SIZES, longest side) and a blurhash placeholder.
+
+Images larger than MEDIA_MAX_PIXELS are not decoded, JPEGs are decoded at the smallest scale the thumbnails
+allow. The task runs on the media queue, served by its own worker pool (see docker-compose.yml) whose
+processes are replaced once they grow past a memory limit.
+Videos are not decoded: MP4/QuickTime dimensions and duration are read from the container headers.
+"""
+
+import http.client
+import io
+import ipaddress
+import logging
+import math
+import socket
+import struct
+import urllib.request
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.http.request import validate_host
+from PIL import Image, ImageOps, ImageSequence, UnidentifiedImageError
+
+from .models import PostMedia
+
+logger = logging.getLogger(__name__)
+
+
+THUMBNAIL_DIR = "thumbnails"
+THUMBNAIL_QUALITY = 80
+
+# (offset, magic bytes, MIME type), checked in order
+SIGNATURES = (
+    (0, b"\xff\xd8\xff", "image/jpeg"),
+    (0, b"\x89PNG\r\n\x1a\n", "image/png"),
+    (0, b"GIF87a", "image/gif"),
+    (0, b"GIF89a", "image/gif"),
+    (8, b"WEBP", "image/webp"),
+    (0, b"\x1a\x45\xdf\xa3", "video/webm"),
+)
+# major brands of the ISO base media files (ftyp box) that are videos, HEIC/AVIF images share the format
+FTYP_BRANDS = {
+    b"qt  ": "video/quicktime",
+    b"isom": "video/mp4",
+    b"iso2": "video/mp4",
+    b"mp41": "video/mp4",
+    b"mp42": "video/mp4",
+    b"avc1": "video/mp4",
+    b"M4V ": "video/mp4",
+    b"dash": "video/mp4",
+}
+MEDIA_TYPES = {
+    "image/gif": "GIF",
+    "image/jpeg": "PHOTO",
+    "image/png": "PHOTO",
+    "image/webp": "PHOTO",
+    "video/mp4": "VIDEO",
+    "video/quicktime": "VIDEO",
+    "video/webm": "VIDEO",
+}
+
+# EXIF tags kept in metadata, by IFD (0 = the main one, 0x8769 = Exif)
+EXIF_TAGS = {
+    0: {0x010F: "make", 0x0110: "model", 0x0112: "orientation", 0x0132: "dateTime"},
+    0x8769: {
+        0x9003: "dateTimeOriginal",
+        0x829A: "exposureTime",
+        0x829D: "fNumber",
+        0x8827: "iso",
+        0x920A: "focalLength",
+    },
+}
+
+BASE83 = "0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz#$%*+,-.:;=?@[]^_{|}~"
+
+
+class MediaError(Exception):
+    pass
+
+
+def sniff_mime_type(data):
+    """
+    MIME type of a file from its first 16 bytes, None when it isn't one of the supported formats.
+    """
+    if data[4:8] == b"ftyp":
+        return FTYP_BRANDS.get(data[8:12])
+    for offset, magic, mime_type in SIGNATURES:
+        if data[offset:offset + len(magic)] == magic:
+            return mime_type
+    return None
+
+
+def storage_name(url):
+    """
+    Name of the file in the media storage when url points to it, None otherwise.
+    """
+    parts, media = urlsplit(url), urlsplit(settings.MEDIA_URL)
+    if media.netloc:
+        local = parts.netloc == media.netloc
+    else:
+        local = not parts.netloc or validate_host(parts.hostname or "", settings.ALLOWED_HOSTS)
+    if local and parts.path.startswith(media.path) and len(parts.path) > len(media.path):
+        return parts.path[len(media.path):]
+    return None
+
+
+def check_public_url(url):
+    """
+    Only fetch from http(s) urls, the host is checked when connecting (see connect_public).
+    """
+    parts = urlsplit(url)
+    if parts.scheme not in ("http", "https") or not parts.hostname:
+        raise MediaError("Unsupported media url.")
+
+
+def connect_public(address, timeout=socket._GLOBAL_DEFAULT_TIMEOUT, source_address=None):
+    """
+    socket.create_connection to public hosts only: the workers can reach internal services the clients can't.
+    The addresses checked are the ones connected to, resolving the name a second time would let it point
+    somewhere else in between (DNS rebinding).
+    """
+    host, port = address
+    try:
+        infos = socket.getaddrinfo(host, port, type=socket.SOCK_STREAM)
+    except OSError:
+        raise MediaError("Could not resolve the media host.")
+    if not all(ipaddress.ip_address(info[4][0].split("%")[0]).is_global for info in infos):
+        raise MediaError("Media host is not public.")
+    error = None
+    for *_, sockaddr in infos:
+        try:
+            return socket.create_connection(sockaddr[:2], timeout, source_address)
+        except OSError as e:
+            error = e
+    raise error
+
+
+class PublicHTTPConnection(http.client.HTTPConnection):
+    # Host header, SNI and certificate checks still use the host of the url
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._create_connection = connect_public
+
+
+class PublicHTTPSConnection(http.client.HTTPSConnection):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._create_connection = connect_public
+
+
+class PublicHTTPHandler(urllib.request.HTTPHandler):
+    def http_open(self, req):
+        return self.do_open(PublicHTTPConnection, req)
+
+
+class PublicHTTPSHandler(urllib.request.HTTPSHandler):
+    def https_open(self, req):
+        return self.do_open(PublicHTTPSConnection, req, context=self._context)
+
+
+class CheckedRedirectHandler(urllib.request.HTTPRedirectHandler):
+    def redirect_request(self, req, fp, code, msg, headers, newurl):
+        check_public_url(newurl)
+        return super().redirect_request(req, fp, code, msg, headers, newurl)
+
+
+def read_limited(file):
+    data = file.read(settings.MEDIA_MAX_BYTES + 1)
+    if len(data) > settings.MEDIA_MAX_BYTES:
+        raise MediaError("Media file is too large.")
+    return data
+
+
+def read_media(url):
+    """
+    Content of the attachment at url, at most MEDIA_MAX_BYTES.
+    """
+    name = storage_name(url)
+    if name is not None:
+        try:
+            with default_storage.open(name) as file:
+                return read_limited(file)
+        except FileNotFoundError:
+            raise MediaError("Media file not found.")
+
+    check_public_url(url)
+    # no proxies: the connections go straight to the checked addresses
+    opener = urllib.request.build_opener(
+        urllib.request.ProxyHandler({}), PublicHTTPHandler, PublicHTTPSHandler, CheckedRedirectHandler
+    )
+    try:
+        with opener.open(url, timeout=settings.MEDIA_FETCH_TIMEOUT) as response:
+            return read_limited(response)
+    except OSError as e:
+        raise MediaError(f"Could not fetch the media file ({e}).")
+
+
+def exif_metadata(image):
+    exif = image.getexif()
+    values = {}
+    for ifd, tags in EXIF_TAGS.items():
+        source = exif if ifd == 0 else exif.get_ifd(ifd)
+        for tag, name in tags.items():
+            value = source.get(tag)
+            if isinstance(value, bytes) or value is None:
+                continue
+            if isinstance(value, str):
+                values[name] = value.strip("\x00 ")
+            elif isinstance(value, tuple):
+                values[name] = [float(item) for item in value]
+            else:
+                # ints and IFDRational
+                values[name] = int(value) if float(value).is_integer() else float(value)
+    return values
+
+
+def image_metadata(media_id, data):
+    """
+    Dimensions, EXIF, animation, thumbnails and blurhash of an image.
+    """
+    try:
+        image = Image.open(io.BytesIO(data))
+    except (UnidentifiedImageError, OSError):
+        raise MediaError("Unreadable image.")
+    # only the header has been read so far
+    width, height = image.size
+    if width * height > settings.MEDIA_MAX_PIXELS:
+        raise MediaError("Image has too many pixels.")
+
+    metadata = {"width": width, "height": height}
+    exif = exif_metadata(image)
+    if exif:
+        metadata["exif"] = exif
+    if exif.get("orientation") in (5, 6, 7, 8):
+        # rotated a quarter turn when displayed
+        metadata["width"], metadata["height"] = height, width
+
+    frames = getattr(image, "n_frames", 1)
+    if frames > 1:
+        metadata["frames"] = frames
+        metadata["durationMs"] = sum(frame.info.get("duration", 0) for frame in ImageSequence.Iterator(image))
+        image.seek(0)
+
+    # JPEGs can be decoded at 1/2, 1/4 or 1/8 scale, as long as the largest thumbnail still fits
+    scale = max(settings.MEDIA_THUMBNAIL_SIZES, default=0) / max(width, height)
+    if scale < 1:
+        image.draft("RGB", (math.ceil(width * scale), math.ceil(height * scale)))
+    image = ImageOps.exif_transpose(image).convert("RGB")
+
+    metadata["thumbnails"] = save_thumbnails(media_id, image)
+    metadata["blurhash"] = blurhash(image)
+    return metadata
+
+
+def thumbnail_name(media_id, size):
+    return f"{THUMBNAIL_DIR}/{media_id}/{size}.jpg"
+
+
+def save_thumbnails(media_id, image):
+    thumbnails = []
+    sizes = sorted(settings.MEDIA_THUMBNAIL_SIZES, reverse=True)
+    # largest first, every thumbnail is resized from the previous one
+    for size in sizes:
+        if size >= max(image.size) and size != sizes[-1]:
+            # no upscaling, but there is always a smallest thumbnail
+            continue
+        if size < max(image.size):
+            image = image.copy()
+            image.thumbnail((size, size), Image.LANCZOS)
+        buffer = io.BytesIO()
+        image.save(buffer, "JPEG", quality=THUMBNAIL_QUALITY, optimize=True, progressive=True)
+        name = thumbnail_name(media_id, size)
+        # processed again: replace, don't get a name with a random suffix
+        default_storage.delete(name)
+        default_storage.save(name, ContentFile(buffer.getvalue()))
+        thumbnails.append({"url": default_storage.url(name), "width": image.width, "height": image.height})
+    return thumbnails[::-1]
+
+
+def delete_thumbnails(media_ids):
+    for media_id in media_ids:
+        for size in settings.MEDIA_THUMBNAIL_SIZES:
+            default_storage.delete(thumbnail_name(media_id, size))
+
+
+def iter_boxes(data, start=0, end=None):
+    """
+    (type, payload start, payload end) of the ISO base media file boxes (MP4, QuickTime) in data[start:end].
+    """
+    end = len(data) if end is None else end
+    while start + 8 <= end:
+        size, box_type = struct.unpack(">I4s", data[start:start + 8])
+        header = 8
+        if size == 1:
+            if start + 16 > end:
+                return
+            size = struct.unpack(">Q", data[start + 8:start + 16])[0]
+            header = 16
+        elif size == 0:
+            size = end - start
+        if size < header:
+            return
+        yield box_type, start + header, min(start + size, end)
+        start += size
+
+
+def video_metadata(data):
+    """
+    Dimensions and duration of an MP4/QuickTime video, from the moov box (read from the headers, not decoded).
+    """
+    metadata = {}
+    for box_type, start, end in iter_boxes(data):
+        if box_type != b"moov":
+            continue
+        for child, child_start, child_end in iter_boxes(data, start, end):
+            if child == b"mvhd":
+                version = data[child_start]
+                if version == 1:
+                    timescale, duration = struct.unpack(">IQ", data[child_start + 20:child_start + 32])
+                else:
+                    timescale, duration = struct.unpack(">II", data[child_start + 12:child_start + 20])
+                if timescale:
+                    metadata["durationMs"] = round(duration * 1000 / timescale)
+            elif child == b"trak" and "width" not in metadata:
+                for track_box, track_start, track_end in iter_boxes(data, child_start, child_end):
+                    if track_box == b"tkhd" and track_end - track_start >= 84:
+                        # 16.16 fixed point, the last fields of the box, 0 for audio tracks
+                        width, height = struct.unpack(">II", data[track_end - 8:track_end])
+                        if width and height:
+                            metadata["width"], metadata["height"] = width >> 16, height >> 16
+        break
+    return metadata
+
+
+def srgb_to_linear(value):
+    value /= 255
+    return value / 12.92 if value <= 0.04045 else ((value + 0.055) / 1.055) ** 2.4
+
+
+def linear_to_srgb(value):
+    value = min(max(value, 0), 1)
+    if value <= 0.0031308:
+        return int(value * 12.92 * 255 + 0.5)
+    return int((1.055 * value ** (1 / 2.4) - 0.055) * 255 + 0.5)
+
+
+def base83(value, length):
+    return "".join(BASE83[value // 83 ** (length - i) % 83] for i in range(1, length + 1))
+
+
+def blurhash(image, x_components=4, y_components=3):
+    """
+    Blurhash (https://blurha.sh) of an RGB image: a ~30 characters placeholder clients decode into a blurred preview.
+    """
+    image = image.copy()
+    image.thumbnail((32, 32))
+    width, height = image.size
+    pixels = [tuple(srgb_to_linear(channel) for channel in pixel) for pixel in image.getdata()]
+    cos_x = [[math.cos(math.pi * i * x / width) for x in range(width)] for i in range(x_components)]
+    cos_y = [[math.cos(math.pi * j * y / height) for y in range(height)] for j in range(y_components)]
+
+    factors = []
+    for j in range(y_components):
+        for i in range(x_components):
+            scale = (1 if i == j == 0 else 2) / (width * height)
+            r = g = b = 0.0
+            for y in range(height):
+                row = y * width
+                for x in range(width):
+                    basis = cos_x[i][x] * cos_y[j][y]
+                    pr, pg, pb = pixels[row + x]
+                    r += basis * pr
+                    g += basis * pg
+                    b += basis * pb
+            factors.append((r * scale, g * scale, b * scale))
+
+    dc, ac = factors[0], factors[1:]
+    result = base83((x_components - 1) + (y_components - 1) * 9, 1)
+    if ac:
+        quantised_max = max(0, min(82, int(max(abs(value) for factor in ac for value in factor) * 166 - 0.5)))
+        max_value = (quantised_max + 1) / 166
+        result += base83(quantised_max, 1)
+    else:
+        max_value = 1
+        result += base83(0, 1)
+    result += base83((linear_to_srgb(dc[0]) << 16) + (linear_to_srgb(dc[1]) << 8) + linear_to_srgb(dc[2]), 4)
+
+    def quantise(value):
+        value /= max_value
+        return max(0, min(18, int(math.copysign(abs(value) ** 0.5, value) * 9 + 9.5)))
+
+    for r, g, b in ac:
+        result += base83(quantise(r) * 19 * 19 + quantise(g) * 19 + quantise(b), 2)
+    return result
+
+
+def process_media(media):
+    """
+    Fill in mime_type, type and metadata of a PostMedia from its file. The metadata sent by the client is kept,
+    the extracted keys win. Failures are recorded in metadata (status "failed" and the error), not raised.
+    """
+    extracted = {}
+    mime_type = None
+    try:
+        data = read_media(media.media_url)
+        mime_type = sniff_mime_type(data[:16])
+        extracted["size"] = len(data)
+        if mime_type is None:
+            extracted["status"] = "unsupported"
+        else:
+            if mime_type.startswith("image/"):
+                extracted.update(image_metadata(media.id, data))
+            elif mime_type in ("video/mp4", "video/quicktime"):
+                extracted.update(video_metadata(data))
+            extracted["status"] = "processed"
+    except MediaError as e:
+        extracted.update(status="failed", error=str(e))
+    except Exception:
+        logger.exception("Could not process the attachment %s", media.id)
+        extracted.update(status="failed", error="Could not process the media file.")
+
+    metadata = {**(media.metadata if isinstance(media.metadata, dict) else {}), **extracted}
+    updates = {"metadata": metadata}
+    if mime_type is not None:
+        updates.update(mime_type=mime_type, type=MEDIA_TYPES[mime_type])
+    # only these columns: the row may have changed since it was read
+    PostMedia.objects.filter(pk=media.pk).update(**updates)
+    return metadata
@@ -0,0 +1,336 @@
+"""
+Per request GraphQL instrumentation: SQL query count and time, cache hits/misses and wall time,
+for the whole operation and per resolver path.
+
+CachedGraphQLView opens a RequestMetrics around every operation (collect_metrics) and MetricsMiddleware
+attributes the work done while a resolver runs to its path. List indexes are dropped from the paths, so
+allPosts.edges.node.media adds up the whole page. The DataLoader batches are dispatched after the resolvers
+returned, their queries only count towards the operation totals.
+
+Requests sending the X-GraphQL-Debug header get the numbers back in the response `extensions`
+(DEBUG or staff users only). Every operation is also added to counters kept in redis, so all the workers
+report together, and exported in the Prometheus text format by the /metrics endpoint.
+Operation names and resolver paths (aliases) come from the clients: only the first
+GRAPHQL_METRICS_MAX_OPERATIONS names and GRAPHQL_METRICS_MAX_PATHS paths seen get their own series,
+the other operations are counted as "other" (without paths).
+"""
+
+import logging
+import threading
+import time
+from contextlib import ExitStack, contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import connections
+from django_redis import get_redis_connection
+
+logger = logging.getLogger(__name__)
+
+
+DEBUG_HEADER = "HTTP_X_GRAPHQL_DEBUG"
+METRICS_KEY = "metrics:graphql"
+# label values with their own series
+OPERATIONS_KEY = "metrics:graphql:operations"
+PATHS_KEY = "metrics:graphql:paths"
+OTHER_OPERATION = "other"
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+# name: (type, help)
+METRIC_FAMILIES = {
+    "graphql_operations_total": ("counter", "GraphQL operations executed."),
+    "graphql_operation_errors_total": ("counter", "GraphQL operations that returned errors."),
+    "graphql_operation_duration_seconds": ("histogram", "Wall time of GraphQL operations."),
+    "graphql_sql_queries_total": ("counter", "SQL queries run by GraphQL operations."),
+    "graphql_sql_seconds_total": ("counter", "Time spent in SQL by GraphQL operations."),
+    "graphql_cache_hits_total": ("counter", "Cache hits of GraphQL operations."),
+    "graphql_cache_misses_total": ("counter", "Cache misses of GraphQL operations."),
+    "graphql_resolver_calls_total": ("counter", "Resolver calls, for the resolver paths that ran SQL."),
+    "graphql_resolver_sql_queries_total": ("counter", "SQL queries run per resolver path."),
+    "graphql_resolver_sql_seconds_total": ("counter", "Time spent in SQL per resolver path."),
+}
+
+_current = ContextVar("graphql_metrics", default=None)
+# Stats of the resolver being run, a context variable so the root fields run in parallel by the
+# async view (each in its own thread) don't mix up their paths
+_current_path = ContextVar("graphql_metrics_path", default=None)
+
+
+class Stats:
+    __slots__ = ("calls", "queries", "sql_time", "cache_hits", "cache_misses", "duration")
+
+    def __init__(self):
+        self.calls = 0
+        self.queries = 0
+        self.sql_time = 0.0
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.duration = 0.0
+
+    def as_dict(self):
+        return {
+            "calls": self.calls,
+            "queries": self.queries,
+            "sqlTimeMs": round(self.sql_time * 1000, 3),
+            "cacheHits": self.cache_hits,
+            "cacheMisses": self.cache_misses,
+            "durationMs": round(self.duration * 1000, 3),
+        }
+
+
+class RequestMetrics:
+    """
+    Counters of a single operation, `total` for the operation and `paths` per resolver path.
+    """
+
+    def __init__(self, operation=None):
+        self.operation = operation
+        self.operation_type = None
+        self.total = Stats()
+        self.paths = {}
+        self.has_errors = False
+        self.lock = threading.Lock()
+
+    def execute_wrapper(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - start
+            with self.lock:
+                for stats in self._targets():
+                    stats.queries += 1
+                    stats.sql_time += elapsed
+
+    def record_cache(self, hit):
+        with self.lock:
+            for stats in self._targets():
+                if hit:
+                    stats.cache_hits += 1
+                else:
+                    stats.cache_misses += 1
+
+    def _targets(self):
+        current = _current_path.get()
+        if current is None:
+            return (self.total,)
+        return (self.total, current)
+
+    @contextmanager
+    def resolving(self, path):
+        with self.lock:
+            stats = self.paths.get(path)
+            if stats is None:
+                stats = self.paths[path] = Stats()
+        token = _current_path.set(stats)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            with self.lock:
+                stats.calls += 1
+                stats.duration += elapsed
+            _current_path.reset(token)
+
+    def as_extensions(self):
+        return {
+            "operation": self.operation,
+            **self.total.as_dict(),
+            "resolvers": {path: stats.as_dict() for path, stats in self.paths.items()},
+        }
+
+
+def current_metrics():
+    return _current.get()
+
+
+def record_cache(hit):
+    """
+    Count a cache hit or miss towards the operation (and resolver) being executed, if any.
+    """
+    metrics = _current.get()
+    if metrics is not None:
+        metrics.record_cache(hit)
+
+
+@contextmanager
+def track_queries():
+    """
+    Count the SQL run by this thread towards the current metrics. Database connections are per thread,
+    code running the queries in other threads (sync_to_async) has to call it there too.
+    """
+    metrics = _current.get()
+    with ExitStack() as stack:
+        if metrics is not None:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(metrics.execute_wrapper))
+        yield
+
+
+@contextmanager
+def collect_metrics(operation=None):
+    """
+    Collect the metrics of the code run inside the block, SQL is counted on every database connection.
+    """
+    metrics = RequestMetrics(operation)
+    token = _current.set(metrics)
+    start = time.perf_counter()
+    try:
+        with track_queries():
+            yield metrics
+    finally:
+        metrics.total.calls = 1
+        metrics.total.duration = time.perf_counter() - start
+        _current.reset(token)
+
+
+class MetricsMiddleware:
+    """
+    Graphene middleware attributing SQL, cache accesses and wall time to the resolver paths.
+    Does nothing outside of collect_metrics.
+    """
+
+    def resolve(self, next, root, info, **kwargs):
+        metrics = _current.get()
+        if metrics is None:
+            return next(root, info, **kwargs)
+        if metrics.operation_type is None:
+            metrics.operation_type = info.operation.operation
+            if metrics.operation is None and info.operation.name is not None:
+                metrics.operation = info.operation.name.value
+        path = ".".join(key for key in info.path if not isinstance(key, int))
+        with metrics.resolving(path):
+            return next(root, info, **kwargs)
+
+
+# ======================================================================================================================
+# Aggregation, exported in the Prometheus text format
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _sample(name, **labels):
+    if not labels:
+        return name
+    return "{}{{{}}}".format(name, ",".join('{}="{}"'.format(key, _escape(value)) for key, value in labels.items()))
+
+
+# (key, value) admitted into the label sets by this process, they never leave them
+_admitted = set()
+
+
+def _admit(redis, key, values, limit):
+    """
+    Return the values allowed as label values: the ones already in the set at key,
+    and new ones while the set holds fewer than limit (approximately, concurrent requests can overshoot a bit).
+    """
+    pending = [value for value in values if (key, value) not in _admitted]
+    if pending:
+        pipe = redis.pipeline(transaction=False)
+        for value in pending:
+            pipe.sismember(key, value)
+        pipe.scard(key)
+        *members, size = pipe.execute()
+        new = []
+        for value, member in zip(pending, members):
+            if member:
+                _admitted.add((key, value))
+            elif size < limit:
+                new.append(value)
+                size += 1
+        if new:
+            redis.sadd(key, *new)
+            _admitted.update((key, value) for value in new)
+    return {value for value in values if (key, value) in _admitted}
+
+
+def record_operation(metrics):
+    """
+    Add a finished operation to the aggregated counters. Only resolver paths that ran SQL are kept,
+    the others would multiply the number of series without telling anything about the database load.
+    """
+    try:
+        redis = get_redis_connection("default")
+        operation = metrics.operation or "anonymous"
+        if operation != "anonymous" and not _admit(
+            redis, OPERATIONS_KEY, [operation], settings.GRAPHQL_METRICS_MAX_OPERATIONS
+        ):
+            operation = OTHER_OPERATION
+        paths = {}
+        if operation != OTHER_OPERATION:
+            paths = {path: stats for path, stats in metrics.paths.items() if stats.queries}
+            admitted = _admit(
+                redis, PATHS_KEY, ["{}:{}".format(operation, path) for path in paths], settings.GRAPHQL_METRICS_MAX_PATHS
+            )
+            paths = {path: stats for path, stats in paths.items() if "{}:{}".format(operation, path) in admitted}
+
+        labels = {"operation": operation, "type": metrics.operation_type or "query"}
+        total = metrics.total
+        increments = {
+            _sample("graphql_operations_total", **labels): 1,
+            _sample("graphql_sql_queries_total", **labels): total.queries,
+            _sample("graphql_sql_seconds_total", **labels): total.sql_time,
+            _sample("graphql_cache_hits_total", **labels): total.cache_hits,
+            _sample("graphql_cache_misses_total", **labels): total.cache_misses,
+            _sample("graphql_operation_duration_seconds_sum", **labels): total.duration,
+            _sample("graphql_operation_duration_seconds_count", **labels): 1,
+            _sample("graphql_operation_duration_seconds_bucket", **labels, le="+Inf"): 1,
+        }
+        if metrics.has_errors:
+            increments[_sample("graphql_operation_errors_total", **labels)] = 1
+        for bucket in DURATION_BUCKETS:
+            increments[_sample("graphql_operation_duration_seconds_bucket", **labels, le=bucket)] = int(total.duration <= bucket)
+        for path, stats in paths.items():
+            path_labels = {"operation": operation, "path": path}
+            increments[_sample("graphql_resolver_calls_total", **path_labels)] = stats.calls
+            increments[_sample("graphql_resolver_sql_queries_total", **path_labels)] = stats.queries
+            increments[_sample("graphql_resolver_sql_seconds_total", **path_labels)] = stats.sql_time
+
+        pipe = redis.pipeline(transaction=False)
+        for sample, amount in increments.items():
+            # zeros too, every bucket of a histogram has to exist
+            pipe.hincrbyfloat(METRICS_KEY, sample, amount)
+        pipe.execute()
+    except Exception:
+        # metrics must never fail a request
+        logger.warning("Could not record GraphQL metrics", exc_info=True)
+
+
+def _family(sample_name):
+    if sample_name in METRIC_FAMILIES:
+        return sample_name
+    for suffix in ("_bucket", "_sum", "_count"):
+        if sample_name.endswith(suffix) and sample_name[:-len(suffix)] in METRIC_FAMILIES:
+            return sample_name[:-len(suffix)]
+    return None
+
+
+def _sort_key(sample):
+    # histogram buckets in increasing order, +Inf last
+    name, _, le = sample[0].partition(',le="')
+    return name, float(le.rstrip('"}').replace("+Inf", "inf")) if le else 0.0
+
+
+def export_metrics():
+    """
+    Return the aggregated counters in the Prometheus text exposition format.
+    """
+    samples = {}
+    for sample, value in get_redis_connection("default").hgetall(METRICS_KEY).items():
+        sample = sample.decode()
+        family = _family(sample.split("{", 1)[0])
+        if family is not None:
+            samples.setdefault(family, []).append((sample, float(value)))
+
+    lines = []
+    for family, (metric_type, help_text) in METRIC_FAMILIES.items():
+        if family not in samples:
+            continue
+        lines.append("# HELP {} {}".format(family, help_text))
+        lines.append("# TYPE {} {}".format(family, metric_type))
+        for sample, value in sorted(samples[family], key=_sort_key):
+            lines.append("{} {}".format(sample, int(value) if value.is_integer() else repr(value)))
+    return "\n".join(lines) + "\n"
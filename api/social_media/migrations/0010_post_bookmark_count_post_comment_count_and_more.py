@@ -0,0 +1,53 @@
+# Generated by Django 5.2.8 on 2026-10-17 04:23
+
+from django.db import migrations, models
+from django.db.models import Count, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def backfill_counters(apps, schema_editor):
+    Post = apps.get_model('social_media', 'Post')
+    Interaction = apps.get_model('social_media', 'Interaction')
+    Bookmark = apps.get_model('social_media', 'Bookmark')
+
+    def count_of(queryset, field):
+        subquery = queryset.values(field).annotate(total=Count('id')).values('total')
+        return Coalesce(Subquery(subquery, output_field=IntegerField()), 0)
+
+    Post.objects.update(
+        like_count=count_of(Interaction.objects.filter(post=OuterRef('pk'), type='LIKE'), 'post'),
+        share_count=count_of(Interaction.objects.filter(post=OuterRef('pk'), type='SHARE'), 'post'),
+        bookmark_count=count_of(Bookmark.objects.filter(post=OuterRef('pk')), 'post'),
+        comment_count=count_of(Post.objects.filter(parent_post=OuterRef('pk'), deleted=False), 'parent_post'),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('social_media', '0009_alter_bookmark_post'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='bookmark_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='comment_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='like_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='share_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 5.2.8 on 2026-10-17 04:29
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('social_media', '0010_post_bookmark_count_post_comment_count_and_more'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='interaction',
+            index=models.Index(fields=['post', 'type'], name='idx_interaction_post_type'),
+        ),
+        migrations.AddIndex(
+            model_name='interaction',
+            index=models.Index(fields=['user', 'post', 'type'], name='idx_interaction_user_post_type'),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(condition=models.Q(('deleted', False), ('parent_post', None)), fields=['-created_at', '-id'], name='idx_post_live_created'),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['author', '-created_at'], name='idx_post_author_created'),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(condition=models.Q(('deleted', True)), fields=['author', '-created_at'], name='idx_post_author_deleted'),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(condition=models.Q(('deleted', True)), fields=['updated_at'], name='idx_post_deleted_updated'),
+        ),
+    ]
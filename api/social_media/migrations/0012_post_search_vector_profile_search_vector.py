@@ -0,0 +1,89 @@
+# Generated by Django 5.2.8 on 2026-10-17 04:32
+
+import django.contrib.postgres.search
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations
+
+
+POSTGRES_FORWARDS = [
+    # posts: english stemming on the content
+    # (OF <columns>: the counter updates on the hot write path don't rebuild the vector)
+    """
+    CREATE TRIGGER social_media_post_search_vector_update
+    BEFORE INSERT OR UPDATE OF content ON social_media_post
+    FOR EACH ROW EXECUTE FUNCTION tsvector_update_trigger(search_vector, 'pg_catalog.english', content)
+    """,
+    "UPDATE social_media_post SET search_vector = to_tsvector('pg_catalog.english', content)",
+    "CREATE INDEX idx_post_search_vector ON social_media_post USING gin (search_vector)",
+    # profiles: names aren't english words, no stemming
+    """
+    CREATE TRIGGER social_media_profile_search_vector_update
+    BEFORE INSERT OR UPDATE OF first_name, last_name ON social_media_profile
+    FOR EACH ROW EXECUTE FUNCTION tsvector_update_trigger(search_vector, 'pg_catalog.simple', first_name, last_name)
+    """,
+    "UPDATE social_media_profile SET search_vector = to_tsvector('pg_catalog.simple', coalesce(first_name, '') || ' ' || coalesce(last_name, ''))",
+    "CREATE INDEX idx_profile_search_vector ON social_media_profile USING gin (search_vector)",
+    # fuzzy username lookups
+    "CREATE INDEX idx_user_username_trgm ON user_management_user USING gin (username gin_trgm_ops)",
+]
+
+POSTGRES_BACKWARDS = [
+    "DROP INDEX IF EXISTS idx_user_username_trgm",
+    "DROP INDEX IF EXISTS idx_profile_search_vector",
+    "DROP TRIGGER IF EXISTS social_media_profile_search_vector_update ON social_media_profile",
+    "DROP INDEX IF EXISTS idx_post_search_vector",
+    "DROP TRIGGER IF EXISTS social_media_post_search_vector_update ON social_media_post",
+]
+
+# SQLite (dev): standalone FTS5 tables kept in sync by social_media/signals.py
+SQLITE_FORWARDS = [
+    "CREATE VIRTUAL TABLE social_media_post_fts USING fts5(post_id UNINDEXED, content)",
+    "INSERT INTO social_media_post_fts (post_id, content) SELECT id, content FROM social_media_post",
+    "CREATE VIRTUAL TABLE social_media_profile_fts USING fts5(profile_id UNINDEXED, first_name, last_name, username)",
+    """
+    INSERT INTO social_media_profile_fts (profile_id, first_name, last_name, username)
+    SELECT p.id, coalesce(p.first_name, ''), coalesce(p.last_name, ''), u.username
+    FROM social_media_profile p JOIN user_management_user u ON u.id = p.user_id
+    """,
+]
+
+SQLITE_BACKWARDS = [
+    "DROP TABLE IF EXISTS social_media_profile_fts",
+    "DROP TABLE IF EXISTS social_media_post_fts",
+]
+
+
+def run_statements(forwards):
+    def run(apps, schema_editor):
+        vendor = schema_editor.connection.vendor
+        if vendor == 'postgresql':
+            statements = POSTGRES_FORWARDS if forwards else POSTGRES_BACKWARDS
+        elif vendor == 'sqlite':
+            statements = SQLITE_FORWARDS if forwards else SQLITE_BACKWARDS
+        else:
+            return
+        for statement in statements:
+            schema_editor.execute(statement)
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('social_media', '0011_interaction_idx_interaction_post_type_and_more'),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        migrations.AddField(
+            model_name='post',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='profile',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.RunPython(run_statements(forwards=True), run_statements(forwards=False)),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 5.2.8 on 2026-10-17 05:10
+
+from django.db import migrations, models
+from django.db.models import Count, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def remove_duplicate_likes(apps, schema_editor):
+    """
+    Keep the first like of every (user, post) pair and recount the likes of the affected posts,
+    the unique constraint can't be added while duplicates exist.
+    """
+    Post = apps.get_model('social_media', 'Post')
+    Interaction = apps.get_model('social_media', 'Interaction')
+
+    likes = Interaction.objects.filter(type='LIKE')
+    duplicated = likes.values('user', 'post').annotate(total=Count('id')).filter(total__gt=1)
+    post_ids = set()
+    for pair in duplicated:
+        ids = list(
+            likes.filter(user=pair['user'], post=pair['post']).order_by('created_at', 'id').values_list('id', flat=True)
+        )
+        Interaction.objects.filter(id__in=ids[1:]).delete()
+        post_ids.add(pair['post'])
+
+    if post_ids:
+        like_count = likes.filter(post=OuterRef('pk')).values('post').annotate(total=Count('id')).values('total')
+        Post.objects.filter(pk__in=post_ids).update(
+            like_count=Coalesce(Subquery(like_count, output_field=IntegerField()), 0)
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('social_media', '0012_post_search_vector_profile_search_vector'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicate_likes, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='interaction',
+            constraint=models.UniqueConstraint(condition=models.Q(('type', 'LIKE')), fields=('user', 'post'), name='unique_like'),
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 5.2.8 on 2026-10-17 05:40
+
+from django.db import migrations, models
+from django.db.models import Count, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def backfill_follow_counters(apps, schema_editor):
+    Profile = apps.get_model('social_media', 'Profile')
+    Follow = apps.get_model('social_media', 'Follow')
+
+    def count_of(field):
+        subquery = Follow.objects.filter(**{field: OuterRef('user_id')}).values(field).annotate(total=Count('id')).values('total')
+        return Coalesce(Subquery(subquery, output_field=IntegerField()), 0)
+
+    Profile.objects.update(follower_count=count_of('user'), following_count=count_of('followed_by'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('social_media', '0013_interaction_unique_like'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='profile',
+            name='follower_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='profile',
+            name='following_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_follow_counters, migrations.RunPython.noop),
+    ]
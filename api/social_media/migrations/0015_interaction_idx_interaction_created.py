@@ -0,0 +1,19 @@
+# Generated by Django 5.2.8 on 2026-10-17 04:50
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('social_media', '0014_profile_follower_count_profile_following_count'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='interaction',
+            index=models.Index(fields=['created_at'], name='idx_interaction_created'),
+        ),
+    ]
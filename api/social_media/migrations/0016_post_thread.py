@@ -0,0 +1,82 @@
+# Generated by Django 5.2.8 on 2026-10-17 04:52
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+BATCH_SIZE = 1000
+
+
+def backfill_thread_positions(apps, schema_editor):
+    """
+    Place the top level posts, then the comments one nesting level per pass
+    (the comments whose parent was placed by the previous passes).
+    """
+    Post = apps.get_model('social_media', 'Post')
+
+    def walk(queryset, place):
+        # primary key batches, returns the number of posts placed
+        placed, last_id = 0, None
+        while True:
+            batch = queryset.order_by('id')
+            if last_id is not None:
+                batch = batch.filter(id__gt=last_id)
+            batch = list(batch[:BATCH_SIZE])
+            if not batch:
+                return placed
+            last_id = batch[-1].id
+            for post in batch:
+                place(post)
+            Post.objects.bulk_update(batch, ['root_post', 'depth', 'path'])
+            placed += len(batch)
+
+    def place_top_level(post):
+        post.root_post_id, post.depth, post.path = None, 0, post.id.hex
+
+    def place_comment(post):
+        parent = post.parent_post
+        post.root_post_id = parent.root_post_id or parent.id
+        post.depth = parent.depth + 1
+        post.path = '{}/{}'.format(parent.path, post.id.hex)
+
+    walk(Post.objects.filter(parent_post=None).only('id'), place_top_level)
+    comments = (
+        Post.objects.filter(path='', parent_post__isnull=False)
+        .exclude(parent_post__path='')
+        .select_related('parent_post')
+        .only('id', 'parent_post', 'parent_post__root_post', 'parent_post__depth', 'parent_post__path')
+    )
+    while walk(comments, place_comment):
+        pass
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('social_media', '0015_interaction_idx_interaction_created'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='depth',
+            field=models.PositiveSmallIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='path',
+            field=models.TextField(blank=True, default='', editable=False),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='root_post',
+            field=models.ForeignKey(blank=True, db_index=False, editable=False, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='thread_posts', to='social_media.post'),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['root_post', 'depth', 'created_at'], name='idx_post_thread'),
+        ),
+        migrations.RunPython(backfill_thread_positions, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 5.2.8 on 2026-10-17 04:55
+
+import social_media.ids
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('social_media', '0016_post_thread'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='bookmark',
+            name='id',
+            field=models.UUIDField(default=social_media.ids.uuid7, primary_key=True, serialize=False),
+        ),
+        migrations.AlterField(
+            model_name='follow',
+            name='id',
+            field=models.UUIDField(default=social_media.ids.uuid7, primary_key=True, serialize=False),
+        ),
+        migrations.AlterField(
+            model_name='interaction',
+            name='id',
+            field=models.UUIDField(default=social_media.ids.uuid7, primary_key=True, serialize=False),
+        ),
+        migrations.AlterField(
+            model_name='post',
+            name='id',
+            field=models.UUIDField(default=social_media.ids.uuid7, primary_key=True, serialize=False),
+        ),
+        migrations.AlterField(
+            model_name='postmedia',
+            name='id',
+            field=models.UUIDField(default=social_media.ids.uuid7, primary_key=True, serialize=False),
+        ),
+        migrations.AlterField(
+            model_name='profile',
+            name='id',
+            field=models.UUIDField(default=social_media.ids.uuid7, primary_key=True, serialize=False),
+        ),
+    ]
@@ -1,20 +1,30 @@
-from django.db import models
-from django.db.models import Q, F
-import uuid
+from django.db import connection, models
+from django.db.models import Q, F, Case, When, Value
+from django.db.models.functions import Greatest
+from django.contrib.postgres.search import SearchVectorField
+from django.utils import timezone
 from django.contrib.auth import get_user_model
+from .ids import uuid7
 # Create your models here.
 
 User = get_user_model()
 
 
 class Profile(models.Model):
-    id = models.UUIDField(primary_key=True, default=uuid.uuid4)
+    id = models.UUIDField(primary_key=True, default=uuid7)
     first_name = models.CharField(max_length=64, null=True, blank=True)
     last_name = models.CharField(max_length=64, null=True, blank=True)
     profile_photo = models.URLField(null=True, blank=True)
     bio = models.TextField(null=True, blank=True)
     preferences = models.JSONField(default=dict, null=True, blank=True)
     user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='profile')
+    # first/last name tsvector, maintained by a trigger on PostgreSQL (see search.py)
+    search_vector = SearchVectorField(null=True, editable=False)
+
+    # denormalized follow counters, kept in sync by the follow mutations (see bump_follow_counts)
+    # and periodically corrected by the reconcile_follow_counters celery task
+    follower_count = models.PositiveIntegerField(default=0)
+    following_count = models.PositiveIntegerField(default=0)
 
     class Meta:
         indexes = [
@@ -23,6 +33,19 @@ class Profile(models.Model):
         ]
     def __str__(self):
         return f'{self.first_name} {self.last_name}'
+
+    @classmethod
+    def bump_follow_counts(cls, follower_id, user_ids, amount=1):
+        """
+        Count follower_id following (amount=1) or unfollowing (amount=-1) every user of user_ids,
+        with one UPDATE per side. Counters never go below zero.
+        """
+        if not user_ids:
+            return
+        cls.objects.filter(user_id__in=list(user_ids)).update(follower_count=Greatest(F("follower_count") + amount, 0))
+        cls.objects.filter(user_id=follower_id).update(
+            following_count=Greatest(F("following_count") + amount * len(user_ids), 0)
+        )
     
     def get_mutual_followers(self):
         # return User.objects.filter(
@@ -46,7 +69,7 @@ class Profile(models.Model):
 
 
 class Post(models.Model):
-    id = models.UUIDField(primary_key=True, default=uuid.uuid4)
+    id = models.UUIDField(primary_key=True, default=uuid7)
     content = models.TextField()
     author = models.ForeignKey(User, on_delete=models.CASCADE, related_name="posts")
     parent_post = models.ForeignKey("self", on_delete=models.CASCADE, related_name="comments", null=True, blank=True, default=None)
@@ -56,11 +79,95 @@ class Post(models.Model):
     edited = models.BooleanField(default=False)
     deleted = models.BooleanField(default=False) # soft delete flag
 
+    # denormalized engagement counters, kept in sync by the mutations with F() expressions
+    # and periodically corrected by the reconcile_post_counters celery task
+    like_count = models.PositiveIntegerField(default=0)
+    share_count = models.PositiveIntegerField(default=0)
+    comment_count = models.PositiveIntegerField(default=0)
+    bookmark_count = models.PositiveIntegerField(default=0)
+
+    # content tsvector, maintained by a trigger on PostgreSQL (see search.py)
+    search_vector = SearchVectorField(null=True, editable=False)
+
+    # position in the conversation (see place_in_thread and threads.py): the top level post the comment
+    # belongs to (None for top level posts), the nesting level and the hex ids from the top level post
+    # down to this one, separated by "/"
+    root_post = models.ForeignKey("self", on_delete=models.CASCADE, related_name="thread_posts", null=True, blank=True, editable=False, db_index=False)
+    depth = models.PositiveSmallIntegerField(default=0, editable=False)
+    path = models.TextField(blank=True, default="", editable=False)
+
+    # interaction type -> counter column
+    INTERACTION_COUNTERS = {
+        "LIKE": "like_count",
+        "SHARE": "share_count",
+    }
+
+    class Meta:
+        indexes = [
+            # allPosts / homeFeed: live top level posts, newest first (keyset pagination on created_at, id)
+            models.Index(
+                fields=["-created_at", "-id"],
+                condition=Q(deleted=False, parent_post=None),
+                name="idx_post_live_created",
+            ),
+            # per author timelines (feed fan-out / rebuild, author filters)
+            models.Index(fields=["author", "-created_at"], name="idx_post_author_created"),
+            # allDeletedPosts: a user's trash
+            models.Index(
+                fields=["author", "-created_at"],
+                condition=Q(deleted=True),
+                name="idx_post_author_deleted",
+            ),
+            # clean_soft_deleted_posts: deleted=True, updated_at < threshold
+            models.Index(
+                fields=["updated_at"],
+                condition=Q(deleted=True),
+                name="idx_post_deleted_updated",
+            ),
+            # thread: the comments of a conversation level by level, oldest first
+            models.Index(fields=["root_post", "depth", "created_at"], name="idx_post_thread"),
+        ]
+
+    def place_in_thread(self, parent=None):
+        """
+        Set root_post, depth and path from the parent post (None for a top level post).
+        """
+        if parent is None:
+            self.root_post_id, self.depth, self.path = None, 0, self.id.hex
+        else:
+            self.root_post_id = parent.root_post_id or parent.id
+            self.depth = parent.depth + 1
+            self.path = "{}/{}".format(parent.path, self.id.hex)
+
+    def save(self, *args, **kwargs):
+        # bulk_create doesn't call save, callers use place_in_thread themselves
+        if not self.path:
+            self.place_in_thread(self.parent_post)
+        super().save(*args, **kwargs)
+
     def likes(self):
-        return self.engagements.filter(type="LIKE").count()
+        return self.like_count
     
     def bookmarks(self):
-        return self.post_bookmarks.count()
+        return self.bookmark_count
+
+    @classmethod
+    def bump_counter(cls, post_id, field, amount=1):
+        """
+        Atomically add amount (can be negative) to a counter column without reading the row first.
+        Counters never go below zero.
+        """
+        cls.objects.filter(pk=post_id).update(**{field: Greatest(F(field) + amount, 0)})
+
+    @classmethod
+    def bump_counters(cls, field, amounts):
+        """
+        bump_counter for many posts with a single UPDATE, amounts: {post_id: amount}.
+        """
+        if not amounts:
+            return
+        delta = Case(*[When(pk=post_id, then=Value(amount)) for post_id, amount in amounts.items()], default=Value(0))
+        cls.objects.filter(pk__in=list(amounts)).update(**{field: Greatest(F(field) + delta, 0)})
 
 
 class PostMedia(models.Model):
@@ -69,7 +176,7 @@ class PostMedia(models.Model):
             ("VIDEO", "Video"),
             ("GIF", "Gif")
         )
-    id = models.UUIDField(primary_key=True, default=uuid.uuid4)
+    id = models.UUIDField(primary_key=True, default=uuid7)
     post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name="attachments")
     media_url = models.URLField()
     type = models.CharField(max_length=10, choices=media_types, default="PHOTO")
@@ -88,7 +195,7 @@ class Interaction(models.Model):
         ("SHARE", "Share"),
         ("COMMENT", "Comment")
     )
-    id = models.UUIDField(primary_key=True, default=uuid.uuid4)
+    id = models.UUIDField(primary_key=True, default=uuid7)
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="interactions")
     post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name="engagements")
     type = models.CharField(max_length=10, choices=interaction_type, default="LIKE")
@@ -97,21 +204,75 @@ class Interaction(models.Model):
     class Meta:
         constraints = [
             models.CheckConstraint(check=Q(type__in=['LIKE','SHARE','COMMENT']), name='valid_interaction_type'),
+            # a user likes a post at most once, enforced by the database (see Interaction.like)
+            models.UniqueConstraint(fields=['user', 'post'], condition=Q(type='LIKE'), name='unique_like'),
+        ]
+        indexes = [
+            # per post engagement lookups and counts by type
+            models.Index(fields=['post', 'type'], name='idx_interaction_post_type'),
+            # "has this user liked/shared this post" checks
+            models.Index(fields=['user', 'post', 'type'], name='idx_interaction_user_post_type'),
+            # recent interactions scanned by compute_trending_posts
+            models.Index(fields=['created_at'], name='idx_interaction_created'),
         ]
-    
-    def save(self, *args, **kwargs):
-        # Additional logic can be added here
-        if self.type == "LIKE":
-            # prevent duplicate likes by the same user on the same post
-            if Interaction.objects.filter(user=self.user, post=self.post, type="LIKE").exists():
-                raise ValueError("User has already liked this post.")
-            
 
-        super().save(*args, **kwargs)
+    @classmethod
+    def like(cls, user, post_id):
+        """
+        Idempotently like a live post: INSERT ... ON CONFLICT DO NOTHING on the unique_like constraint,
+        the like_count of the post is only bumped when the row was actually inserted.
+        On PostgreSQL the insert and the counter update are a single statement (one round trip).
+
+        Returns (interaction, created), interaction is None when the post doesn't exist.
+        """
+        interaction = cls(id=uuid7(), user=user, post_id=post_id, type="LIKE", created_at=timezone.now())
+        qn = connection.ops.quote_name
+        column = lambda model, name: qn(model._meta.get_field(name).column)
+        prep = lambda model, name, value: model._meta.get_field(name).get_db_prep_value(value, connection)
+
+        insert = (
+            "INSERT INTO {interaction} ({id}, {user}, {post}, {type}, {created_at}) "
+            "SELECT %s, %s, {post_id}, 'LIKE', %s FROM {post_table} WHERE {post_id} = %s AND NOT {deleted} "
+            "ON CONFLICT ({user}, {post}) WHERE {type} = 'LIKE' DO NOTHING"
+        )
+        names = {
+            "interaction": qn(cls._meta.db_table),
+            "post_table": qn(Post._meta.db_table),
+            "post_id": column(Post, "id"),
+            "deleted": column(Post, "deleted"),
+            "counter": column(Post, Post.INTERACTION_COUNTERS["LIKE"]),
+            **{name: column(cls, name) for name in ("id", "user", "post", "type", "created_at")},
+        }
+        params = [
+            prep(cls, "id", interaction.id),
+            prep(cls, "user", user.pk),
+            prep(cls, "created_at", interaction.created_at),
+            prep(Post, "id", post_id),
+        ]
+
+        with connection.cursor() as cursor:
+            if connection.vendor == "postgresql":
+                cursor.execute((
+                    "WITH inserted AS (" + insert + " RETURNING {post}) "
+                    "UPDATE {post_table} SET {counter} = {counter} + 1 WHERE {post_id} IN (SELECT {post} FROM inserted)"
+                ).format(**names), params)
+                created = cursor.rowcount == 1
+            else:
+                cursor.execute(insert.format(**names), params)
+                created = cursor.rowcount == 1
+                if created:
+                    Post.bump_counter(post_id, Post.INTERACTION_COUNTERS["LIKE"])
+
+        if created:
+            interaction._state.adding = False
+            interaction._state.db = connection.alias
+            return interaction, True
+        # already liked (or no such post), only then a second query
+        return cls.objects.filter(user=user, post_id=post_id, type="LIKE").first(), False
 
 
 class Bookmark(models.Model):
-    id = models.UUIDField(primary_key=True, default=uuid.uuid4)
+    id = models.UUIDField(primary_key=True, default=uuid7)
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="bookmarks")
     post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name="post_bookmarks")
     bookmarked_at = models.DateTimeField(auto_now_add=True)
@@ -126,7 +287,7 @@ class Bookmark(models.Model):
 
 
 class Follow(models.Model):
-    id = models.UUIDField(primary_key=True, default=uuid.uuid4)
+    id = models.UUIDField(primary_key=True, default=uuid7)
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="followers")
     followed_by = models.ForeignKey(User, on_delete=models.CASCADE, related_name="following")
     created_at = models.DateTimeField(auto_now_add=True)
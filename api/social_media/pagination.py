@@ -0,0 +1,210 @@
+"""
+Keyset (cursor) pagination for the list connections.
+
+The default DjangoConnectionField paginates with OFFSET and runs a COUNT(*) on every request,
+so deep pages get slower the deeper they are. KeysetConnectionField orders the list by
+(ordering_field, id) and encodes the last seen pair in an opaque cursor, the next page is then
+a plain indexed range scan (WHERE (created_at, id) < cursor ORDER BY created_at DESC, id DESC LIMIT n)
+and costs the same whatever the page number.
+The total count is only computed when totalCount is actually selected.
+"""
+
+import base64
+import json
+import uuid
+from functools import partial
+
+import graphene
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from graphene.relay import PageInfo
+from graphene_django.filter import DjangoFilterConnectionField
+from graphene_django.utils import maybe_queryset
+from graphql import GraphQLError
+from promise import Promise
+
+
+CURSOR_PREFIX = "keyset:"
+
+
+class CountableConnection(graphene.relay.Connection):
+    """
+    Connection exposing an optional totalCount, the COUNT query only runs when the field is requested.
+    """
+    total_count = graphene.Int()
+
+    class Meta:
+        abstract = True
+
+    def resolve_total_count(self, info):
+        # the offset based pagination already counted the rows
+        length = getattr(self, "length", None)
+        if length is not None:
+            return length
+        return self.iterable.count()
+
+
+def encode_cursor(value, id):
+    # datetimes as iso strings, numbers (search ranks) as they are
+    if hasattr(value, "isoformat"):
+        value = value.isoformat()
+    payload = json.dumps([value, str(id)])
+    return base64.b64encode((CURSOR_PREFIX + payload).encode()).decode()
+
+
+def decode_cursor(cursor):
+    try:
+        payload = base64.b64decode(cursor).decode()
+        if not payload.startswith(CURSOR_PREFIX):
+            raise ValueError
+        value, id = json.loads(payload[len(CURSOR_PREFIX):])
+        if isinstance(value, str):
+            value = parse_datetime(value)
+            if value is None:
+                raise ValueError
+        elif isinstance(value, bool) or not isinstance(value, (int, float)):
+            raise ValueError
+        # every paginated model has a uuid primary key, anything else would reach the ORM
+        if not isinstance(id, str):
+            raise ValueError
+        id = uuid.UUID(id)
+    except (ValueError, TypeError, UnicodeDecodeError):
+        raise GraphQLError("Invalid cursor.")
+    return value, id
+
+
+class KeysetConnectionField(DjangoFilterConnectionField):
+    """
+    DjangoFilterConnectionField paginating with keyset cursors on (ordering_field, id).
+    ordering_field: datetime field (or numeric annotation, like a search rank) the list is ordered by,
+    descending unless order_by asks for ascending.
+
+    Falls back to the offset pagination when an offset argument or an ordering on another field is used.
+    """
+
+    def __init__(self, type, ordering_field="created_at", *args, **kwargs):
+        self.ordering_field = ordering_field
+        super().__init__(type, *args, **kwargs)
+
+    def get_resolver(self, parent_resolver):
+        return partial(
+            self.keyset_connection_resolver,
+            self.ordering_field,
+            parent_resolver,
+            self.connection_type,
+            self.get_manager(),
+            self.get_queryset_resolver(),
+            self.max_limit,
+            self.enforce_first_or_last,
+        )
+
+    @classmethod
+    def keyset_connection_resolver(
+        cls,
+        ordering_field,
+        resolver,
+        connection,
+        default_manager,
+        queryset_resolver,
+        max_limit,
+        enforce_first_or_last,
+        root,
+        info,
+        **args
+    ):
+        default_resolver = partial(
+            cls.connection_resolver,
+            resolver,
+            connection,
+            default_manager,
+            queryset_resolver,
+            max_limit,
+            enforce_first_or_last,
+            root,
+            info,
+        )
+        if args.get("offset") is not None:
+            return default_resolver(**args)
+
+        first = args.get("first")
+        last = args.get("last")
+        if enforce_first_or_last and not (first or last):
+            raise GraphQLError(
+                "You must provide a `first` or `last` value to properly paginate the `{}` connection.".format(info.field_name)
+            )
+        for name, value in (("first", first), ("last", last)):
+            if value is not None and (value < 0 or (max_limit and value > max_limit)):
+                raise GraphQLError(
+                    "Requesting {} records on the `{}` connection exceeds the `{}` limit of {} records.".format(
+                        value, info.field_name, name, max_limit
+                    )
+                )
+
+        iterable = resolver(root, info, **args)
+        if iterable is None:
+            iterable = default_manager
+        iterable = queryset_resolver(connection, iterable, info, args)
+        on_resolve = partial(cls.resolve_keyset_connection, connection, args, ordering_field, max_limit)
+
+        if Promise.is_thenable(iterable):
+            return Promise.resolve(iterable).then(on_resolve)
+        return on_resolve(iterable)
+
+    @classmethod
+    def resolve_keyset_connection(cls, connection, args, ordering_field, max_limit, iterable):
+        queryset = maybe_queryset(iterable)
+
+        ordering = list(queryset.query.order_by)
+        if not ordering:
+            descending = True
+        elif ordering in ([ordering_field], ["-" + ordering_field]):
+            descending = ordering[0].startswith("-")
+        else:
+            # ordered on something we can't build a cursor from
+            return cls.resolve_connection(connection, args, queryset, max_limit=max_limit)
+
+        first = args.get("first")
+        last = args.get("last")
+        after = args.get("after")
+        before = args.get("before")
+
+        # paginating backwards (last/before) walks the list in the opposite direction and reverses the page
+        backwards = last is not None and first is None
+        limit = last if backwards else first
+        if limit is None:
+            limit = max_limit
+
+        rows = queryset
+        for cursor, is_after in ((after, True), (before, False)):
+            if cursor:
+                value, id = decode_cursor(cursor)
+                # descending lists continue to smaller keys after a cursor
+                lookup = "lt" if is_after == descending else "gt"
+                rows = rows.filter(
+                    Q(**{"{}__{}".format(ordering_field, lookup): value})
+                    | Q(**{ordering_field: value, "id__{}".format(lookup): id})
+                )
+
+        walk_descending = descending != backwards
+        prefix = "-" if walk_descending else ""
+        rows = rows.order_by(prefix + ordering_field, prefix + "id")
+
+        page = list(rows[:limit + 1]) if limit is not None else list(rows)
+        has_more = limit is not None and len(page) > limit
+        page = page[:limit] if limit is not None else page
+        if backwards:
+            page.reverse()
+
+        edges = [
+            connection.Edge(node=node, cursor=encode_cursor(getattr(node, ordering_field), node.id))
+            for node in page
+        ]
+        page_info = PageInfo(
+            start_cursor=edges[0].cursor if edges else None,
+            end_cursor=edges[-1].cursor if edges else None,
+            has_previous_page=has_more if backwards else bool(after),
+            has_next_page=bool(before) if backwards else has_more,
+        )
+        result = connection(edges=edges, page_info=page_info)
+        result.iterable = queryset
+        return result
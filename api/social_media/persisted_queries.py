@@ -0,0 +1,96 @@
+"""
+Automatic persisted queries (the Apollo APQ protocol).
+
+Clients send extensions.persistedQuery = {"version": 1, "sha256Hash": "<sha256 of the query>"} instead of
+the query text. Unknown hashes are answered with a PersistedQueryNotFound error, the client then sends the
+query together with its hash once and the server registers it.
+Queries are kept in redis (shared by all the workers) behind a process-local LRU.
+"""
+
+import logging
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse, HttpResponseBadRequest
+from graphene_django.views import HttpError
+
+from .backend import query_hash
+
+logger = logging.getLogger(__name__)
+
+
+CACHE_KEY_PREFIX = "apq:"
+LOCAL_CACHE_SIZE = 1000
+
+
+class PersistedQueryError(HttpError):
+    """
+    APQ protocol error, returned with the error code clients look for in the extensions.
+    """
+
+    def __init__(self, message, code, response=None):
+        self.code = code
+        # PersistedQueryNotFound is part of the protocol, not a failure: answered with a 200
+        super().__init__(response or HttpResponse(), message)
+
+
+_local_queries = OrderedDict()
+_local_lock = threading.Lock()
+
+
+def _remember(sha256_hash, query):
+    with _local_lock:
+        _local_queries[sha256_hash] = query
+        _local_queries.move_to_end(sha256_hash)
+        if len(_local_queries) > LOCAL_CACHE_SIZE:
+            _local_queries.popitem(last=False)
+
+
+def get_persisted_query(sha256_hash):
+    with _local_lock:
+        query = _local_queries.get(sha256_hash)
+    if query is not None:
+        return query
+    try:
+        query = cache.get(CACHE_KEY_PREFIX + sha256_hash)
+    except Exception:
+        # cache unavailable, the client falls back to sending the query
+        logger.warning("Could not read persisted query %s", sha256_hash, exc_info=True)
+        return None
+    if query is not None:
+        _remember(sha256_hash, query)
+    return query
+
+
+def persist_query(sha256_hash, query):
+    _remember(sha256_hash, query)
+    try:
+        cache.set(CACHE_KEY_PREFIX + sha256_hash, query, timeout=settings.GRAPHQL_PERSISTED_QUERY_TIMEOUT)
+    except Exception:
+        logger.warning("Could not store persisted query %s", sha256_hash, exc_info=True)
+
+
+def resolve_persisted_query(query, persisted_query):
+    """
+    Return the query text of a request carrying a persistedQuery extension, registering it when sent along.
+    """
+    if not isinstance(persisted_query, dict) or persisted_query.get("version") != 1:
+        raise PersistedQueryError(
+            "PersistedQueryNotSupported", "PERSISTED_QUERY_NOT_SUPPORTED", HttpResponseBadRequest()
+        )
+    sha256_hash = persisted_query.get("sha256Hash")
+    if not isinstance(sha256_hash, str) or len(sha256_hash) != 64:
+        raise PersistedQueryError("Invalid persisted query hash.", "BAD_REQUEST", HttpResponseBadRequest())
+
+    if query:
+        if query_hash(query) != sha256_hash.lower():
+            raise PersistedQueryError("Provided sha does not match query.", "BAD_REQUEST", HttpResponseBadRequest())
+        persist_query(sha256_hash.lower(), query)
+        return query
+
+    query = get_persisted_query(sha256_hash.lower())
+    if query is None:
+        raise PersistedQueryError("PersistedQueryNotFound", "PERSISTED_QUERY_NOT_FOUND")
+    return query
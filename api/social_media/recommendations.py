@@ -0,0 +1,170 @@
+"""
+"People you may know": friend-of-friend profile suggestions, precomputed by a celery task.
+
+compute_suggestions loads the whole Follow edge list into a compressed sparse row (CSR) graph held in
+`array` buffers (8 bytes per edge instead of a Python object per edge) and scores, for every user,
+the accounts two hops away:
+
+- one point per followed account that follows the candidate (mutual connections)
+- FOLLOWS_YOU_WEIGHT more when the candidate already follows the user
+
+Accounts the user already follows and the user themself are skipped, as are the outgoing edges of
+accounts following more than PROFILE_SUGGESTIONS_MAX_DEGREE others (follow bots would make every user
+a candidate of everyone). The top PROFILE_SUGGESTIONS_COUNT candidates of every user are stored in a
+redis sorted set suggestions:<user_id>, suggestedProfiles only reads it.
+"""
+
+import heapq
+import logging
+from array import array
+
+from django.conf import settings
+from django_redis import get_redis_connection
+
+from .models import Profile, Follow
+from . import social_graph
+
+logger = logging.getLogger(__name__)
+
+
+SUGGESTIONS_KEY = "suggestions:{}"
+FOLLOWS_YOU_WEIGHT = 2
+EDGE_BATCH_SIZE = 10000
+WRITE_BATCH_SIZE = 500
+
+
+def suggestions_key(user_id):
+    return SUGGESTIONS_KEY.format(user_id)
+
+
+def get_connection():
+    return get_redis_connection("default")
+
+
+class FollowGraph:
+    """
+    Follow graph in CSR form, users are numbered 0..n-1 (user_ids[i] is the id of user i).
+    The accounts user i follows are indices[indptr[i]:indptr[i + 1]], the accounts following
+    user i are reverse_indices[reverse_indptr[i]:reverse_indptr[i + 1]].
+    """
+
+    def __init__(self, user_ids, sources, targets):
+        self.user_ids = user_ids
+        self.indptr, self.indices = self._csr(len(user_ids), sources, targets)
+        self.reverse_indptr, self.reverse_indices = self._csr(len(user_ids), targets, sources)
+
+    @staticmethod
+    def _csr(size, sources, targets):
+        # counting sort of the edges by source
+        indptr = array("q", bytes(8 * (size + 1)))
+        for source in sources:
+            indptr[source + 1] += 1
+        for i in range(size):
+            indptr[i + 1] += indptr[i]
+        indices = array("q", bytes(8 * len(targets)))
+        position = array("q", indptr[:-1])
+        for source, target in zip(sources, targets):
+            indices[position[source]] = target
+            position[source] += 1
+        return indptr, indices
+
+    @classmethod
+    def load(cls):
+        """
+        Build the graph from the database, the edges are streamed with a server side cursor.
+        """
+        user_ids = list(Profile.objects.order_by("user_id").values_list("user_id", flat=True))
+        index = {user_id: i for i, user_id in enumerate(user_ids)}
+        sources, targets = array("q"), array("q")
+        edges = Follow.objects.values_list("followed_by_id", "user_id").iterator(chunk_size=EDGE_BATCH_SIZE)
+        for follower_id, user_id in edges:
+            source, target = index.get(follower_id), index.get(user_id)
+            if source is not None and target is not None:
+                sources.append(source)
+                targets.append(target)
+        return cls(user_ids, sources, targets)
+
+    def __len__(self):
+        return len(self.user_ids)
+
+    def following(self, i):
+        return self.indices[self.indptr[i]:self.indptr[i + 1]]
+
+    def followers(self, i):
+        return self.reverse_indices[self.reverse_indptr[i]:self.reverse_indptr[i + 1]]
+
+    def follower_count(self, i):
+        return self.reverse_indptr[i + 1] - self.reverse_indptr[i]
+
+    def suggestions(self, i, count, max_degree):
+        """
+        Return the top count (candidate index, score) of user i, best first.
+        Ties go to the candidates with the most followers.
+        """
+        following = self.following(i)
+        scores = {}
+        for followed in following:
+            if self.indptr[followed + 1] - self.indptr[followed] > max_degree:
+                continue
+            for candidate in self.following(followed):
+                scores[candidate] = scores.get(candidate, 0) + 1
+        for follower in self.followers(i):
+            scores[follower] = scores.get(follower, 0) + FOLLOWS_YOU_WEIGHT
+
+        excluded = set(following)
+        excluded.add(i)
+        return heapq.nlargest(
+            count,
+            ((candidate, score) for candidate, score in scores.items() if candidate not in excluded),
+            key=lambda item: (item[1], self.follower_count(item[0])),
+        )
+
+
+def compute_suggestions(count=None, max_degree=None):
+    """
+    Recompute the suggestions of every user and store them in redis, return the number of users processed.
+    """
+    count = count or settings.PROFILE_SUGGESTIONS_COUNT
+    max_degree = max_degree or settings.PROFILE_SUGGESTIONS_MAX_DEGREE
+    graph = FollowGraph.load()
+    redis = get_connection()
+
+    pipe = redis.pipeline()
+    for i in range(len(graph)):
+        key = suggestions_key(graph.user_ids[i])
+        pipe.delete(key)
+        suggestions = graph.suggestions(i, count, max_degree)
+        if suggestions:
+            pipe.zadd(key, {
+                # the fractional part keeps the follower count tie-break in the redis ordering
+                str(graph.user_ids[candidate]): score + graph.follower_count(candidate) / (graph.follower_count(candidate) + 1)
+                for candidate, score in suggestions
+            })
+            pipe.expire(key, settings.PROFILE_SUGGESTIONS_TTL)
+        if (i + 1) % WRITE_BATCH_SIZE == 0:
+            pipe.execute()
+    pipe.execute()
+    return len(graph)
+
+
+def get_suggested_profiles(user, first=20):
+    """
+    Return the suggested profiles of user, best first. Accounts followed since the suggestions
+    were computed are dropped.
+    """
+    try:
+        redis = get_connection()
+        # read a few more in case some were followed in the meantime
+        suggested_ids = [member.decode() for member in redis.zrevrange(suggestions_key(user.id), 0, 2 * first - 1)]
+        if not suggested_ids:
+            return []
+        social_graph.ensure_sets([user.id])
+        followed = redis.smismember(social_graph.following_key(user.id), suggested_ids)
+    except Exception:
+        logger.warning("Could not read the profile suggestions of %s", user.id, exc_info=True)
+        return []
+
+    suggested_ids = [user_id for user_id, is_followed in zip(suggested_ids, followed) if not is_followed][:first]
+    profiles = Profile.objects.select_related("user").in_bulk(suggested_ids, field_name="user_id")
+    profiles = {str(user_id): profile for user_id, profile in profiles.items()}
+    return [profiles[user_id] for user_id in suggested_ids if user_id in profiles]
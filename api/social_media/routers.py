@@ -0,0 +1,85 @@
+"""
+Database routing between the primary and the read replicas (DATABASE_REPLICAS).
+
+Everything goes to the primary, except the reads done inside read_from_replicas(): the GraphQL views wrap
+query operations in it, mutations and everything else (celery tasks, admin, management commands) never see
+a replica. Replicas lag behind the primary, so a viewer who just ran a mutation is pinned to the primary
+for DATABASE_REPLICA_PIN_SECONDS and reads their own writes.
+"""
+
+import logging
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import cache
+
+logger = logging.getLogger(__name__)
+
+
+PRIMARY = "default"
+PIN_KEY_PREFIX = "db-pin:"
+
+# context variable: the root fields run by the async view in worker threads inherit it
+_use_replicas = ContextVar("use_replicas", default=False)
+
+
+def replicas_enabled():
+    return bool(settings.DATABASE_REPLICAS)
+
+
+def reading_from_replicas():
+    return _use_replicas.get() and replicas_enabled()
+
+
+@contextmanager
+def read_from_replicas(enabled=True):
+    """
+    Send the reads of the block to a random replica (when enabled and replicas are configured).
+    """
+    token = _use_replicas.set(enabled)
+    try:
+        yield
+    finally:
+        _use_replicas.reset(token)
+
+
+def pin_to_primary(viewer):
+    """
+    Read from the primary for the next DATABASE_REPLICA_PIN_SECONDS, after viewer wrote something.
+    """
+    if not replicas_enabled() or viewer is None:
+        return
+    try:
+        cache.set(PIN_KEY_PREFIX + viewer, 1, timeout=settings.DATABASE_REPLICA_PIN_SECONDS)
+    except Exception:
+        logger.warning("Could not pin %s to the primary database", viewer, exc_info=True)
+
+
+def is_pinned_to_primary(viewer):
+    try:
+        return cache.get(PIN_KEY_PREFIX + viewer) is not None
+    except Exception:
+        # can't tell, the primary is always right
+        return True
+
+
+class PrimaryReplicaRouter:
+    def db_for_read(self, model, **hints):
+        if reading_from_replicas():
+            return random.choice(settings.DATABASE_REPLICAS)
+        return PRIMARY
+
+    def db_for_write(self, model, **hints):
+        return PRIMARY
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # replicas hold the same data as the primary
+        databases = {PRIMARY, *settings.DATABASE_REPLICAS}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == PRIMARY
@@ -1,12 +1,25 @@
 from graphene_django import DjangoObjectType, DjangoListField
 import graphene
+import uuid
 from graphene_django.filter import DjangoFilterConnectionField
+from graphene_django.settings import graphene_settings
 from .models import Profile, Post, PostMedia, Interaction, Follow, Bookmark
 from graphql import GraphQLError
+from django.conf import settings
 from django.utils import timezone
+from django.db import transaction
 from graphql_jwt.decorators import login_required
-from graphene.relay import Node
-from .utils import node_resolver
+from graphene.relay import Node, PageInfo
+from graphql_relay.connection.arrayconnection import cursor_to_offset, offset_to_cursor
+from .utils import node_resolver, cache_tag, invalidate_cache
+from .loaders import FOLLOW_LIST_MAX, FOLLOW_LIST_SIZE, get_loaders
+from .feed import get_home_feed
+from .recommendations import get_suggested_profiles
+from .trending import get_trending_posts
+from .threads import get_thread
+from .pagination import CountableConnection, KeysetConnectionField
+from .search import search_posts, search_profiles, index_posts
+from . import social_graph, tasks
 
 from django.contrib.auth import get_user_model
 from .filters import BookmarkFilter, InteractionFilter, PostFilter, ProfileFilter
@@ -21,29 +34,36 @@ class ProfileNode(DjangoObjectType):
 
     """GraphQL node for Profile model with mutual followers field.
     mutual_followers: List of ProfileNode representing users who mutually follow the profile owner.
+    followers / following / mutual_followers return the `first` newest ones (at most FOLLOW_LIST_MAX, see loaders.py).
+    follower_count / following_count: number of followers and of followed users, without fetching the lists.
     """
-    mutual_followers = graphene.List(lambda: ProfileNode)
-    followers = graphene.List(lambda: ProfileNode)
-    following = graphene.List(lambda: ProfileNode)
+    mutual_followers = graphene.List(lambda: ProfileNode, first=graphene.Int(default_value=FOLLOW_LIST_SIZE))
+    followers = graphene.List(lambda: ProfileNode, first=graphene.Int(default_value=FOLLOW_LIST_SIZE))
+    following = graphene.List(lambda: ProfileNode, first=graphene.Int(default_value=FOLLOW_LIST_SIZE))
     bookmarks = graphene.List(lambda: BookmarkNode)
 
     class Meta:
         model = Profile
-        fields = "__all__"
+        exclude = ("search_vector",)
         filterset_class = ProfileFilter
         interfaces = (graphene.relay.Node,)
 
-    def resolve_mutual_followers(self, info):
-        return self.get_mutual_followers()
+    @staticmethod
+    def first_profiles(promise, first):
+        first = max(min(first, FOLLOW_LIST_MAX), 0)
+        return promise.then(lambda profiles: profiles[:first])
+
+    def resolve_mutual_followers(self, info, first=FOLLOW_LIST_SIZE):
+        return ProfileNode.first_profiles(get_loaders(info).mutual_followers.load(self.user_id), first)
     
-    def resolve_followers(self, info):
-        return self.get_followers()
+    def resolve_followers(self, info, first=FOLLOW_LIST_SIZE):
+        return ProfileNode.first_profiles(get_loaders(info).followers.load(self.user_id), first)
 
-    def resolve_following(self, info):
-        return self.get_following()
+    def resolve_following(self, info, first=FOLLOW_LIST_SIZE):
+        return ProfileNode.first_profiles(get_loaders(info).following.load(self.user_id), first)
     
     def resolve_bookmarks(self, info):
-        return Bookmark.objects.filter(user=self.user)
+        return get_loaders(info).user_bookmarks.load(self.user_id)
 
 
 
@@ -62,18 +82,19 @@ class PostNode(DjangoObjectType):
     bookmarks = graphene.Int()
     class Meta:
         model = Post
-        fields = "__all__"
+        exclude = ("search_vector", "root_post", "path", "thread_posts")
         filterset_class = PostFilter
         interfaces = (graphene.relay.Node,)
+        connection_class = CountableConnection
     
     def resolve_media(self, info):
-        return self.attachments.all()
+        return get_loaders(info).post_media.load(self.id)
     
     def resolve_engagements(self, info):
-        return self.engagements.all()
+        return get_loaders(info).post_engagements.load(self.id)
     
     def resolve_comments(self, info):
-        return self.comments.all()
+        return get_loaders(info).post_comments.load(self.id)
     
     def resolve_likes(self, info):
         return self.likes()
@@ -116,6 +137,7 @@ class InteractionNode(DjangoObjectType):
         fields = "__all__"
         filterset_class = InteractionFilter
         interfaces = (graphene.relay.Node,)
+        connection_class = CountableConnection
 
         
 
@@ -139,13 +161,14 @@ class FollowNode(DjangoObjectType):
         interfaces = (
             graphene.relay.Node,
         )
+        connection_class = CountableConnection
 
 
     def resolve_user(self, info):
-        return self.user.profile
+        return get_loaders(info).profile_by_user.load(self.user_id)
     
     def resolve_followed_by(self, info):
-        return self.followed_by.profile
+        return get_loaders(info).profile_by_user.load(self.followed_by_id)
     
 
 class BookmarkNode(DjangoObjectType):
@@ -159,6 +182,22 @@ class BookmarkNode(DjangoObjectType):
         interfaces = (
             graphene.relay.Node,
         )
+        connection_class = CountableConnection
+
+
+class ThreadNode(graphene.ObjectType):
+    """
+    A post of a conversation tree returned by the thread query (see threads.py).
+    post: the post.
+    replies: List of ThreadNode, replies to the post, oldest first.
+    has_more_replies: True when some replies were left out (per level limit, max depth...).
+    """
+    post = graphene.Field(PostNode)
+    replies = graphene.List(lambda: ThreadNode)
+    has_more_replies = graphene.Boolean()
+
+    def resolve_has_more_replies(self, info):
+        return len(self.replies) < self.post.comment_count
 
 
 class PostMediaInput(graphene.InputObjectType):
@@ -168,6 +207,8 @@ class PostMediaInput(graphene.InputObjectType):
     type: Type of media (PHOTO, VIDEO, GIF).
     metadata: Additional metadata for the media attachment.
     mime_type: MIME type of the media attachment.
+    type and mime_type are corrected, and metadata completed (dimensions, thumbnails, blurhash...),
+    from the file itself once the post is created (process_post_media task).
 
     """
     media_url = graphene.String(required=True)
@@ -215,8 +256,25 @@ class UpdateProfile(graphene.Mutation):
             profile.preferences = preferences
         
         profile.save()
+        invalidate_cache(cache_tag(ProfileNode), cache_tag(ProfileNode, profile.id))
         return UpdateProfile(profile=profile)
 
+def build_post_medias(post, post_medias):
+    """
+    Unsaved PostMedia of a post from a list of PostMediaInput, to be saved with bulk_create.
+    """
+    return [
+        PostMedia(
+            post=post,
+            media_url=media_input.get("media_url"),
+            type=media_input.get("type"),
+            metadata=media_input.get("metadata"),
+            mime_type=media_input.get("mime_type")
+        )
+        for media_input in post_medias
+    ]
+
+
 class CreatePost(graphene.Mutation):
 
     """
@@ -246,19 +304,109 @@ class CreatePost(graphene.Mutation):
             parent_post = Post.objects.get(id=parent_post_id) if parent_post_id else None
         except Post.DoesNotExist:
             raise GraphQLError("Parent post not found.")
-        post = Post.objects.create(content=content, author=user, is_published=is_published, parent_post=parent_post)
-        if post_medias:
-            for media_input in post_medias:
-                PostMedia.objects.create(
-                    post=post,
-                    media_url=media_input.get("media_url"),
-                    type=media_input.get("type"),
-                    metadata=media_input.get("metadata"),
-                    mime_type=media_input.get("mime_type")
-                )
+        with transaction.atomic():
+            post = Post.objects.create(content=content, author=user, is_published=is_published, parent_post=parent_post)
+            if parent_post:
+                Post.bump_counter(parent_post.id, "comment_count")
+            if post_medias:
+                medias = PostMedia.objects.bulk_create(build_post_medias(post, post_medias))
+                media_ids = [str(media.id) for media in medias]
+                tasks.enqueue_on_commit(tasks.process_post_media, media_ids)
+            if not parent_post:
+                tasks.enqueue_on_commit(tasks.fan_out_post_to_feeds, str(post.id))
+            invalidate_cache(cache_tag(PostNode), cache_tag(PostMediaNode))
+            if parent_post:
+                invalidate_cache(cache_tag(PostNode, parent_post.id))
         return CreatePost(post=post)
 
 
+class PostInput(graphene.InputObjectType):
+    """
+    PostInput: Input type for creating posts in bulk (createPosts).
+    content: Content of the post.
+    is_published: Boolean indicating if the post is published.
+    parent_post_id: ID of the parent post if it's a comment.
+    post_medias: List of PostMediaInput for media attachments.
+
+    """
+    content = graphene.String(required=True)
+    is_published = graphene.Boolean()
+    parent_post_id = graphene.ID()
+    post_medias = graphene.List(PostMediaInput)
+
+
+class CreatePosts(graphene.Mutation):
+
+    """
+    GraphQL mutation to create many posts at once (imports, scheduled threads...).
+    Runs a constant number of statements whatever the number of posts: everything is inserted with
+    bulk_create in a single transaction, either all the posts are created or none.
+    posts: List of PostInput, at most MAX_POSTS.
+
+    """
+    MAX_POSTS = 100
+
+    posts = graphene.List(PostNode)
+
+    class Arguments:
+        posts = graphene.List(graphene.NonNull(PostInput), required=True)
+
+    @login_required
+    def mutate(self, info, posts):
+        user = info.context.user
+        if user.is_anonymous or not user.is_authenticated:
+            raise GraphQLError("Authentication required to create posts.")
+        if not posts:
+            raise GraphQLError("At least one post is required.")
+        if len(posts) > CreatePosts.MAX_POSTS:
+            raise GraphQLError(f"At most {CreatePosts.MAX_POSTS} posts can be created at once.")
+
+        parent_ids = decode_global_ids(
+            [post_input["parent_post_id"] for post_input in posts if post_input.get("parent_post_id")]
+        )
+        if None in parent_ids.values():
+            raise GraphQLError("Parent post not found.")
+        # thread position of the parents, the comments are placed under them
+        existing_parents = Post.objects.only("id", "root_post_id", "depth", "path").in_bulk(list(parent_ids.values()))
+        if len(existing_parents) != len(set(parent_ids.values())):
+            raise GraphQLError("Parent post not found.")
+
+        new_posts, medias, comment_counts = [], [], {}
+        for post_input in posts:
+            parent_post_id = parent_ids.get(post_input.get("parent_post_id"))
+            post = Post(
+                content=post_input["content"],
+                author=user,
+                is_published=post_input.get("is_published") or False,
+                parent_post_id=parent_post_id,
+            )
+            post.place_in_thread(existing_parents[parent_post_id] if parent_post_id else None)
+            new_posts.append(post)
+            if parent_post_id:
+                comment_counts[parent_post_id] = comment_counts.get(parent_post_id, 0) + 1
+            if post_input.get("post_medias"):
+                medias.extend(build_post_medias(post, post_input["post_medias"]))
+
+        with transaction.atomic():
+            Post.objects.bulk_create(new_posts)
+            PostMedia.objects.bulk_create(medias)
+            if medias:
+                media_ids = [str(media.id) for media in medias]
+                tasks.enqueue_on_commit(tasks.process_post_media, media_ids)
+            Post.bump_counters("comment_count", comment_counts)
+            # bulk_create skips the post_save signals
+            index_posts(new_posts, replace=False)
+            top_level_ids = [str(post.id) for post in new_posts if not post.parent_post_id]
+            if top_level_ids:
+                tasks.enqueue_on_commit(tasks.fan_out_posts_to_feeds, top_level_ids)
+            invalidate_cache(
+                cache_tag(PostNode),
+                cache_tag(PostMediaNode),
+                *[cache_tag(PostNode, parent_post_id) for parent_post_id in comment_counts]
+            )
+        return CreatePosts(posts=new_posts)
+
+
 class UpdatePost(graphene.Mutation):
 
     """
@@ -293,6 +441,7 @@ class UpdatePost(graphene.Mutation):
 
         post.edited = True
         post.save()
+        invalidate_cache(cache_tag(PostNode), cache_tag(PostNode, post.id))
         return UpdatePost(post=post)
     
 class DeletePost(graphene.Mutation):
@@ -319,8 +468,16 @@ class DeletePost(graphene.Mutation):
         except Post.DoesNotExist:
             raise GraphQLError("Post not found or you do not have permission to delete this post.")
         
-        post.deleted = True
-        post.save()
+        with transaction.atomic():
+            if post.parent_post_id and not post.deleted:
+                Post.bump_counter(post.parent_post_id, "comment_count", -1)
+            post.deleted = True
+            post.save()
+            if not post.parent_post_id:
+                tasks.enqueue_on_commit(tasks.retract_post_from_feeds, str(post.id))
+            invalidate_cache(cache_tag(PostNode), cache_tag(PostNode, post.id))
+            if post.parent_post_id:
+                invalidate_cache(cache_tag(PostNode, post.parent_post_id))
         return DeletePost(success=True)
     
 class CreateInteration(graphene.Mutation):
@@ -341,17 +498,34 @@ class CreateInteration(graphene.Mutation):
         user = info.context.user
         if user.is_anonymous or not user.is_authenticated:
             raise GraphQLError("Authentication required to interact with a post.")
-        _, post_id = Node.from_global_id(post_id) 
+        post_id = decode_global_ids([post_id])[post_id]
+        if post_id is None:
+            raise GraphQLError("Post not found.")
+        if type == "LIKE":
+            # single statement upsert, liking an already liked post returns the existing like
+            with transaction.atomic():
+                interaction, created = Interaction.like(user, post_id)
+            if interaction is None:
+                raise GraphQLError("Post not found.")
+            if created:
+                invalidate_cache(cache_tag(InteractionNode), cache_tag(PostNode), cache_tag(PostNode, post_id))
+            return CreateInteration(interaction=interaction)
+
         try:
             post = Post.objects.get(id=post_id)
         except Post.DoesNotExist:
             raise GraphQLError("Post not found.")
         
-        interaction = Interaction.objects.create(
-            user=user,
-            post=post,
-            type=type
-        )
+        with transaction.atomic():
+            interaction = Interaction.objects.create(
+                user=user,
+                post=post,
+                type=type
+            )
+            counter = Post.INTERACTION_COUNTERS.get(type)
+            if counter:
+                Post.bump_counter(post.id, counter)
+            invalidate_cache(cache_tag(InteractionNode), cache_tag(PostNode), cache_tag(PostNode, post.id))
         return CreateInteration(interaction=interaction)
 
 class DeleteInteraction(graphene.Mutation):
@@ -390,9 +564,30 @@ class DeleteInteraction(graphene.Mutation):
         except Interaction.DoesNotExist:
             raise GraphQLError("Interaction not found.")
         
-        interaction.delete()
+        with transaction.atomic():
+            invalidate_cache(
+                cache_tag(InteractionNode), cache_tag(InteractionNode, interaction.id),
+                cache_tag(PostNode), cache_tag(PostNode, post.id),
+            )
+            interaction.delete()
+            counter = Post.INTERACTION_COUNTERS.get(type)
+            if counter:
+                Post.bump_counter(post.id, counter, -1)
         return DeleteInteraction(success=True)
     
+def record_follows(follower_id, user_ids, amount):
+    """
+    Update the follow counters of the profiles and the redis social graph sets
+    after follower_id followed (amount=1) or unfollowed (amount=-1) user_ids.
+    """
+    user_ids = list(user_ids)
+    Profile.bump_follow_counts(follower_id, user_ids, amount)
+    profile_ids = Profile.objects.filter(user_id__in=[follower_id, *user_ids]).values_list("id", flat=True)
+    invalidate_cache(*[cache_tag(ProfileNode, profile_id) for profile_id in profile_ids])
+    update_sets = social_graph.add_follows if amount > 0 else social_graph.remove_follows
+    transaction.on_commit(lambda: update_sets(follower_id, user_ids))
+
+
 class FollowUser(graphene.Mutation):
 
     """
@@ -421,7 +616,12 @@ class FollowUser(graphene.Mutation):
             # extra check to ensure user can't follow themself, there's a database level constraint to ensure this never happens too.
             raise GraphQLError("You cannot follow yourself.")
         
-        Follow.objects.get_or_create(user=user_to_follow, followed_by=user)
+        with transaction.atomic():
+            _, created = Follow.objects.get_or_create(user=user_to_follow, followed_by=user)
+            if created:
+                record_follows(user.id, [user_to_follow.id], 1)
+                invalidate_cache(cache_tag(FollowNode), cache_tag(ProfileNode))
+                tasks.enqueue_on_commit(tasks.add_author_to_home_feed, str(user.id), str(user_to_follow.id))
         return FollowUser(success=True)
 
 class UnFollowUser(graphene.Mutation):
@@ -459,7 +659,12 @@ class UnFollowUser(graphene.Mutation):
         except Follow.DoesNotExist:
             raise GraphQLError("You weren't following the user")
     
-        follow.delete()
+        with transaction.atomic():
+            invalidate_cache(cache_tag(FollowNode), cache_tag(FollowNode, follow.id), cache_tag(ProfileNode))
+            deleted, _ = follow.delete()
+            if deleted:
+                record_follows(user.id, [user_to_unfollow.id], -1)
+                tasks.enqueue_on_commit(tasks.remove_author_from_home_feed, str(user.id), str(user_to_unfollow.id))
 
         return UnFollowUser(success=True)
     
@@ -484,7 +689,11 @@ class AddPostToBookmark(graphene.Mutation):
         except Post.DoesNotExist:
             raise GraphQLError("Post not found.")
         
-        bookmark, created = Bookmark.objects.get_or_create(user=user, post=post)
+        with transaction.atomic():
+            bookmark, created = Bookmark.objects.get_or_create(user=user, post=post)
+            if created:
+                Post.bump_counter(post.id, "bookmark_count")
+                invalidate_cache(cache_tag(BookmarkNode), cache_tag(PostNode), cache_tag(PostNode, post.id))
         if not created:
             raise GraphQLError("Post already bookmarked.")
         
@@ -517,15 +726,200 @@ class RemovePostFromBookmark(graphene.Mutation):
         except Bookmark.DoesNotExist:
             raise GraphQLError("Bookmark not found.")
         
-        bookmark.delete()
+        with transaction.atomic():
+            invalidate_cache(
+                cache_tag(BookmarkNode), cache_tag(BookmarkNode, bookmark.id),
+                cache_tag(PostNode), cache_tag(PostNode, post.id),
+            )
+            bookmark.delete()
+            Post.bump_counter(post.id, "bookmark_count", -1)
         return RemovePostFromBookmark(success=True)
         
 
 
 
+MAX_BULK_ITEMS = 100
+
+
+class BulkItemResult(graphene.ObjectType):
+    """
+    Outcome of one item of a bulk mutation (likeMany, bookmarkMany, followMany).
+    id: The global ID as sent.
+    success: True when the item is (now or already) in the requested state.
+    created: True when a row was inserted for it by this mutation.
+    error: Why the item failed.
+    """
+    id = graphene.ID()
+    success = graphene.Boolean()
+    created = graphene.Boolean()
+    error = graphene.String()
+
+
+def decode_global_ids(global_ids):
+    """
+    Map each distinct global ID to its UUID primary key, None when it isn't a valid ID.
+    """
+    decoded = {}
+    for global_id in global_ids:
+        if global_id in decoded:
+            continue
+        try:
+            _, pk = Node.from_global_id(global_id)
+            decoded[global_id] = uuid.UUID(pk)
+        except (TypeError, ValueError, UnicodeDecodeError):
+            decoded[global_id] = None
+    return decoded
+
+
+def bulk_insert(model, global_ids, targets, existing, build, not_found):
+    """
+    Shared part of the bulk mutations: insert one row per target not already there and report per item.
+    targets: primary keys of the targets that exist (one query).
+    existing: targets already in the requested state (one query).
+    build: target pk -> unsaved row.
+    Return (results, created target pks): only the rows this call inserted, not the ones a concurrent
+    request inserted first.
+    """
+    if len(global_ids) > MAX_BULK_ITEMS:
+        raise GraphQLError(f"At most {MAX_BULK_ITEMS} items can be sent at once.")
+    decoded = decode_global_ids(global_ids)
+    valid = [pk for pk in decoded.values() if pk is not None]
+    found = targets(valid) if valid else set()
+    already = existing(found) if found else set()
+    rows = {pk: build(pk) for pk in dict.fromkeys(valid) if pk in found and pk not in already}
+    to_create = []
+    if rows:
+        # ignore_conflicts: a concurrent request inserting the same row doesn't fail the whole batch,
+        # its row is kept and ours skipped, so only the rows found under our own ids were created here
+        model.objects.bulk_create(rows.values(), ignore_conflicts=True)
+        inserted = set(model.objects.filter(pk__in=[row.pk for row in rows.values()]).values_list("pk", flat=True))
+        to_create = [pk for pk, row in rows.items() if row.pk in inserted]
+
+    results, reported = [], set()
+    for global_id in global_ids:
+        pk = decoded[global_id]
+        if pk is None or pk not in found:
+            results.append(BulkItemResult(id=global_id, success=False, created=False, error=not_found))
+            continue
+        created = pk in to_create and pk not in reported
+        reported.add(pk)
+        results.append(BulkItemResult(id=global_id, success=True, created=created))
+    return results, to_create
+
+
+class LikeMany(graphene.Mutation):
+    """
+    GraphQL mutation to like many posts at once (offline sync).
+    post_ids: Global IDs of the posts to like, at most MAX_BULK_ITEMS.
+
+    Posts already liked succeed without creating anything.
+    """
+    results = graphene.List(BulkItemResult)
+
+    class Arguments:
+        post_ids = graphene.List(graphene.NonNull(graphene.ID), required=True)
+
+    @login_required
+    def mutate(self, info, post_ids):
+        user = info.context.user
+        if user.is_anonymous or not user.is_authenticated:
+            raise GraphQLError("Authentication required to interact with a post.")
+        with transaction.atomic():
+            results, created = bulk_insert(
+                Interaction,
+                post_ids,
+                targets=lambda pks: set(Post.objects.filter(id__in=pks, deleted=False).values_list("id", flat=True)),
+                existing=lambda pks: set(
+                    Interaction.objects.filter(user=user, post_id__in=pks, type="LIKE").values_list("post_id", flat=True)
+                ),
+                build=lambda pk: Interaction(user=user, post_id=pk, type="LIKE"),
+                not_found="Post not found.",
+            )
+            if created:
+                Post.bump_counters("like_count", {pk: 1 for pk in created})
+                invalidate_cache(
+                    cache_tag(InteractionNode), cache_tag(PostNode), *[cache_tag(PostNode, pk) for pk in created]
+                )
+        return LikeMany(results=results)
+
+
+class BookmarkMany(graphene.Mutation):
+    """
+    GraphQL mutation to bookmark many posts at once (offline sync).
+    post_ids: Global IDs of the posts to bookmark, at most MAX_BULK_ITEMS.
+
+    Posts already bookmarked succeed without creating anything.
+    """
+    results = graphene.List(BulkItemResult)
+
+    class Arguments:
+        post_ids = graphene.List(graphene.NonNull(graphene.ID), required=True)
+
+    @login_required
+    def mutate(self, info, post_ids):
+        user = info.context.user
+        if user.is_anonymous or not user.is_authenticated:
+            raise GraphQLError("Authentication required to bookmark a post.")
+        with transaction.atomic():
+            results, created = bulk_insert(
+                Bookmark,
+                post_ids,
+                targets=lambda pks: set(Post.objects.filter(id__in=pks, deleted=False).values_list("id", flat=True)),
+                existing=lambda pks: set(
+                    Bookmark.objects.filter(user=user, post_id__in=pks).values_list("post_id", flat=True)
+                ),
+                build=lambda pk: Bookmark(user=user, post_id=pk),
+                not_found="Post not found.",
+            )
+            if created:
+                Post.bump_counters("bookmark_count", {pk: 1 for pk in created})
+                invalidate_cache(
+                    cache_tag(BookmarkNode), cache_tag(PostNode), *[cache_tag(PostNode, pk) for pk in created]
+                )
+        return BookmarkMany(results=results)
+
+
+class FollowMany(graphene.Mutation):
+    """
+    GraphQL mutation to follow many users at once (offline sync, contact import).
+    user_ids: Global IDs (UserNode) of the users to follow, at most MAX_BULK_ITEMS.
+
+    Users already followed succeed without creating anything, the user cannot follow themself.
+    """
+    results = graphene.List(BulkItemResult)
+
+    class Arguments:
+        user_ids = graphene.List(graphene.NonNull(graphene.ID), required=True)
+
+    @login_required
+    def mutate(self, info, user_ids):
+        user = info.context.user
+        if user.is_anonymous or not user.is_authenticated:
+            raise GraphQLError("Authentication required to follow a user.")
+        with transaction.atomic():
+            results, created = bulk_insert(
+                Follow,
+                user_ids,
+                # excluding the user themself reports them as not found, the no_self_follow constraint backs it up
+                targets=lambda pks: set(User.objects.filter(id__in=pks).exclude(id=user.id).values_list("id", flat=True)),
+                existing=lambda pks: set(
+                    Follow.objects.filter(followed_by=user, user_id__in=pks).values_list("user_id", flat=True)
+                ),
+                build=lambda pk: Follow(user_id=pk, followed_by=user),
+                not_found="User to follow not found.",
+            )
+            if created:
+                author_ids = [str(pk) for pk in created]
+                record_follows(user.id, created, 1)
+                tasks.enqueue_on_commit(tasks.add_authors_to_home_feed, str(user.id), author_ids)
+                invalidate_cache(cache_tag(FollowNode), cache_tag(ProfileNode))
+        return FollowMany(results=results)
+
+
 class SocialMediaMutation(graphene.ObjectType):
     update_profile = UpdateProfile.Field()
     create_post = CreatePost.Field()
+    create_posts = CreatePosts.Field()
     update_post = UpdatePost.Field()
     delete_post = DeletePost.Field()
     create_interaction = CreateInteration.Field()
@@ -534,29 +928,38 @@ class SocialMediaMutation(graphene.ObjectType):
     unfollow_user = UnFollowUser.Field() 
     add_post_to_bookmark = AddPostToBookmark.Field()
     remove_post_from_bookmark = RemovePostFromBookmark.Field()  
+    like_many = LikeMany.Field()
+    bookmark_many = BookmarkMany.Field()
+    follow_many = FollowMany.Field()
 
 
 class SocialMediaQuery(graphene.ObjectType):
     # profile = graphene.relay.Node.Field(ProfileNode) # this bypasses authentication. The custom resolver doesn't get called
     profile = graphene.Field(ProfileNode, id=graphene.ID(required=True))
     all_profiles = DjangoFilterConnectionField(ProfileNode)
+    search_profiles = KeysetConnectionField(ProfileNode, ordering_field="rank", query=graphene.String(required=True)) # full text search on names + fuzzy username, best matches first
+    suggested_profiles = graphene.List(ProfileNode, first=graphene.Int(default_value=20)) # "people you may know", best first, recomputed daily
 
     post = graphene.relay.Node.Field(PostNode)
-    all_posts = DjangoFilterConnectionField(PostNode)
-    all_posts_including_comments = DjangoFilterConnectionField(PostNode) # Returns all posts including post returned as comments... for filtering and paginating
-    all_deleted_posts = DjangoFilterConnectionField(PostNode) 
+    all_posts = KeysetConnectionField(PostNode)
+    search_posts = KeysetConnectionField(PostNode, ordering_field="rank", query=graphene.String(required=True)) # full text search on content, best matches first
+    home_feed = graphene.List(PostNode, first=graphene.Int(default_value=20), before=graphene.DateTime()) # posts from followed users, newest first. pass the createdAt of the last post as before to get the next page
+    thread = graphene.Field(ThreadNode, root_id=graphene.ID(required=True), max_depth=graphene.Int(default_value=3), per_level=graphene.Int(default_value=10)) # a post and the tree of replies under it, fetched in one query
+    trending_posts = graphene.relay.ConnectionField(PostNode._meta.connection) # most engaged recent posts, recomputed every few minutes. forward pagination only (first/after)
+    all_posts_including_comments = KeysetConnectionField(PostNode) # Returns all posts including post returned as comments... for filtering and paginating
+    all_deleted_posts = KeysetConnectionField(PostNode) 
 
     post_media = graphene.relay.Node.Field(PostMediaNode)
     all_post_media = DjangoFilterConnectionField(PostMediaNode)
 
     interaction = graphene.relay.Node.Field(InteractionNode)
-    all_interactions = DjangoFilterConnectionField(InteractionNode)
+    all_interactions = KeysetConnectionField(InteractionNode)
 
     follow = graphene.relay.Node.Field(FollowNode)
-    all_follows = DjangoFilterConnectionField(FollowNode)
+    all_follows = KeysetConnectionField(FollowNode)
 
     bookmark = graphene.relay.Node.Field(BookmarkNode)
-    all_bookmarks = DjangoFilterConnectionField(BookmarkNode)
+    all_bookmarks = KeysetConnectionField(BookmarkNode, ordering_field="bookmarked_at")
 
 
     @login_required
@@ -565,23 +968,85 @@ class SocialMediaQuery(graphene.ObjectType):
 
     @login_required
     def resolve_all_profiles(self, info, **kwargs):
-        print("all body")
-        return Profile.objects.all()
+        return Profile.objects.select_related("user")
     
+    @login_required
+    def resolve_search_profiles(self, info, query, **kwargs):
+        return search_profiles(query)
+
+    @login_required
+    def resolve_search_posts(self, info, query, **kwargs):
+        return search_posts(query).select_related("author__profile")
+
     @login_required
     def resolve_all_posts(self, info, **kwargs):
-        return Post.objects.prefetch_related("post_bookmarks", "engagements", "comments", "attachments").select_related("author__profile").filter(deleted=False, parent_post=None)
+        return Post.objects.select_related("author__profile").filter(deleted=False, parent_post=None)
     
 
+    @login_required
+    def resolve_home_feed(self, info, first=20, before=None):
+        if first < 1 or first > 100:
+            raise GraphQLError("first must be between 1 and 100.")
+        return get_home_feed(info.context.user, first=first, before=before)
+
+    @login_required
+    def resolve_suggested_profiles(self, info, first=20):
+        if first < 1 or first > 50:
+            raise GraphQLError("first must be between 1 and 50.")
+        return get_suggested_profiles(info.context.user, first=first)
+
+    @login_required
+    def resolve_thread(self, info, root_id, max_depth=3, per_level=10):
+        if max_depth < 0 or max_depth > settings.THREAD_MAX_DEPTH:
+            raise GraphQLError("maxDepth must be between 0 and {}.".format(settings.THREAD_MAX_DEPTH))
+        if per_level < 1 or per_level > 100:
+            raise GraphQLError("perLevel must be between 1 and 100.")
+        root_id = decode_global_ids([root_id])[root_id]
+        thread = get_thread(root_id, max_depth, per_level) if root_id is not None else None
+        if thread is None:
+            raise GraphQLError("Post not found.")
+        return thread
+
+    @login_required
+    def resolve_trending_posts(self, info, first=None, after=None, last=None, before=None):
+        if last is not None or before is not None:
+            raise GraphQLError("trendingPosts can only be paginated forwards with first/after.")
+        max_limit = graphene_settings.RELAY_CONNECTION_MAX_LIMIT
+        first = max_limit if first is None else first
+        if first < 0 or first > max_limit:
+            raise GraphQLError("first must be between 0 and {}.".format(max_limit))
+        offset = 0
+        if after:
+            after_offset = cursor_to_offset(after)
+            if after_offset is None:
+                raise GraphQLError("Invalid cursor.")
+            offset = after_offset + 1
+
+        ranked_posts, total = get_trending_posts(offset=offset, limit=first) if first else ([], 0)
+        connection = PostNode._meta.connection
+        edges = [connection.Edge(node=post, cursor=offset_to_cursor(rank)) for rank, post in ranked_posts]
+        result = connection(
+            edges=edges,
+            page_info=PageInfo(
+                start_cursor=edges[0].cursor if edges else None,
+                end_cursor=edges[-1].cursor if edges else None,
+                has_previous_page=offset > 0,
+                has_next_page=offset + first < total,
+            ),
+        )
+        # read by CountableConnection.resolve_total_count
+        result.length = total
+        return result
+
     @login_required
     def resolve_all_posts_including_comments(self, info, **kwargs):
-        return Post.objects.prefetch_related("post_bookmarks", "engagements", "comments", "attachments").select_related("author__profile").filter(deleted=False)
+        return Post.objects.select_related("author__profile").filter(deleted=False)
     
 
     @login_required
     def resolve_all_deleted_posts(self, info, **kwargs):
         user = info.context.user
-        return Post.objects.prefetch_related("post_bookmarks", "engagements", "comments", "attachments").select_related("author__profile").filter(author=user, deleted=True)
+        return Post.objects.select_related("author__profile").filter(author=user, deleted=True)
 
     @login_required
     def resolve_post(self, info, id):
@@ -589,7 +1054,7 @@ class SocialMediaQuery(graphene.ObjectType):
 
     @login_required
     def resolve_all_interactions(self, info, **kwargs):
-        return Interaction.objects.select_related("post", "user").all()
+        return Interaction.objects.select_related("post__author__profile", "user")
     
     @login_required
     def resolve_interaction(self, info, id):
@@ -598,7 +1063,7 @@ class SocialMediaQuery(graphene.ObjectType):
 
     @login_required
     def resolve_all_follows(self, info, **kwargs):
-        return Follow.objects.select_related("user__profile", "followed_by__profile").all()
+        return Follow.objects.all()
     
     @login_required
     def resolve_follow(self, info, id):
@@ -625,6 +1090,6 @@ class SocialMediaQuery(graphene.ObjectType):
     @login_required
     def resolve_all_bookmarks(self, info, **kwargs):
         user = info.context.user
-        return Bookmark.objects.select_related("user", "post").filter(user=user) # bookmarks are private
+        return Bookmark.objects.select_related("user", "post__author__profile").filter(user=user) # bookmarks are private
     
 
@@ -0,0 +1,132 @@
+"""
+Full text search for posts and profiles.
+
+On PostgreSQL posts and profiles carry a tsvector column (search_vector) kept up to date by a trigger
+(fired by changes of the searched columns only, not the counter updates) and indexed with GIN,
+usernames have a trigram GIN index for fuzzy matching (see migration 0012).
+On the SQLite dev setup the same queries run against FTS5 tables, maintained from the post/profile
+save signals (triggers wouldn't survive the table rebuilds SQLite migrations do).
+
+Both return querysets annotated with a `rank` (higher is better) for KeysetConnectionField.
+"""
+
+import re
+
+from django.contrib.postgres.search import SearchQuery, SearchRank, TrigramSimilarity
+from django.db import connection
+from django.db.models import F, FloatField, Q, Value
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import Cast
+
+from .models import Post, Profile
+
+
+POST_FTS_TABLE = "social_media_post_fts"
+PROFILE_FTS_TABLE = "social_media_profile_fts"
+
+
+def is_postgres():
+    return connection.vendor == "postgresql"
+
+
+def fts5_query(term):
+    """
+    Turn user input into a safe FTS5 query: every word quoted (no operators), the last one as a prefix.
+    """
+    words = re.findall(r"\w+", term)
+    if not words:
+        return None
+    return " ".join('"{}"'.format(word) for word in words) + "*"
+
+
+def _fts5_filter(queryset, table, key_column, term):
+    query = fts5_query(term)
+    if query is None:
+        # still annotated, the connection orders by rank
+        return queryset.annotate(rank=Value(0.0, output_field=FloatField())).none()
+    model_table = queryset.model._meta.db_table
+    # bm25 is lower for better matches
+    rank = RawSQL(
+        f"SELECT -bm25({table}) FROM {table} WHERE {table} MATCH %s AND {key_column} = {model_table}.id",
+        [query],
+        output_field=FloatField(),
+    )
+    matches = RawSQL(f"SELECT {key_column} FROM {table} WHERE {table} MATCH %s", [query])
+    return queryset.filter(id__in=matches).annotate(rank=rank)
+
+
+def search_posts(term):
+    posts = Post.objects.filter(deleted=False)
+    if is_postgres():
+        query = SearchQuery(term, config="english", search_type="websearch")
+        return posts.filter(search_vector=query).annotate(
+            # ts_rank returns a real, cast it so the cursor round trips exactly
+            rank=Cast(SearchRank(F("search_vector"), query), FloatField())
+        )
+    return _fts5_filter(posts, POST_FTS_TABLE, "post_id", term)
+
+
+def search_profiles(term):
+    profiles = Profile.objects.select_related("user")
+    if is_postgres():
+        query = SearchQuery(term, config="simple", search_type="websearch")
+        return profiles.filter(
+            Q(search_vector=query) | Q(user__username__trigram_similar=term)
+        ).annotate(
+            rank=Cast(SearchRank(F("search_vector"), query) + TrigramSimilarity("user__username", term), FloatField())
+        )
+    return _fts5_filter(profiles, PROFILE_FTS_TABLE, "profile_id", term)
+
+
+# SQLite FTS5 maintenance, called from signals.py
+
+def index_posts(posts, replace=True):
+    """
+    replace=False for posts that were just created: post_id isn't indexed, every DELETE scans the table.
+    """
+    if connection.vendor != "sqlite":
+        return
+    with connection.cursor() as cursor:
+        if replace:
+            cursor.executemany(
+                f"DELETE FROM {POST_FTS_TABLE} WHERE post_id = %s", [(post.id.hex,) for post in posts]
+            )
+        cursor.executemany(
+            f"INSERT INTO {POST_FTS_TABLE} (post_id, content) VALUES (%s, %s)",
+            [(post.id.hex, post.content) for post in posts],
+        )
+
+
+def unindex_post(post_id):
+    if connection.vendor != "sqlite":
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {POST_FTS_TABLE} WHERE post_id = %s", [post_id.hex])
+
+
+def index_profile(profile, replace=True):
+    index_profiles([profile], replace)
+
+
+def index_profiles(profiles, replace=True):
+    if connection.vendor != "sqlite":
+        return
+    with connection.cursor() as cursor:
+        if replace:
+            cursor.executemany(
+                f"DELETE FROM {PROFILE_FTS_TABLE} WHERE profile_id = %s", [(profile.id.hex,) for profile in profiles]
+            )
+        cursor.executemany(
+            f"INSERT INTO {PROFILE_FTS_TABLE} (profile_id, first_name, last_name, username) VALUES (%s, %s, %s, %s)",
+            [
+                (profile.id.hex, profile.first_name or "", profile.last_name or "", profile.user.username)
+                for profile in profiles
+            ],
+        )
+
+
+def unindex_profile(profile_id):
+    if connection.vendor != "sqlite":
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {PROFILE_FTS_TABLE} WHERE profile_id = %s", [profile_id.hex])
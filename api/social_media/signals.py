@@ -0,0 +1,38 @@
+from django.contrib.auth import get_user_model
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from .models import Post, Profile
+from . import search
+
+
+User = get_user_model()
+
+
+# keep the SQLite FTS5 search tables in sync (no-ops on PostgreSQL, where triggers do it)
+
+@receiver(post_save, sender=Post)
+def index_post(sender, instance, created, *args, **kwargs):
+    search.index_posts([instance], replace=not created)
+
+
+@receiver(post_delete, sender=Post)
+def unindex_post(sender, instance, *args, **kwargs):
+    search.unindex_post(instance.id)
+
+
+@receiver(post_save, sender=Profile)
+def index_profile(sender, instance, created, *args, **kwargs):
+    search.index_profile(instance, replace=not created)
+
+
+@receiver(post_delete, sender=Profile)
+def unindex_profile(sender, instance, *args, **kwargs):
+    search.unindex_profile(instance.id)
+
+
+@receiver(post_save, sender=User)
+def reindex_user_profile(sender, instance, created, *args, **kwargs):
+    # the username is part of the profile search document
+    if not created and hasattr(instance, "profile"):
+        search.index_profile(instance.profile)
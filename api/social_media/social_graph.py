@@ -0,0 +1,132 @@
+"""
+Follower / following id sets of the users, cached in redis.
+
+followers:<user_id> holds the ids of the users following user_id and following:<user_id> the ids of the
+users user_id follows. The sets are built from the database on first use and expire after
+SOCIAL_GRAPH_TTL, the follow mutations add and remove ids in the sets that exist (once the transaction
+committed). Mutual followers are then a SINTER of two sets instead of a double self-join on Follow.
+"""
+
+import logging
+
+from django.conf import settings
+from django_redis import get_redis_connection
+
+from .models import Follow
+
+logger = logging.getLogger(__name__)
+
+
+FOLLOWERS_KEY = "followers:{}"
+FOLLOWING_KEY = "following:{}"
+# member keeping the set of a user without followers (or following nobody) alive, redis drops empty sets
+EMPTY_MARKER = ""
+
+
+def followers_key(user_id):
+    return FOLLOWERS_KEY.format(user_id)
+
+
+def following_key(user_id):
+    return FOLLOWING_KEY.format(user_id)
+
+
+def get_connection():
+    return get_redis_connection("default")
+
+
+def _store(pipe, key, ids):
+    pipe.delete(key)
+    pipe.sadd(key, EMPTY_MARKER, *[str(id) for id in ids])
+    pipe.expire(key, settings.SOCIAL_GRAPH_TTL)
+
+
+def ensure_sets(user_ids):
+    """
+    Build the missing follower and following sets of user_ids from the database (two queries at most).
+    """
+    redis = get_connection()
+    pipe = redis.pipeline(transaction=False)
+    for user_id in user_ids:
+        pipe.exists(followers_key(user_id))
+        pipe.exists(following_key(user_id))
+    exists = pipe.execute()
+    missing_followers = [user_id for user_id, found in zip(user_ids, exists[0::2]) if not found]
+    missing_following = [user_id for user_id, found in zip(user_ids, exists[1::2]) if not found]
+    if not missing_followers and not missing_following:
+        return
+
+    pipe = redis.pipeline(transaction=False)
+    for missing, lookup, key_attr, value_attr, key in (
+        (missing_followers, "user_id__in", "user_id", "followed_by_id", followers_key),
+        (missing_following, "followed_by_id__in", "followed_by_id", "user_id", following_key),
+    ):
+        if not missing:
+            continue
+        ids = {str(user_id): [] for user_id in missing}
+        for key_id, value_id in Follow.objects.filter(**{lookup: missing}).values_list(key_attr, value_attr):
+            ids[str(key_id)].append(value_id)
+        for user_id, members in ids.items():
+            _store(pipe, key(user_id), members)
+    pipe.execute()
+
+
+def mutual_follower_ids(user_ids):
+    """
+    Return {user_id: ids of the users following user_id that user_id follows back}.
+    """
+    ensure_sets(user_ids)
+    pipe = get_connection().pipeline(transaction=False)
+    for user_id in user_ids:
+        pipe.sinter(followers_key(user_id), following_key(user_id))
+    return {
+        user_id: [member.decode() for member in members if member.decode() != EMPTY_MARKER]
+        for user_id, members in zip(user_ids, pipe.execute())
+    }
+
+
+# KEYS[1]: following set of the follower, KEYS[2..]: followers sets of the followed users
+# ARGV[1]: SADD or SREM, ARGV[2]: the follower id, ARGV[3..]: the followed user ids
+# checked and updated in one step: a set expiring in between would be recreated partial, without TTL or marker
+UPDATE_SETS_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 1 then
+    redis.call(ARGV[1], KEYS[1], unpack(ARGV, 3))
+end
+for i = 2, #KEYS do
+    if redis.call('EXISTS', KEYS[i]) == 1 then
+        redis.call(ARGV[1], KEYS[i], ARGV[2])
+    end
+end
+"""
+
+
+def _update_sets(follower_id, user_ids, add):
+    """
+    Add (or remove) the follows of follower_id to user_ids in the sets that exist,
+    missing sets are built from the database when they're needed.
+    """
+    keys = [following_key(follower_id)] + [followers_key(user_id) for user_id in user_ids]
+    try:
+        get_connection().eval(
+            UPDATE_SETS_SCRIPT,
+            len(keys),
+            *keys,
+            "SADD" if add else "SREM",
+            str(follower_id),
+            *[str(user_id) for user_id in user_ids],
+        )
+    except Exception:
+        # stale sets would return wrong mutual followers until they expire, drop them instead
+        logger.warning("Could not update the social graph sets of %s", follower_id, exc_info=True)
+        try:
+            get_connection().delete(*keys)
+        except Exception:
+            pass
+
+
+def add_follows(follower_id, user_ids):
+    _update_sets(follower_id, user_ids, add=True)
+
+
+def remove_follows(follower_id, user_ids):
+    _update_sets(follower_id, user_ids, add=False)
@@ -3,21 +3,375 @@ import logging
 
 logger = logging.getLogger(__name__)
 
-@shared_task
-def clean_soft_deleted_posts():
+PURGE_BATCH_SIZE = 500
+
+
+def enqueue_on_commit(task, *args):
+    """
+    Queue task(*args) once the current transaction commits (right away outside of one).
+    The write is already committed by then: a broker error is logged instead of failing the mutation,
+    without publish retries, and nobody waits on the result (no result backend subscription, which
+    keeps reconnecting for seconds when redis is down). Feeds missing the update are rebuilt from the
+    database once they expire.
+    """
+    from django.db import transaction
+
+    def enqueue():
+        try:
+            task.apply_async(args, retry=False, ignore_result=True)
+        except Exception:
+            logger.warning("Could not queue %s%s", task.name, args, exc_info=True)
+
+    transaction.on_commit(enqueue)
+
+
+def _chunks(ids, size):
+    for i in range(0, len(ids), size):
+        yield ids[i:i + size]
+
+
+def _purge_posts(post_ids):
+    """
+    Hard delete posts and the rows depending on them with plain DELETE statements,
+    without Django collecting every cascaded object in memory first.
+    The comments of the posts must already be gone.
+    """
+    from social_media.models import Post, PostMedia, Interaction, Bookmark
+    from social_media.media import delete_thumbnails
+    from django.db import transaction
+
+    media_ids = list(PostMedia.objects.filter(post_id__in=post_ids).values_list("id", flat=True))
+    if media_ids:
+        transaction.on_commit(lambda: delete_thumbnails(media_ids))
+
+    counts = {}
+    for name, queryset in (
+        ("interactions", Interaction.objects.filter(post_id__in=post_ids)),
+        ("attachments", PostMedia.objects.filter(post_id__in=post_ids)),
+        ("bookmarks", Bookmark.objects.filter(post_id__in=post_ids)),
+        ("posts", Post.objects.filter(id__in=post_ids)),
+    ):
+        counts[name] = queryset._raw_delete(queryset.db)
+    return counts
+
+
+@shared_task(bind=True)
+def clean_soft_deleted_posts(self, threshold=None, totals=None, batch_size=PURGE_BATCH_SIZE):
     """
     Celery task to permanently delete posts that have been soft-deleted
     for more than 30 days.
+
+    Expired posts are purged in batches of batch_size, every batch (with its comment tree,
+    interactions, attachments and bookmarks) is deleted in short transactions of at most batch_size posts,
+    deepest comments first, so locks are held briefly and nothing is loaded in memory but ids.
+    When the soft time limit is hit the task re-queues itself with the same threshold and running totals.
     """
     from social_media.models import Post
+    from django.db import transaction
     from django.utils import timezone
+    from django.utils.dateparse import parse_datetime
     from datetime import timedelta
+    from celery.exceptions import SoftTimeLimitExceeded
+    import time
+
+    threshold_date = parse_datetime(threshold) if threshold else timezone.now() - timedelta(days=30)
+    totals = totals or {"batches": 0, "posts": 0, "comments": 0, "interactions": 0, "attachments": 0, "bookmarks": 0}
+    started = time.monotonic()
+
+    try:
+        while True:
+            # no ordering/offset needed: purged rows drop out of the filter
+            root_ids = list(
+                Post.objects.filter(deleted=True, updated_at__lt=threshold_date).values_list("id", flat=True)[:batch_size]
+            )
+            if not root_ids:
+                break
+
+            # collect the comment tree level by level (ids only)
+            levels = [root_ids]
+            while True:
+                children = []
+                for chunk in _chunks(levels[-1], batch_size):
+                    children += Post.objects.filter(parent_post_id__in=chunk).values_list("id", flat=True)
+                if not children:
+                    break
+                levels.append(children)
+
+            for depth, level in reversed(list(enumerate(levels))):
+                for chunk in _chunks(level, batch_size):
+                    with transaction.atomic():
+                        counts = _purge_posts(chunk)
+                    totals["comments" if depth else "posts"] += counts.pop("posts")
+                    for name, count in counts.items():
+                        totals[name] += count
+
+            totals["batches"] += 1
+            logger.info("clean_soft_deleted_posts progress: %s", totals)
+            if self.request.id:
+                self.update_state(state="PROGRESS", meta=totals)
 
-    threshold_date = timezone.now() - timedelta(days=30)
-    posts_to_delete = Post.objects.filter(deleted=True, updated_at__lt=threshold_date)
-    count = posts_to_delete.count()
-    posts_to_delete.delete()
-    msg = f"Deleted {count} soft-deleted posts older than 30 days."
+    except SoftTimeLimitExceeded:
+        logger.warning("clean_soft_deleted_posts hit its soft time limit, resuming in a new task: %s", totals)
+        clean_soft_deleted_posts.apply_async(
+            kwargs={"threshold": threshold_date.isoformat(), "totals": totals, "batch_size": batch_size}
+        )
+        return totals
+
+    if totals["posts"]:
+        from social_media.utils import cache_tag, invalidate_cache
+        invalidate_cache(cache_tag("PostNode"), cache_tag("InteractionNode"), cache_tag("PostMediaNode"), cache_tag("BookmarkNode"))
+
+    msg = (
+        f"Deleted {totals['posts']} soft-deleted posts older than 30 days "
+        f"({totals['comments']} comments, {totals['interactions']} interactions, {totals['attachments']} attachments, "
+        f"{totals['bookmarks']} bookmarks) in {totals['batches']} batches, {time.monotonic() - started:.1f}s."
+    )
     logger.info(msg)
     
-    return msg
\ No newline at end of file
+    return msg
+
+
+@shared_task
+def reconcile_post_counters(batch_size=1000):
+    """
+    Celery task to correct drifted engagement counters on Post.
+    Posts are walked in primary key batches, the real counts of every batch are computed
+    with one grouped query per counter and only the drifted rows are written back.
+    """
+    from social_media.models import Post, Interaction, Bookmark
+    from django.db.models import Count
+
+    counter_fields = ["like_count", "share_count", "comment_count", "bookmark_count"]
+    last_id = None
+    scanned = 0
+    fixed = 0
+
+    while True:
+        batch = Post.objects.order_by("id")
+        if last_id is not None:
+            batch = batch.filter(id__gt=last_id)
+        rows = list(batch.values("id", *counter_fields)[:batch_size])
+        if not rows:
+            break
+        ids = [row["id"] for row in rows]
+        last_id = ids[-1]
+        scanned += len(rows)
+
+        actual = {post_id: dict.fromkeys(counter_fields, 0) for post_id in ids}
+        interactions = (
+            Interaction.objects.filter(post_id__in=ids, type__in=list(Post.INTERACTION_COUNTERS))
+            .values_list("post_id", "type")
+            .annotate(total=Count("id"))
+        )
+        for post_id, type, total in interactions:
+            actual[post_id][Post.INTERACTION_COUNTERS[type]] = total
+        comments = (
+            Post.objects.filter(parent_post_id__in=ids, deleted=False)
+            .values_list("parent_post_id")
+            .annotate(total=Count("id"))
+        )
+        for post_id, total in comments:
+            actual[post_id]["comment_count"] = total
+        bookmarks = Bookmark.objects.filter(post_id__in=ids).values_list("post_id").annotate(total=Count("id"))
+        for post_id, total in bookmarks:
+            actual[post_id]["bookmark_count"] = total
+
+        for row in rows:
+            expected = actual[row["id"]]
+            drifted = {field: expected[field] for field in counter_fields if row[field] != expected[field]}
+            if drifted:
+                # only overwrite if the counters haven't moved since we read them
+                stale = {field: row[field] for field in drifted}
+                fixed += Post.objects.filter(id=row["id"], **stale).update(**drifted)
+
+    if fixed:
+        from social_media.utils import cache_tag, invalidate_cache
+        invalidate_cache(cache_tag("PostNode"))
+
+    msg = f"Reconciled post counters: scanned {scanned} posts, fixed {fixed}."
+    logger.info(msg)
+
+    return msg
+
+
+@shared_task
+def reconcile_follow_counters(batch_size=1000):
+    """
+    Celery task to correct drifted follower_count/following_count on Profile,
+    walked in primary key batches like reconcile_post_counters.
+    """
+    from social_media.models import Profile, Follow
+    from django.db.models import Count
+
+    counter_fields = ["follower_count", "following_count"]
+    last_id = None
+    scanned = 0
+    fixed = 0
+
+    while True:
+        batch = Profile.objects.order_by("id")
+        if last_id is not None:
+            batch = batch.filter(id__gt=last_id)
+        rows = list(batch.values("id", "user_id", *counter_fields)[:batch_size])
+        if not rows:
+            break
+        last_id = rows[-1]["id"]
+        scanned += len(rows)
+
+        user_ids = [row["user_id"] for row in rows]
+        actual = {user_id: dict.fromkeys(counter_fields, 0) for user_id in user_ids}
+        for field, column in (("follower_count", "user_id"), ("following_count", "followed_by_id")):
+            counts = Follow.objects.filter(**{column + "__in": user_ids}).values_list(column).annotate(total=Count("id"))
+            for user_id, total in counts:
+                actual[user_id][field] = total
+
+        for row in rows:
+            expected = actual[row["user_id"]]
+            drifted = {field: expected[field] for field in counter_fields if row[field] != expected[field]}
+            if drifted:
+                # only overwrite if the counters haven't moved since we read them
+                stale = {field: row[field] for field in drifted}
+                fixed += Profile.objects.filter(id=row["id"], **stale).update(**drifted)
+
+    if fixed:
+        from social_media.utils import cache_tag, invalidate_cache
+        invalidate_cache(cache_tag("ProfileNode"))
+
+    msg = f"Reconciled follow counters: scanned {scanned} profiles, fixed {fixed}."
+    logger.info(msg)
+
+    return msg
+
+
+@shared_task
+def fan_out_post_to_feeds(post_id):
+    """
+    Celery task to push a newly created post into the home feeds of the author's followers.
+    """
+    from social_media.models import Post
+    from social_media import feed
+
+    try:
+        post = Post.objects.get(id=post_id)
+    except Post.DoesNotExist:
+        return
+    if post.deleted or post.parent_post_id:
+        return
+    feed.fan_out_post(post)
+
+
+@shared_task
+def fan_out_posts_to_feeds(post_ids):
+    """
+    Celery task to push posts created in bulk (createPosts) into the home feeds, one fan-out per author.
+    """
+    from collections import defaultdict
+    from social_media.models import Post
+    from social_media import feed
+
+    posts_by_author = defaultdict(list)
+    for post in Post.objects.filter(id__in=post_ids, deleted=False, parent_post=None):
+        posts_by_author[post.author_id].append(post)
+    for author_id, posts in posts_by_author.items():
+        feed.fan_out_author_posts(author_id, posts)
+
+
+@shared_task
+def retract_post_from_feeds(post_id):
+    """
+    Celery task to remove a deleted post from the home feeds it was pushed to.
+    """
+    from social_media.models import Post
+    from social_media import feed
+
+    try:
+        post = Post.objects.get(id=post_id)
+    except Post.DoesNotExist:
+        return
+    feed.retract_post(post)
+
+
+@shared_task
+def add_author_to_home_feed(user_id, author_id):
+    """
+    Celery task to backfill the posts of a newly followed user into the follower's home feed.
+    """
+    from social_media import feed
+
+    feed.add_author_to_feed(user_id, author_id)
+
+
+@shared_task
+def add_authors_to_home_feed(user_id, author_ids):
+    """
+    Celery task to backfill the posts of several newly followed users (followMany) into the follower's home feed.
+    """
+    from social_media import feed
+
+    feed.add_authors_to_feed(user_id, author_ids)
+
+
+@shared_task
+def remove_author_from_home_feed(user_id, author_id):
+    """
+    Celery task to drop the posts of an unfollowed user from the home feed.
+    """
+    from social_media import feed
+
+    feed.remove_author_from_feed(user_id, author_id)
+
+
+@shared_task
+def compute_profile_suggestions():
+    """
+    Celery task to recompute the "people you may know" suggestions of every user (see recommendations.py).
+    """
+    from social_media import recommendations
+    import time
+
+    started = time.monotonic()
+    users = recommendations.compute_suggestions()
+
+    msg = f"Computed profile suggestions of {users} users in {time.monotonic() - started:.1f}s."
+    logger.info(msg)
+
+    return msg
+
+
+@shared_task
+def compute_trending_posts():
+    """
+    Celery task to recompute the trending posts set (see trending.py).
+    """
+    from social_media import trending
+
+    count = trending.compute_trending()
+
+    msg = f"Computed trending posts: {count} posts ranked."
+    logger.info(msg)
+
+    return msg
+
+
+@shared_task(time_limit=5 * 60, soft_time_limit=4 * 60)
+def process_post_media(media_ids):
+    """
+    Celery task filling in the MIME type and metadata (dimensions, EXIF, duration, thumbnails, blurhash)
+    of new attachments from the files themselves (see media.py). Routed to the media queue.
+    """
+    from social_media.models import PostMedia
+    from social_media.media import process_media
+    from social_media.utils import cache_tag, invalidate_cache
+
+    statuses = {}
+    for media in PostMedia.objects.filter(id__in=media_ids):
+        status = process_media(media).get("status")
+        statuses[status] = statuses.get(status, 0) + 1
+
+    if statuses:
+        invalidate_cache(cache_tag("PostMediaNode"), *[cache_tag("PostMediaNode", media_id) for media_id in media_ids])
+
+    msg = f"Processed {sum(statuses.values())} attachments: {statuses}."
+    logger.info(msg)
+
+    return msg
@@ -1,3 +1,1097 @@
-from django.test import TestCase
+import base64
+import json
+import os
+import shutil
+import struct
+import tempfile
+import time
+from datetime import timedelta
+from io import BytesIO, StringIO
+from unittest import skipUnless
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.db import IntegrityError, connection, transaction
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from django_redis import get_redis_connection
+from graphene import Node
+from graphql import GraphQLError, parse
+from graphql_jwt.settings import jwt_settings
+from graphql_jwt.shortcuts import get_token
+from PIL import Image
+
+from social_media import social_graph
+from social_media.complexity import plan_operations
+from social_media import trending
+from social_media.ids import uuid7
+from social_media.media import MediaError, read_media
+from social_media.models import Post, PostMedia, Interaction, Follow, Bookmark, Profile
+from social_media import persisted_queries
+from social_media.backend import CachedDocumentBackend, query_hash
+from social_media.pagination import decode_cursor, encode_cursor
+from social_media.schema import bulk_insert
+from social_media.tasks import process_post_media, reconcile_follow_counters, reconcile_post_counters
+from social_media.views import AsyncGraphQLView, CachedGraphQLView, metrics_view
+from social_media_project.schema import schema
+from user_management import backends
+
+
+User = get_user_model()
+
+SMALL, LARGE = 2, 10
+
+POST_FIELDS = """
+fragment PostFields on PostNode {
+  id content likes bookmarks commentCount
+  author { username profile { firstName } }
+  media { mediaUrl type }
+}
+"""
+
+ALL_POSTS = """
+query allPosts($first: Int!) {
+  allPosts(first: $first) {
+    edges { node { ...PostFields engagements { type } comments { id author { username } } } }
+  }
+}
+""" + POST_FIELDS
+
+ALL_PROFILES = """
+query allProfiles($first: Int!) {
+  allProfiles(first: $first) {
+    edges { node { firstName followerCount user { username } followers { id } following { id } mutualFollowers { id } } }
+  }
+}
+"""
+
+ALL_FOLLOWS = """
+query allFollows($first: Int!) {
+  allFollows(first: $first) {
+    edges { node { user { firstName user { username } } followedBy { firstName user { username } } } }
+  }
+}
+"""
+
+ALL_BOOKMARKS = """
+query allBookmarks($first: Int!) {
+  allBookmarks(first: $first) { edges { node { bookmarkedAt user { username } post { ...PostFields } } } }
+}
+""" + POST_FIELDS
+
+ALL_INTERACTIONS = """
+query allInteractions($first: Int!) {
+  allInteractions(first: $first) { edges { node { type user { username } post { ...PostFields } } } }
+}
+""" + POST_FIELDS
+
+PROFILE = """
+query profile($id: ID!) {
+  profile(id: $id) {
+    followerCount
+    followers { firstName user { username } }
+    following { firstName user { username } }
+    mutualFollowers { firstName user { username } }
+  }
+}
+"""
+
+POST = """
+query post($id: ID!) {
+  post(id: $id) {
+    ...PostFields
+    engagements { type }
+    comments { ...PostFields engagements { type } }
+  }
+}
+""" + POST_FIELDS
+
+THREAD = """
+query thread($rootId: ID!) {
+  thread(rootId: $rootId, maxDepth: 2, perLevel: 20) {
+    post { ...PostFields }
+    replies { post { ...PostFields } replies { post { ...PostFields } } }
+  }
+}
+""" + POST_FIELDS
+
+
+def edges(field):
+    return lambda data: len(data[field]["edges"])
+
+
+def redis_available():
+    try:
+        get_redis_connection("default").ping()
+    except Exception:
+        return False
+    return True
+
+
+# the tests of the redis structures run against the configured redis (REDIS_URL) when it is up
+REDIS_AVAILABLE = redis_available()
+
+
+def execute_as(user, query, **variables):
+    request = RequestFactory().post("/graphql")
+    request.user = user
+    return schema.execute(query, context_value=request, variables=variables)
+
+
+@override_settings(CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}})
+class QueryCountTests(TestCase):
+    """
+    The SQL run by an operation must not grow with the number of rows it returns (no N+1 in the resolvers):
+    every operation runs with SMALL and LARGE results and has to run the same number of queries.
+
+    Query counts and timings are written as JSON to $QUERY_COUNT_REPORT when it is set.
+    """
+
+    report = {}
+
+    @classmethod
+    def setUpTestData(cls):
+        def user(username):
+            # the post_save signals create the profile
+            created = User.objects.create_user(username, f"{username}@example.com", "password")
+            created.profile.first_name = username.capitalize()
+            created.profile.save()
+            return created
+
+        cls.viewer = user("viewer")
+        cls.users = [user(f"user{i}") for i in range(LARGE + 2)]
+        # popular follows and is followed by everyone, quiet by SMALL users
+        cls.popular, cls.quiet = user("popular"), user("quiet")
+        follows = []
+        for i, other in enumerate(cls.users):
+            follows += [Follow(user=cls.popular, followed_by=other), Follow(user=other, followed_by=cls.popular)]
+            follows.append(Follow(user=other, followed_by=cls.viewer))
+            if i < SMALL:
+                follows += [Follow(user=cls.quiet, followed_by=other), Follow(user=other, followed_by=cls.quiet)]
+        Follow.objects.bulk_create(follows)
+
+        cls.posts = [
+            Post.objects.create(content=f"Post {i}", author=author, is_published=True)
+            for i, author in enumerate(cls.users)
+        ]
+        # comments with replies under them, LARGE under the first post and SMALL under the second one
+        for post, count in ((cls.posts[0], LARGE), (cls.posts[1], SMALL)):
+            for i in range(count):
+                comment = Post.objects.create(content=f"Comment {i}", author=cls.users[i], parent_post=post)
+                Post.objects.create(content=f"Reply {i}", author=cls.users[-1], parent_post=comment)
+                Interaction.objects.create(user=cls.users[i], post=comment, type="LIKE")
+
+        for post in cls.posts:
+            PostMedia.objects.bulk_create([
+                PostMedia(post=post, media_url=f"https://example.com/{post.id}/{i}.jpg") for i in range(2)
+            ])
+            Interaction.objects.bulk_create(
+                [Interaction(user=other, post=post, type="LIKE") for other in cls.users[:3]]
+            )
+            Bookmark.objects.create(user=cls.viewer, post=post)
+
+    @classmethod
+    def tearDownClass(cls):
+        path = os.environ.get("QUERY_COUNT_REPORT")
+        if path:
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            with open(path, "w") as f:
+                json.dump(cls.report, f, indent=2, sort_keys=True)
+        super().tearDownClass()
+
+    def execute(self, query, variables):
+        request = RequestFactory().post("/graphql")
+        request.user = self.viewer
+        with CaptureQueriesContext(connection) as queries:
+            started = time.perf_counter()
+            result = schema.execute(query, context_value=request, variables=variables)
+            elapsed = time.perf_counter() - started
+        self.assertIsNone(result.errors, result.errors)
+        return result.data, len(queries), elapsed
+
+    def assertConstantQueries(self, name, query, small, large, rows):
+        """
+        Run query with the small and the large variables, check that rows(data) did grow
+        and the number of queries didn't.
+        """
+        # first run: one-off lookups (content types, sessions...) don't count
+        self.execute(query, small)
+        runs = {}
+        for size, variables in (("small", small), ("large", large)):
+            data, count, elapsed = self.execute(query, variables)
+            runs[size] = {"rows": rows(data), "queries": count, "ms": round(elapsed * 1000, 3)}
+        self.report[name] = runs
+
+        self.assertGreater(runs["large"]["rows"], runs["small"]["rows"], f"{name}: the large run returned no more rows")
+        self.assertEqual(
+            runs["small"]["queries"], runs["large"]["queries"],
+            f"{name}: {runs['small']['queries']} queries for {runs['small']['rows']} rows, "
+            f"{runs['large']['queries']} for {runs['large']['rows']}",
+        )
+
+    def test_all_posts(self):
+        self.assertConstantQueries("allPosts", ALL_POSTS, {"first": SMALL}, {"first": LARGE}, edges("allPosts"))
+
+    def test_all_profiles(self):
+        self.assertConstantQueries(
+            "allProfiles", ALL_PROFILES, {"first": SMALL}, {"first": LARGE}, edges("allProfiles")
+        )
+
+    def test_all_follows(self):
+        self.assertConstantQueries("allFollows", ALL_FOLLOWS, {"first": SMALL}, {"first": LARGE}, edges("allFollows"))
+
+    def test_all_bookmarks(self):
+        self.assertConstantQueries(
+            "allBookmarks", ALL_BOOKMARKS, {"first": SMALL}, {"first": LARGE}, edges("allBookmarks")
+        )
+
+    def test_all_interactions(self):
+        self.assertConstantQueries(
+            "allInteractions", ALL_INTERACTIONS, {"first": SMALL}, {"first": LARGE}, edges("allInteractions")
+        )
+
+    def test_profile_relations(self):
+        self.assertConstantQueries(
+            "profile",
+            PROFILE,
+            {"id": Node.to_global_id("ProfileNode", self.quiet.profile.id)},
+            {"id": Node.to_global_id("ProfileNode", self.popular.profile.id)},
+            lambda data: len(data["profile"]["followers"]),
+        )
+
+    def test_post_relations(self):
+        self.assertConstantQueries(
+            "post",
+            POST,
+            {"id": Node.to_global_id("PostNode", self.posts[1].id)},
+            {"id": Node.to_global_id("PostNode", self.posts[0].id)},
+            lambda data: len(data["post"]["comments"]),
+        )
+
+    def test_thread(self):
+        self.assertConstantQueries(
+            "thread",
+            THREAD,
+            {"rootId": Node.to_global_id("PostNode", self.posts[1].id)},
+            {"rootId": Node.to_global_id("PostNode", self.posts[0].id)},
+            lambda data: len(data["thread"]["replies"]),
+        )
+
+
+@override_settings(CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}})
+class FollowListTests(TestCase):
+    def test_first_followers(self):
+        followed = User.objects.create_user("followed", "followed@example.com", "password")
+        followers = [User.objects.create_user(f"follower{i}", f"follower{i}@example.com", "password") for i in range(4)]
+        for follower in followers:
+            Follow.objects.create(user=followed, followed_by=follower)
+        request = RequestFactory().post("/graphql")
+        request.user = followed
+        result = schema.execute(
+            "query profile($id: ID!) { profile(id: $id) { followers(first: 2) { user { username } } } }",
+            context_value=request,
+            variables={"id": Node.to_global_id("ProfileNode", followed.profile.id)},
+        )
+        self.assertIsNone(result.errors, result.errors)
+        self.assertEqual(
+            [profile["user"]["username"] for profile in result.data["profile"]["followers"]], ["follower3", "follower2"]
+        )
+
+    def test_newest_mutual_followers_first(self):
+        followed = User.objects.create_user("followed", "followed@example.com", "password")
+        friends = [User.objects.create_user(f"friend{i}", f"friend{i}@example.com", "password") for i in range(3)]
+        for friend in friends:
+            Follow.objects.create(user=followed, followed_by=friend)
+            Follow.objects.create(user=friend, followed_by=followed)
+        request = RequestFactory().post("/graphql")
+        request.user = followed
+        # no redis in the tests: the SQL path, the redis one reads the same follows
+        result = schema.execute(
+            "query profile($id: ID!) { profile(id: $id) { mutualFollowers(first: 2) { user { username } } } }",
+            context_value=request,
+            variables={"id": Node.to_global_id("ProfileNode", followed.profile.id)},
+        )
+        self.assertIsNone(result.errors, result.errors)
+        self.assertEqual(
+            [profile["user"]["username"] for profile in result.data["profile"]["mutualFollowers"]], ["friend2", "friend1"]
+        )
+
+    def test_cost_follows_first(self):
+        plans = plan_operations(schema, parse("""
+            query followers($first: Int) { profile(id: "x") { followers(first: $first) { id } following { id } } }
+        """))
+        # profile + first followers + the 50 following by default
+        self.assertEqual(plans["followers"].cost({"first": 10}), 1 + 10 + 50)
+        self.assertEqual(plans["followers"].cost({}), 1 + 50 + 50)
+
+    def test_negative_first_costs_nothing(self):
+        plans = plan_operations(schema, parse("""
+            query cheap { profile(id: "x") { followers(first: -999999) { id } following(first: 10) { id } } }
+        """))
+        self.assertEqual(plans["cheap"].cost({}), 1 + 0 + 10)
+        plans = plan_operations(schema, parse("""
+            query cheap($first: Int = -5) { profile(id: "x") { followers(first: $first) { id } } }
+        """))
+        self.assertEqual(plans["cheap"].cost({}), 1)
+        self.assertEqual(plans["cheap"].cost({"first": -5}), 1)
+
+
+class ThreadTests(TestCase):
+    def test_deleted_reply(self):
+        user = User.objects.create_user("threader", "threader@example.com", "password")
+        root = Post.objects.create(content="Root", author=user, is_published=True)
+        replies = [Post.objects.create(content=f"Reply {i}", author=user, parent_post=root) for i in range(3)]
+        # what DeletePost does to the oldest reply
+        Post.objects.filter(pk=replies[0].pk).update(deleted=True)
+        Post.objects.filter(pk=root.pk).update(comment_count=2)
+
+        request = RequestFactory().post("/graphql")
+        request.user = user
+        result = schema.execute(
+            "query thread($rootId: ID!) { thread(rootId: $rootId, perLevel: 2) { hasMoreReplies replies { post { id } } } }",
+            context_value=request,
+            variables={"rootId": Node.to_global_id("PostNode", root.id)},
+        )
+        self.assertIsNone(result.errors, result.errors)
+        self.assertEqual(
+            [reply["post"]["id"] for reply in result.data["thread"]["replies"]],
+            [Node.to_global_id("PostNode", reply.id) for reply in replies[1:]],
+        )
+        self.assertFalse(result.data["thread"]["hasMoreReplies"])
+
+    def test_invalid_root_id(self):
+        user = User.objects.create_user("threader", "threader@example.com", "password")
+        request = RequestFactory().post("/graphql")
+        request.user = user
+        for root_id in ("not a global id", Node.to_global_id("PostNode", "not-a-uuid")):
+            result = schema.execute(
+                "query thread($rootId: ID!) { thread(rootId: $rootId) { post { id } } }",
+                context_value=request,
+                variables={"rootId": root_id},
+            )
+            self.assertEqual([error.message for error in result.errors], ["Post not found."])
+
+
+class BulkInsertTests(TestCase):
+    def test_row_inserted_concurrently(self):
+        user = User.objects.create_user("bulker", "bulker@example.com", "password")
+        posts = [Post.objects.create(content=f"Post {i}", author=user, is_published=True) for i in range(2)]
+        # inserted by another request after this one looked for existing bookmarks
+        Bookmark.objects.create(user=user, post=posts[0])
+        global_ids = [Node.to_global_id("PostNode", post.id) for post in posts]
+
+        results, created = bulk_insert(
+            Bookmark,
+            global_ids,
+            targets=lambda pks: set(pks),
+            existing=lambda pks: set(),
+            build=lambda pk: Bookmark(user=user, post_id=pk),
+            not_found="Post not found.",
+        )
+        self.assertEqual(created, [posts[1].id])
+        self.assertEqual([(result.success, result.created) for result in results], [(True, False), (True, True)])
+        self.assertEqual(Bookmark.objects.filter(user=user).count(), 2)
+
+
+@override_settings(CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}})
+class CreatePostsTests(TestCase):
+    CREATE_POSTS = "mutation createPosts($posts: [PostInput!]!) { createPosts(posts: $posts) { posts { id } } }"
+
+    def setUp(self):
+        self.user = User.objects.create_user("poster", "poster@example.com", "password")
+        self.parent = Post.objects.create(content="Parent", author=self.user, is_published=True)
+
+    def create_posts(self, posts):
+        request = RequestFactory().post("/graphql")
+        request.user = self.user
+        return schema.execute(self.CREATE_POSTS, context_value=request, variables={"posts": posts})
+
+    def test_comments(self):
+        parent_id = Node.to_global_id("PostNode", self.parent.id)
+        result = self.create_posts([
+            {"content": "First", "parentPostId": parent_id},
+            {"content": "Second", "parentPostId": parent_id},
+        ])
+        self.assertIsNone(result.errors, result.errors)
+        self.parent.refresh_from_db()
+        self.assertEqual(self.parent.comment_count, 2)
+        self.assertEqual(Post.objects.filter(root_post=self.parent, depth=1).count(), 2)
+
+    def test_invalid_parent(self):
+        for parent_id in ("not a global id", Node.to_global_id("PostNode", "not-a-uuid")):
+            result = self.create_posts([{"content": "Orphan", "parentPostId": parent_id}])
+            self.assertEqual([error.message for error in result.errors], ["Parent post not found."])
+        self.assertEqual(Post.objects.count(), 1)
+
+
+@override_settings(CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}})
+class PostCounterTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user("counter", "counter@example.com", "password")
+        self.post = Post.objects.create(content="Counted", author=self.user, is_published=True)
+        self.post_id = Node.to_global_id("PostNode", self.post.id)
+
+    def counters(self):
+        self.post.refresh_from_db()
+        return self.post.like_count, self.post.share_count, self.post.comment_count, self.post.bookmark_count
+
+    def test_mutations_bump_counters(self):
+        for mutation in (
+            'mutation($id: ID!) { createInteraction(postId: $id, type: "LIKE") { interaction { id } } }',
+            'mutation($id: ID!) { createInteraction(postId: $id, type: "SHARE") { interaction { id } } }',
+            "mutation($id: ID!) { addPostToBookmark(postId: $id) { success } }",
+            'mutation($id: ID!) { createPost(content: "Comment", parentPostId: $id) { post { id } } }',
+        ):
+            result = execute_as(self.user, mutation, id=self.post_id)
+            self.assertIsNone(result.errors, result.errors)
+        self.assertEqual(self.counters(), (1, 1, 1, 1))
+
+        result = execute_as(self.user, "mutation($id: ID!) { addPostToBookmark(postId: $id) { success } }", id=self.post_id)
+        self.assertEqual([error.message for error in result.errors], ["Post already bookmarked."])
+        for mutation in (
+            'mutation($id: ID!) { deleteInteraction(postId: $id, type: "SHARE") { success } }',
+            "mutation($id: ID!) { removePostFromBookmark(postId: $id) { success } }",
+        ):
+            result = execute_as(self.user, mutation, id=self.post_id)
+            self.assertIsNone(result.errors, result.errors)
+        self.assertEqual(self.counters(), (1, 0, 1, 0))
+
+    def test_counters_never_go_below_zero(self):
+        Post.bump_counter(self.post.id, "like_count", -1)
+        Post.bump_counters("share_count", {self.post.id: -3})
+        self.assertEqual(self.counters(), (0, 0, 0, 0))
+
+    def test_reconcile(self):
+        Interaction.objects.create(user=self.user, post=self.post, type="LIKE")
+        Post.objects.create(content="Deleted comment", author=self.user, parent_post=self.post, deleted=True)
+        Post.objects.filter(pk=self.post.pk).update(like_count=5, comment_count=1, bookmark_count=2)
+
+        self.assertIn("fixed 1", reconcile_post_counters(batch_size=1))
+        self.assertEqual(self.counters(), (1, 0, 0, 0))
+        self.assertIn("fixed 0", reconcile_post_counters())
+
+
+@override_settings(CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}})
+class PersistedQueryTests(TestCase):
+    QUERY = "query typename { __typename }"
+
+    def setUp(self):
+        cache.clear()
+        persisted_queries._local_queries.clear()
+
+    def post(self, persisted_query, query=None):
+        body = {"extensions": {"persistedQuery": persisted_query}}
+        if query is not None:
+            body["query"] = query
+        request = RequestFactory().post("/graphql", data=json.dumps(body), content_type="application/json")
+        request.user = AnonymousUser()
+        response = CachedGraphQLView.as_view()(request)
+        return response.status_code, json.loads(response.content)
+
+    def error_code(self, body):
+        return body["errors"][0]["extensions"]["code"]
+
+    def test_register_then_hash_only(self):
+        persisted_query = {"version": 1, "sha256Hash": query_hash(self.QUERY)}
+        status, body = self.post(persisted_query)
+        self.assertEqual((status, self.error_code(body)), (200, "PERSISTED_QUERY_NOT_FOUND"))
+
+        status, body = self.post(persisted_query, self.QUERY)
+        self.assertEqual((status, body["data"]), (200, {"__typename": "Query"}))
+        # another worker: only the shared cache has it
+        persisted_queries._local_queries.clear()
+        status, body = self.post(persisted_query)
+        self.assertEqual((status, body["data"]), (200, {"__typename": "Query"}))
+
+    def test_protocol_errors(self):
+        sha256_hash = query_hash(self.QUERY)
+        for persisted_query, query, code in (
+            ({"version": 2, "sha256Hash": sha256_hash}, None, "PERSISTED_QUERY_NOT_SUPPORTED"),
+            ({"version": 1, "sha256Hash": "abc"}, None, "BAD_REQUEST"),
+            ({"version": 1, "sha256Hash": sha256_hash}, "query other { __typename }", "BAD_REQUEST"),
+        ):
+            status, body = self.post(persisted_query, query)
+            self.assertEqual((status, self.error_code(body)), (400, code))
+        self.assertIsNone(persisted_queries.get_persisted_query(sha256_hash))
+
+
+class CachedDocumentBackendTests(SimpleTestCase):
+    def test_documents_are_cached(self):
+        backend = CachedDocumentBackend(cache_size=2)
+        document = backend.document_from_string(schema, "{ __typename }")
+        self.assertIs(backend.document_from_string(schema, "{ __typename }"), document)
+
+        backend.document_from_string(schema, "query a { __typename }")
+        backend.document_from_string(schema, "query b { __typename }")
+        # least recently used, evicted
+        self.assertIsNot(backend.document_from_string(schema, "{ __typename }"), document)
+
+    def test_invalid_document(self):
+        backend = CachedDocumentBackend()
+        document = backend.document_from_string(schema, "{ unknownField }")
+        self.assertIs(backend.document_from_string(schema, "{ unknownField }"), document)
+        result = document.execute()
+        self.assertTrue(result.invalid)
+        self.assertIn("unknownField", result.errors[0].message)
+        with self.assertRaises(GraphQLError):
+            backend.document_from_string(schema, "{ syntax error")
+
+
+@override_settings(
+    CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}},
+    GRAPHQL_RESPONSE_CACHE_TIMEOUT=0,
+)
+class AsyncGraphQLViewTests(TransactionTestCase):
+    """
+    The root fields run in worker threads with their own connections: the rows must be committed.
+    """
+
+    def setUp(self):
+        cache.clear()
+        backends._local_tokens.clear()
+        self.user = User.objects.create_user("async", "async@example.com", "password")
+        self.posts = [Post.objects.create(content=f"Post {i}", author=self.user, is_published=True) for i in range(3)]
+
+    async def post(self, query, **variables):
+        request = RequestFactory().post(
+            "/graphql",
+            data=json.dumps({"query": query, "variables": variables}),
+            content_type="application/json",
+            HTTP_AUTHORIZATION=f"{jwt_settings.JWT_AUTH_HEADER_PREFIX} {get_token(self.user)}",
+        )
+        request.user = AnonymousUser()
+        response = await AsyncGraphQLView.as_view(backend=CachedDocumentBackend())(request)
+        return response.status_code, json.loads(response.content)
+
+    async def test_root_fields_run_concurrently(self):
+        status, body = await self.post("""
+            query both($id: ID!) {
+              allPosts(first: 10) { edges { node { content } } }
+              post(id: $id) { content author { username } }
+            }
+        """, id=Node.to_global_id("PostNode", self.posts[0].id))
+        self.assertEqual(status, 200)
+        self.assertNotIn("errors", body)
+        self.assertEqual(len(body["data"]["allPosts"]["edges"]), 3)
+        self.assertEqual(body["data"]["post"], {"content": "Post 0", "author": {"username": "async"}})
+
+    async def test_failing_root_field(self):
+        status, body = await self.post("""
+            query partial { thread(rootId: "bad") { post { id } } allPosts(first: 10) { edges { node { id } } } }
+        """)
+        self.assertEqual(status, 200)
+        self.assertIsNone(body["data"]["thread"])
+        self.assertEqual(len(body["data"]["allPosts"]["edges"]), 3)
+        self.assertEqual([error["message"] for error in body["errors"]], ["Post not found."])
+
+    async def test_invalid_query(self):
+        status, body = await self.post("query invalid { unknownField }")
+        self.assertEqual(status, 400)
+        self.assertIn("unknownField", body["errors"][0]["message"])
+        self.assertNotIn("data", body)
+
+    async def test_mutation_runs_through_the_sync_view(self):
+        status, body = await self.post(
+            'mutation like($id: ID!) { createInteraction(postId: $id, type: "LIKE") { interaction { type } } }',
+            id=Node.to_global_id("PostNode", self.posts[1].id),
+        )
+        self.assertEqual((status, body["data"]), (200, {"createInteraction": {"interaction": {"type": "LIKE"}}}))
+        self.assertEqual(await Interaction.objects.filter(post=self.posts[1]).acount(), 1)
+
+
+@override_settings(CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}})
+class LikeTests(TestCase):
+    LIKE = 'mutation like($id: ID!) { createInteraction(postId: $id, type: "LIKE") { interaction { id } } }'
+
+    def setUp(self):
+        self.user = User.objects.create_user("liker", "liker@example.com", "password")
+        self.post = Post.objects.create(content="Liked", author=self.user, is_published=True)
+
+    def test_like_is_idempotent(self):
+        like, created = Interaction.like(self.user, self.post.id)
+        self.assertTrue(created)
+        again, created = Interaction.like(self.user, self.post.id)
+        self.assertEqual((again, created), (like, False))
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.like_count, 1)
+        self.assertEqual(Interaction.objects.filter(post=self.post, type="LIKE").count(), 1)
+
+    def test_missing_posts(self):
+        self.assertEqual(Interaction.like(self.user, uuid7()), (None, False))
+        Post.objects.filter(pk=self.post.pk).update(deleted=True)
+        self.assertEqual(Interaction.like(self.user, self.post.id), (None, False))
+        self.assertFalse(Interaction.objects.exists())
+
+        for post_id in (Node.to_global_id("PostNode", self.post.id), "not a global id", Node.to_global_id("PostNode", "1")):
+            result = execute_as(self.user, self.LIKE, id=post_id)
+            self.assertEqual([error.message for error in result.errors], ["Post not found."])
+
+    def test_unique_like_constraint(self):
+        Interaction.objects.create(user=self.user, post=self.post, type="LIKE")
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Interaction.objects.create(user=self.user, post=self.post, type="LIKE")
+        # only likes are unique
+        Interaction.objects.create(user=self.user, post=self.post, type="SHARE")
+        Interaction.objects.create(user=self.user, post=self.post, type="SHARE")
+
+
+@override_settings(CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}})
+class FollowCounterTests(TestCase):
+    FOLLOW = "mutation follow($username: String!) { followUser(usernameToFollow: $username) { success } }"
+    UNFOLLOW = "mutation unfollow($username: String!) { unfollowUser(usernameToUnfollow: $username) { success } }"
+
+    def setUp(self):
+        self.users = [User.objects.create_user(f"user{i}", f"user{i}@example.com", "password") for i in range(3)]
+
+    def counts(self, user):
+        profile = Profile.objects.get(user=user)
+        return profile.follower_count, profile.following_count
+
+    def test_follow_unfollow(self):
+        follower, followed = self.users[:2]
+        # on commit: the social graph sets, without redis the failure is only logged
+        with self.captureOnCommitCallbacks(execute=True):
+            for _ in range(2):
+                result = execute_as(follower, self.FOLLOW, username="user1")
+                self.assertIsNone(result.errors, result.errors)
+        self.assertEqual((self.counts(follower), self.counts(followed)), ((0, 1), (1, 0)))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            result = execute_as(follower, self.UNFOLLOW, username="user1")
+        self.assertIsNone(result.errors, result.errors)
+        self.assertEqual((self.counts(follower), self.counts(followed)), ((0, 0), (0, 0)))
+
+        for query, username, message in (
+            (self.UNFOLLOW, "user1", "You weren't following the user"),
+            (self.FOLLOW, "user0", "You cannot follow yourself."),
+            (self.FOLLOW, "nobody", "User to follow not found."),
+        ):
+            result = execute_as(follower, query, username=username)
+            self.assertEqual([error.message for error in result.errors], [message])
+        self.assertEqual((self.counts(follower), self.counts(followed)), ((0, 0), (0, 0)))
+
+    def test_follow_many(self):
+        user_ids = [Node.to_global_id("UserNode", user.id) for user in self.users]
+        result = execute_as(
+            self.users[0],
+            "mutation followMany($ids: [ID!]!) { followMany(userIds: $ids) { results { success created error } } }",
+            ids=user_ids + user_ids[1:2],
+        )
+        self.assertIsNone(result.errors, result.errors)
+        self.assertEqual(
+            [(item["success"], item["created"]) for item in result.data["followMany"]["results"]],
+            [(False, False), (True, True), (True, True), (True, False)],
+        )
+        self.assertEqual([self.counts(user) for user in self.users], [(0, 2), (1, 0), (1, 0)])
+
+    def test_reconcile(self):
+        Follow.objects.create(user=self.users[1], followed_by=self.users[0])
+        Profile.objects.filter(user=self.users[0]).update(following_count=4, follower_count=2)
+        self.assertIn("fixed 2", reconcile_follow_counters(batch_size=1))
+        self.assertEqual([self.counts(user) for user in self.users], [(0, 1), (1, 0), (0, 0)])
+
+
+@skipUnless(REDIS_AVAILABLE, "redis is not available")
+class SocialGraphSetTests(TestCase):
+    def setUp(self):
+        self.a, self.b, self.c = [User.objects.create_user(name, f"{name}@example.com", "password") for name in "abc"]
+        Follow.objects.bulk_create([
+            Follow(user=self.a, followed_by=self.b),
+            Follow(user=self.b, followed_by=self.a),
+            Follow(user=self.a, followed_by=self.c),
+        ])
+        self.redis = get_redis_connection("default")
+
+    def tearDown(self):
+        for user in (self.a, self.b, self.c):
+            self.redis.delete(social_graph.followers_key(user.id), social_graph.following_key(user.id))
+
+    def members(self, key):
+        return {member.decode() for member in self.redis.smembers(key)}
+
+    def test_sets_built_from_the_database(self):
+        self.assertEqual(social_graph.mutual_follower_ids([self.a.id, self.c.id]), {self.a.id: [str(self.b.id)], self.c.id: []})
+        self.assertEqual(
+            self.members(social_graph.followers_key(self.a.id)), {social_graph.EMPTY_MARKER, str(self.b.id), str(self.c.id)}
+        )
+        # kept alive by the marker, expiring
+        self.assertEqual(self.members(social_graph.followers_key(self.c.id)), {social_graph.EMPTY_MARKER})
+        self.assertGreater(self.redis.ttl(social_graph.followers_key(self.a.id)), 0)
+
+    def test_updates_only_existing_sets(self):
+        social_graph.ensure_sets([self.a.id, self.b.id])
+        Follow.objects.create(user=self.c, followed_by=self.a)
+        social_graph.add_follows(self.a.id, [self.c.id])
+        self.assertIn(str(self.c.id), self.members(social_graph.following_key(self.a.id)))
+        # missing sets are left to be built from the database, never created partial
+        self.assertFalse(self.redis.exists(social_graph.followers_key(self.c.id)))
+        self.assertEqual(
+            sorted(social_graph.mutual_follower_ids([self.a.id])[self.a.id]), sorted([str(self.b.id), str(self.c.id)])
+        )
+
+        self.redis.delete(social_graph.following_key(self.a.id))
+        social_graph.remove_follows(self.a.id, [self.b.id])
+        self.assertFalse(self.redis.exists(social_graph.following_key(self.a.id)))
+        self.assertEqual(self.members(social_graph.followers_key(self.b.id)), {social_graph.EMPTY_MARKER})
+
+
+class TrendingTests(TestCase):
+    TRENDING = """
+    query trending($first: Int, $after: String, $last: Int) {
+      trendingPosts(first: $first, after: $after, last: $last) {
+        edges { node { content } }
+        pageInfo { hasNextPage endCursor }
+      }
+    }
+    """
+
+    def setUp(self):
+        self.user = User.objects.create_user("trender", "trender@example.com", "password")
+        # on the hour: the interactions are bucketed by hour, aged from the middle of their bucket
+        self.now = timezone.now().replace(minute=0, second=0, microsecond=0)
+        self.posts = [Post.objects.create(content=f"Post {i}", author=self.user, is_published=True) for i in range(4)]
+
+    def interact(self, post, type, hours_ago, count=1):
+        names = [f"fan{uuid7().hex}" for _ in range(count)]
+        users = [User.objects.create_user(name, f"{name}@example.com", "password") for name in names]
+        interactions = Interaction.objects.bulk_create([Interaction(user=user, post=post, type=type) for user in users])
+        Interaction.objects.filter(pk__in=[interaction.pk for interaction in interactions]).update(
+            created_at=self.now - timedelta(hours=hours_ago)
+        )
+
+    def test_scores(self):
+        self.interact(self.posts[0], "LIKE", 1, count=2)
+        # a half life older but weighted 3 times more: 2 shares still beat 2 likes
+        self.interact(self.posts[1], "SHARE", 7, count=2)
+        # out of the window
+        self.interact(self.posts[2], "SHARE", 49, count=5)
+        # deleted posts and comments never trend
+        self.interact(self.posts[3], "LIKE", 1, count=3)
+        Post.objects.filter(pk=self.posts[3].pk).update(deleted=True)
+        comment = Post.objects.create(content="Comment", author=self.user, parent_post=self.posts[0])
+        self.interact(comment, "LIKE", 1, count=3)
+
+        scores = trending.trending_scores(self.now)
+        self.assertEqual(set(scores), {self.posts[0].id, self.posts[1].id})
+        self.assertAlmostEqual(scores[self.posts[0].id], 2 * 0.5 ** (0.5 / 6))
+        self.assertAlmostEqual(scores[self.posts[1].id], 2 * 3 * 0.5 ** (6.5 / 6))
+        self.assertGreater(scores[self.posts[1].id], scores[self.posts[0].id])
+
+    @override_settings(CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}})
+    def test_without_redis(self):
+        self.assertEqual(trending.get_trending_posts(), ([], 0))
+        result = execute_as(self.user, self.TRENDING, first=10)
+        self.assertIsNone(result.errors, result.errors)
+        self.assertEqual(result.data["trendingPosts"]["edges"], [])
+
+    @override_settings(CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}})
+    def test_backward_pagination(self):
+        result = execute_as(self.user, self.TRENDING, last=10)
+        self.assertEqual(
+            [error.message for error in result.errors], ["trendingPosts can only be paginated forwards with first/after."]
+        )
+
+    @skipUnless(REDIS_AVAILABLE, "redis is not available")
+    def test_pages(self):
+        redis = get_redis_connection("default")
+        self.addCleanup(redis.delete, trending.TRENDING_KEY)
+        for hours_ago, post in enumerate(self.posts[:3]):
+            self.interact(post, "LIKE", hours_ago + 1, count=2)
+        self.assertEqual(trending.compute_trending(self.now), 3)
+        Post.objects.filter(pk=self.posts[1].pk).update(deleted=True)
+
+        with override_settings(GRAPHQL_RESPONSE_CACHE_TIMEOUT=0):
+            result = execute_as(self.user, self.TRENDING, first=2)
+            self.assertIsNone(result.errors, result.errors)
+            page = result.data["trendingPosts"]
+            # deleted since the set was computed: left out of its page
+            self.assertEqual([edge["node"]["content"] for edge in page["edges"]], ["Post 0"])
+            self.assertTrue(page["pageInfo"]["hasNextPage"])
+            result = execute_as(self.user, self.TRENDING, first=2, after=page["pageInfo"]["endCursor"])
+            self.assertEqual([edge["node"]["content"] for edge in result.data["trendingPosts"]["edges"]], ["Post 2"])
+            self.assertFalse(result.data["trendingPosts"]["pageInfo"]["hasNextPage"])
+
+
+class CursorTests(SimpleTestCase):
+    def test_round_trip(self):
+        post = Post(content="Post")
+        self.assertEqual(decode_cursor(encode_cursor(0.5, post.id)), (0.5, post.id))
+
+    def test_invalid_cursors(self):
+        crafted = [
+            "not base64!",
+            base64.b64encode(b'offset:[1, "x"]').decode(),
+            base64.b64encode(b'keyset:[0.5, "not-a-uuid"]').decode(),
+            base64.b64encode(b'keyset:[0.5, 42]').decode(),
+            base64.b64encode(b'keyset:["not a date", "%s"]' % str(Post().id).encode()).decode(),
+        ]
+        for cursor in crafted:
+            with self.subTest(cursor=cursor), self.assertRaisesMessage(GraphQLError, "Invalid cursor."):
+                decode_cursor(cursor)
+
+
+@override_settings(CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}})
+class KeysetPaginationTests(TestCase):
+    PAGE = """
+    query allPosts($first: Int, $last: Int, $after: String, $before: String) {
+      allPosts(first: $first, last: $last, after: $after, before: $before) {
+        edges { node { content } }
+        pageInfo { hasNextPage hasPreviousPage startCursor endCursor }
+      }
+    }
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user("pager", "pager@example.com", "password")
+        posts = [Post.objects.create(content=f"Post {i}", author=cls.user, is_published=True) for i in range(7)]
+        # rows sharing a created_at are ordered by id, the pages must not skip or repeat them
+        Post.objects.filter(id__in=[post.id for post in posts[2:5]]).update(created_at=posts[2].created_at)
+        cls.newest_first = [f"Post {i}" for i in reversed(range(7))]
+
+    def page(self, **variables):
+        result = execute_as(self.user, self.PAGE, **variables)
+        self.assertIsNone(result.errors)
+        connection = result.data["allPosts"]
+        return [edge["node"]["content"] for edge in connection["edges"]], connection["pageInfo"]
+
+    def test_forwards(self):
+        seen, after = [], None
+        while True:
+            contents, page_info = self.page(first=2, after=after)
+            seen += contents
+            if not page_info["hasNextPage"]:
+                break
+            after = page_info["endCursor"]
+        self.assertEqual(seen, self.newest_first)
+
+    def test_backwards(self):
+        seen, before = [], None
+        while True:
+            contents, page_info = self.page(last=2, before=before)
+            seen = contents + seen
+            if not page_info["hasPreviousPage"]:
+                break
+            before = page_info["startCursor"]
+        self.assertEqual(seen, self.newest_first)
+
+    def test_invalid_cursor(self):
+        result = execute_as(self.user, self.PAGE, first=2, after="not a cursor")
+        self.assertEqual([error.message for error in result.errors], ["Invalid cursor."])
+
+
+@override_settings(
+    CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}},
+    GRAPHQL_RESPONSE_CACHE_TIMEOUT=60,
+)
+class ResponseCacheScopeTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        backends._local_tokens.clear()
+
+    def bookmark_count(self, user):
+        request = RequestFactory().post(
+            "/graphql",
+            data=json.dumps({"query": "query allBookmarks { allBookmarks(first: 10) { edges { node { id } } } }"}),
+            content_type="application/json",
+            HTTP_AUTHORIZATION=f"{jwt_settings.JWT_AUTH_HEADER_PREFIX} {get_token(user)}",
+        )
+        request.user = AnonymousUser()
+        response = CachedGraphQLView.as_view()(request)
+        return len(json.loads(response.content)["data"]["allBookmarks"]["edges"])
+
+    def test_taken_over_username(self):
+        owner = User.objects.create_user("owner", "owner@example.com", "password")
+        Bookmark.objects.create(user=owner, post=Post.objects.create(content="Post", author=owner, is_published=True))
+        self.assertEqual(self.bookmark_count(owner), 1)
+
+        owner.username = "renamed"
+        owner.save()
+        newcomer = User.objects.create_user("owner", "newcomer@example.com", "password")
+        # the cached bookmarks of the previous owner of the username must not be served
+        self.assertEqual(self.bookmark_count(newcomer), 0)
+
+
+@override_settings(
+    CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}},
+    GRAPHQL_RESPONSE_CACHE_TIMEOUT=60,
+)
+class ResponseCacheInvalidationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        backends._local_tokens.clear()
+        self.user = User.objects.create_user("author", "author@example.com", "password")
+
+    def post(self, query):
+        request = RequestFactory().post(
+            "/graphql",
+            data=json.dumps({"query": query}),
+            content_type="application/json",
+            HTTP_AUTHORIZATION=f"{jwt_settings.JWT_AUTH_HEADER_PREFIX} {get_token(self.user)}",
+        )
+        request.user = AnonymousUser()
+        return json.loads(CachedGraphQLView.as_view()(request).content)
+
+    def contents(self):
+        data = self.post("query allPosts { allPosts(first: 10) { edges { node { content } } } }")["data"]
+        return [edge["node"]["content"] for edge in data["allPosts"]["edges"]]
+
+    def test_cached_until_invalidated(self):
+        Post.objects.create(content="First", author=self.user, is_published=True)
+        self.assertEqual(self.contents(), ["First"])
+
+        # a write that skips the mutations leaves the cached response in place
+        Post.objects.create(content="Unseen", author=self.user, is_published=True)
+        self.assertEqual(self.contents(), ["First"])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            body = self.post('mutation { createPost(content: "Second", isPublished: true) { post { id } } }')
+        self.assertNotIn("errors", body)
+        self.assertEqual(self.contents(), ["Second", "Unseen", "First"])
+
+
+class ExplainResolversTests(TestCase):
+    def test_explains_every_field(self):
+        user = User.objects.create_user("explainer", "explainer@example.com", "password")
+        Post.objects.create(content="A post to search for", author=user, is_published=True)
+        out = StringIO()
+        call_command("explain_resolvers", stdout=out)
+        output = out.getvalue()
+        for name in ("all_posts", "search_posts", "search_profiles", "home_feed_rebuild"):
+            self.assertIn(f"== {name}\n", output)
+        self.assertNotIn("skipped (requires arguments)", output)
+
+
+@override_settings(
+    CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}},
+    GRAPHQL_METRICS_TOKEN=None,
+)
+class MetricsViewTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        backends._local_tokens.clear()
+
+    def get(self, authorization=None):
+        headers = {"HTTP_AUTHORIZATION": authorization} if authorization else {}
+        request = RequestFactory().get("/metrics", **headers)
+        request.user = AnonymousUser()
+        return metrics_view(request)
+
+    def test_denied_without_token(self):
+        self.assertEqual(self.get().status_code, 403)
+        user = User.objects.create_user("viewer", "viewer@example.com", "password")
+        self.assertEqual(self.get(f"{jwt_settings.JWT_AUTH_HEADER_PREFIX} {get_token(user)}").status_code, 403)
+
+        user.is_staff = True
+        user.save()
+        # 503 without redis, past the permission check
+        self.assertNotEqual(self.get(f"{jwt_settings.JWT_AUTH_HEADER_PREFIX} {get_token(user)}").status_code, 403)
+
+    @override_settings(GRAPHQL_METRICS_TOKEN="secret")
+    def test_token(self):
+        self.assertEqual(self.get().status_code, 403)
+        self.assertEqual(self.get("Bearer wrong").status_code, 403)
+        self.assertNotEqual(self.get("Bearer secret").status_code, 403)
+
+
+class ReadMediaTests(SimpleTestCase):
+    def test_private_hosts(self):
+        for url in ("http://127.0.0.1/a.jpg", "http://localhost:8000/a.jpg", "https://[::1]/a.jpg"):
+            with self.assertRaisesMessage(MediaError, "Media host is not public."):
+                read_media(url)
+
+    def test_unsupported_urls(self):
+        for url in ("ftp://example.com/a.jpg", "file:///etc/passwd", "http:///a.jpg"):
+            with self.assertRaisesMessage(MediaError, "Unsupported media url."):
+                read_media(url)
+
+
+def box(box_type, payload):
+    return struct.pack(">I4s", 8 + len(payload), box_type) + payload
+
+
+@override_settings(
+    CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}},
+    MEDIA_THUMBNAIL_SIZES=[40, 100],
+)
+class MediaPipelineTests(TestCase):
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        media_settings = override_settings(MEDIA_ROOT=media_root)
+        media_settings.enable()
+        self.addCleanup(media_settings.disable)
+
+        user = User.objects.create_user("uploader", "uploader@example.com", "password")
+        self.post = Post.objects.create(content="Attachments", author=user, is_published=True)
+
+    def attach(self, name, data, **fields):
+        if data is not None:
+            default_storage.save(name, ContentFile(data))
+        return PostMedia.objects.create(post=self.post, media_url=f"http://testserver/media/{name}", **fields)
+
+    def process(self, media):
+        process_post_media([str(media.id)])
+        media.refresh_from_db()
+        return media
+
+    def image(self, format, size=(64, 32), frames=None):
+        buffer = BytesIO()
+        if frames:
+            images = [Image.new("RGB", size, color) for color in frames]
+            images[0].save(buffer, format, save_all=True, append_images=images[1:], duration=200, loop=0)
+        else:
+            Image.new("RGB", size, "red").save(buffer, format)
+        return buffer.getvalue()
+
+    def test_photo(self):
+        media = self.process(self.attach("photo.png", self.image("PNG", (200, 100)), type="VIDEO", metadata={"alt": "Red"}))
+        self.assertEqual((media.mime_type, media.type), ("image/png", "PHOTO"))
+        metadata = media.metadata
+        self.assertEqual((metadata["status"], metadata["alt"], metadata["width"], metadata["height"]), ("processed", "Red", 200, 100))
+        self.assertEqual(
+            [(thumbnail["width"], thumbnail["height"]) for thumbnail in metadata["thumbnails"]], [(40, 20), (100, 50)]
+        )
+        for thumbnail in metadata["thumbnails"]:
+            self.assertTrue(default_storage.exists(thumbnail["url"][len(settings.MEDIA_URL):]))
+        self.assertEqual(len(metadata["blurhash"]), 4 + 2 * 4 * 3)
+
+    def test_animated_gif(self):
+        media = self.process(self.attach("animation.gif", self.image("GIF", frames=["red", "green", "blue"])))
+        self.assertEqual((media.mime_type, media.type), ("image/gif", "GIF"))
+        self.assertEqual((media.metadata["frames"], media.metadata["durationMs"]), (3, 600))
+
+    def test_video(self):
+        mvhd = bytes(12) + struct.pack(">II", 1000, 2500) + bytes(80)
+        tkhd = bytes(76) + struct.pack(">II", 1280 << 16, 720 << 16)
+        data = box(b"ftyp", b"isom" + bytes(8)) + box(b"moov", box(b"mvhd", mvhd) + box(b"trak", box(b"tkhd", tkhd)))
+        media = self.process(self.attach("video.mp4", data))
+        self.assertEqual((media.mime_type, media.type), ("video/mp4", "VIDEO"))
+        self.assertEqual(
+            {key: media.metadata[key] for key in ("width", "height", "durationMs")}, {"width": 1280, "height": 720, "durationMs": 2500}
+        )
+
+    def test_failures(self):
+        unsupported = self.process(self.attach("notes.txt", b"just some text"))
+        self.assertEqual((unsupported.metadata["status"], unsupported.mime_type, unsupported.type), ("unsupported", None, "PHOTO"))
+
+        for media, error in (
+            (self.attach("missing.png", None), "Media file not found."),
+            (self.attach("broken.png", b"\x89PNG\r\n\x1a\n" + bytes(16)), "Unreadable image."),
+            (PostMedia.objects.create(post=self.post, media_url="http://127.0.0.1/a.png"), "Media host is not public."),
+        ):
+            media = self.process(media)
+            self.assertEqual((media.metadata["status"], media.metadata["error"]), ("failed", error))
+
+        with override_settings(MEDIA_MAX_BYTES=100):
+            media = self.process(self.attach("large.png", self.image("PNG", (200, 100))))
+        self.assertEqual(media.metadata["error"], "Media file is too large.")
+        with override_settings(MEDIA_MAX_PIXELS=100):
+            media = self.process(self.attach("pixels.png", self.image("PNG")))
+        self.assertEqual(media.metadata["error"], "Image has too many pixels.")
@@ -0,0 +1,57 @@
+"""
+Conversation trees for the thread query.
+
+Every post knows the top level post of its conversation (root_post), its nesting level (depth) and the
+path of ids leading to it (see Post.place_in_thread). The replies under a post are then fetched with a single
+range scan of the idx_post_thread index (root_post = ?, depth between ? and ?, oldest first, level by level)
+instead of one PostNode.comments query per post and per level, and the tree is assembled in Python.
+"""
+
+from django.conf import settings
+
+from .models import Post
+
+
+class ThreadEntry:
+    """
+    A post of the tree and its replies (ThreadEntry list, oldest first).
+    """
+    __slots__ = ("post", "replies")
+
+    def __init__(self, post):
+        self.post = post
+        self.replies = []
+
+
+def get_thread(post_id, max_depth, per_level):
+    """
+    Return the ThreadEntry of post_id (a top level post or a comment) with the replies under it,
+    max_depth levels deep and at most per_level replies per post. None when the post doesn't exist.
+
+    At most THREAD_MAX_POSTS replies are read, the shallowest levels first. Deleted posts are left out
+    (with their subtree), like they are from comment_count.
+    """
+    posts = Post.objects.select_related("author__profile").filter(deleted=False)
+    root = posts.filter(pk=post_id).first()
+    if root is None:
+        return None
+
+    replies = posts.filter(
+        root_post_id=root.root_post_id or root.id,
+        depth__gt=root.depth,
+        depth__lte=root.depth + max_depth,
+    )
+    if root.root_post_id is not None:
+        # a comment: only its own subtree
+        replies = replies.filter(path__startswith=root.path + "/")
+    replies = replies.order_by("depth", "created_at")[:settings.THREAD_MAX_POSTS]
+
+    entries = {root.id: ThreadEntry(root)}
+    for post in replies:
+        parent = entries.get(post.parent_post_id)
+        # the parent was left out (per_level or THREAD_MAX_POSTS): so is the subtree
+        if parent is None or len(parent.replies) >= per_level:
+            continue
+        entry = entries[post.id] = ThreadEntry(post)
+        parent.replies.append(entry)
+    return entries[root.id]
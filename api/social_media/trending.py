@@ -0,0 +1,107 @@
+"""
+Trending posts, ranked by time-decayed engagement and precomputed by a celery task.
+
+compute_trending counts the interactions of the last TRENDING_WINDOW_HOURS per post, type and hour
+with a single grouped query. Every hourly bucket is worth its interactions times their INTERACTION_WEIGHTS,
+halved every TRENDING_HALF_LIFE_HOURS since the bucket, so a burst of likes an hour ago beats a bigger one
+yesterday. The best TRENDING_POSTS_COUNT live top level posts are stored in the redis sorted set
+trending:posts, swapped in atomically. trendingPosts pages through that set and fetches the posts of a page
+with one query.
+"""
+
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import Count
+from django.db.models.functions import TruncHour
+from django.utils import timezone
+from django_redis import get_redis_connection
+
+from .models import Post, Interaction
+
+logger = logging.getLogger(__name__)
+
+
+TRENDING_KEY = "trending:posts"
+INTERACTION_WEIGHTS = {
+    "LIKE": 1,
+    "COMMENT": 2,
+    "SHARE": 3,
+}
+
+
+def get_connection():
+    return get_redis_connection("default")
+
+
+def decayed_score(weighted_count, bucket, now, half_life_hours):
+    # buckets are aged from their middle
+    age_hours = (now - bucket).total_seconds() / 3600 - 0.5
+    return weighted_count * 0.5 ** (max(age_hours, 0) / half_life_hours)
+
+
+def trending_scores(now=None):
+    """
+    Return {post_id: score} of the posts with interactions in the trending window.
+    """
+    now = now or timezone.now()
+    buckets = (
+        Interaction.objects.filter(
+            created_at__gte=now - timedelta(hours=settings.TRENDING_WINDOW_HOURS),
+            post__deleted=False,
+            post__parent_post=None,
+        )
+        .annotate(bucket=TruncHour("created_at"))
+        .values_list("post_id", "type", "bucket")
+        .annotate(total=Count("id"))
+        .order_by()
+    )
+    scores = {}
+    for post_id, type, bucket, total in buckets:
+        score = decayed_score(total * INTERACTION_WEIGHTS.get(type, 1), bucket, now, settings.TRENDING_HALF_LIFE_HOURS)
+        scores[post_id] = scores.get(post_id, 0) + score
+    return scores
+
+
+def compute_trending(now=None):
+    """
+    Recompute the trending set, return the number of posts it holds.
+    """
+    scores = trending_scores(now)
+    top = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:settings.TRENDING_POSTS_COUNT]
+
+    redis = get_connection()
+    pipe = redis.pipeline()
+    if top:
+        # build aside and rename, readers never see a partial set
+        staging_key = TRENDING_KEY + ":staging"
+        pipe.delete(staging_key)
+        pipe.zadd(staging_key, {str(post_id): score for post_id, score in top})
+        pipe.rename(staging_key, TRENDING_KEY)
+    else:
+        pipe.delete(TRENDING_KEY)
+    pipe.execute()
+    return len(top)
+
+
+def get_trending_posts(offset=0, limit=20):
+    """
+    Return ([(rank, post)], total) of a page of the trending posts, best first.
+    Posts deleted since the set was computed are left out of the page.
+    """
+    try:
+        redis = get_connection()
+        pipe = redis.pipeline(transaction=False)
+        pipe.zrevrange(TRENDING_KEY, offset, offset + limit - 1)
+        pipe.zcard(TRENDING_KEY)
+        post_ids, total = pipe.execute()
+    except Exception:
+        logger.warning("Could not read the trending posts", exc_info=True)
+        return [], 0
+
+    post_ids = [post_id.decode() for post_id in post_ids]
+    posts = Post.objects.select_related("author__profile").filter(deleted=False).in_bulk(post_ids)
+    # in_bulk keys are UUIDs, redis members are strings
+    posts = {str(post_id): post for post_id, post in posts.items()}
+    return [(offset + i, posts[post_id]) for i, post_id in enumerate(post_ids) if post_id in posts], total
@@ -1,13 +1,58 @@
+import json
+import logging
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.cache.backends.base import DEFAULT_TIMEOUT
+from django.db import transaction
 from graphene.relay import Node
+from graphql.language import ast
+from graphql.language.printer import print_ast
+from graphql.language.visitor import Visitor, TypeInfoVisitor, visit
+from graphql.type import get_named_type
+from graphql.utils.get_operation_ast import get_operation_ast
+from graphql.utils.type_info import TypeInfo
+from graphql.utils.value_from_ast import value_from_ast
+
+from .metrics import record_cache
+
+logger = logging.getLogger(__name__)
 
 def node_resolver(ModelNode,info, global_id):
     # body = info.context.body.decode()
-    
+
     _, id = Node.from_global_id(global_id)
     response = ModelNode.get_node(info, id)
     return response
 
 
+# ======================================================================================================================
+# GraphQL response cache
+#
+# Results of read-only operations are cached under a key built from the normalized query, the variables
+# and the viewer. Every entry records the versions of the tags it depends on: one tag per node type
+# ("PostNode") and one per object ("PostNode:<id>") for single object lookups.
+# Mutations bump the versions of the tags they touch (invalidate_cache), so stale entries simply stop
+# matching and expire on their own, nothing has to keep track of which keys belong to which model.
+
+CACHE_KEY_PREFIX = "gql:"
+TAG_KEY_PREFIX = "gql-tag:"
+# set for DATABASE_REPLICA_PIN_SECONDS after a tag is bumped: results read from a lagging replica meanwhile
+# may predate the write and must not be cached under the new version
+RECENT_TAG_KEY_PREFIX = "gql-tag-recent:"
+
+# node types whose changes are tracked with tags, a query selecting any other object type is not cached
+TAGGED_NODES = {
+    "ProfileNode",
+    "PostNode",
+    "PostMediaNode",
+    "InteractionNode",
+    "FollowNode",
+    "BookmarkNode",
+    "UserNode",
+}
+
 
 def hash_key(query_body) -> str:
     """
@@ -19,20 +64,142 @@ def hash_key(query_body) -> str:
     return hashlib.sha256(hash_input.encode()).hexdigest()
 
 
-def save_to_cache(key, value, ModelNode):
-    from django.core.cache import cache
+def cache_tag(ModelNode, id=None):
+    """
+    Tag for every object of ModelNode, or for a single object when id is given.
+    """
+    node_name = ModelNode if isinstance(ModelNode, str) else ModelNode.__name__
+    if id is None:
+        return node_name
+    return f"{node_name}:{id}"
+
+
+def response_cache_key(document_ast, variables, operation_name, viewer):
+    """
+    Cache key of an operation: printing the AST normalizes whitespace, commas and comments.
+    """
+    body = json.dumps(
+        [print_ast(document_ast), variables or {}, operation_name, viewer],
+        sort_keys=True,
+        default=str,
+    )
+    return CACHE_KEY_PREFIX + hash_key(body)
+
+
+class _TypeCollector(Visitor):
+    def __init__(self, type_info):
+        self.type_info = type_info
+        self.type_counts = {}
 
+    def enter_Field(self, node, *args):
+        named_type = get_named_type(self.type_info.get_type())
+        if named_type is not None and hasattr(named_type, "fields"):
+            self.type_counts[named_type.name] = self.type_counts.get(named_type.name, 0) + 1
+
+
+def response_cache_tags(schema, document_ast, operation_name, variables, cacheable_fields):
     """
-    Keep track of the cache keys of all models for later invalidation
+    Return the tags the result of a query depends on, or None when the operation must not be cached
+    (mutations, root fields outside cacheable_fields, object types without tags).
     """
+    operation = get_operation_ast(document_ast, operation_name)
+    if operation is None or operation.operation != "query":
+        return None
+    root_fields = operation.selection_set.selections
+    if not all(isinstance(field, ast.Field) and field.name.value in cacheable_fields for field in root_fields):
+        return None
+
+    collector = _TypeCollector(TypeInfo(schema))
+    visit(document_ast, TypeInfoVisitor(collector.type_info, collector))
+    node_types = {
+        name for name in collector.type_counts
+        if not name.endswith(("Connection", "Edge")) and name not in ("PageInfo", "Query")
+    }
+    if not node_types <= TAGGED_NODES:
+        return None
+
+    tags = {cache_tag(name) for name in node_types}
+
+    # single object lookup (post(id: ...)) that doesn't select other objects of the same type:
+    # depend on that object only instead of the whole type
+    if len(root_fields) == 1:
+        root_field = root_fields[0]
+        root_type = get_named_type(schema.get_query_type().fields[root_field.name.value].type).name
+        id_argument = next((arg for arg in root_field.arguments if arg.name.value == "id"), None)
+        if id_argument is not None and collector.type_counts.get(root_type) == 1:
+            global_id = value_from_ast(id_argument.value, schema.get_type("ID"), variables)
+            try:
+                _, id = Node.from_global_id(global_id)
+            except Exception:
+                return None
+            tags.discard(cache_tag(root_type))
+            tags.add(cache_tag(root_type, id))
+
+    return sorted(tags)
+
+
+def get_tag_versions(tags):
+    """
+    Return the current version of every tag, read them before executing the query so that
+    an invalidation happening while it runs isn't missed.
+    """
+    keys = [TAG_KEY_PREFIX + tag for tag in tags]
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            # start unknown (or evicted) tags at the current time so they never match an older entry
+            cache.add(key, time.time_ns(), timeout=None)
+            versions[key] = cache.get(key)
+    return versions
+
+
+def save_to_cache(key, value, tag_versions, timeout=DEFAULT_TIMEOUT):
+    """
+    Cache value together with the versions of the tags it depends on (see get_tag_versions).
+    """
+    cache.set(key, {"tags": tag_versions, "value": value}, timeout=timeout)
 
-    node_name = ModelNode.__name__
-    model_cache = cache.get(node_name, set())
-    model_cache.add(key)
-    cache.set(node_name, model_cache)
-    cache.set(key, value)
 
 def get_from_cache(key):
-    from django.core.cache import cache
+    """
+    Return the cached value, or None when missing or when one of its tags was invalidated since.
+    """
+    entry = cache.get(key)
+    if entry is None:
+        record_cache(hit=False)
+        return None
+    current = cache.get_many(list(entry["tags"]))
+    if any(current.get(tag_key) != version for tag_key, version in entry["tags"].items()):
+        record_cache(hit=False)
+        return None
+    record_cache(hit=True)
+    return entry["value"]
+
+
+def invalidate_cache(*tags):
+    """
+    Bump the version of the given tags once the current transaction commits.
+    """
+    def bump():
+        for tag in tags:
+            key = TAG_KEY_PREFIX + tag
+            try:
+                try:
+                    cache.incr(key)
+                except ValueError:
+                    cache.add(key, time.time_ns(), timeout=None)
+                if settings.DATABASE_REPLICAS:
+                    cache.set(RECENT_TAG_KEY_PREFIX + tag, 1, timeout=settings.DATABASE_REPLICA_PIN_SECONDS)
+            except Exception:
+                # never fail a write because the cache is down, entries expire on their own
+                logger.warning("Could not invalidate cache tag %s", tag, exc_info=True)
 
-    return cache.get(key)
\ No newline at end of file
+    transaction.on_commit(bump)
+
+
+def recently_invalidated(tag_versions):
+    """
+    Whether one of the tags (get_tag_versions keys) was bumped in the last DATABASE_REPLICA_PIN_SECONDS.
+    """
+    tags = [tag_key[len(TAG_KEY_PREFIX):] for tag_key in tag_versions]
+    return bool(cache.get_many([RECENT_TAG_KEY_PREFIX + tag for tag in tags]))
@@ -1,3 +1,366 @@
-from django.shortcuts import render
+import asyncio
+import copy
+import json
+import logging
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth import authenticate
+from django.db import close_old_connections
+from django.http import HttpResponse, HttpResponseForbidden
+from django.views.decorators.http import require_GET
+from graphene_django.views import GraphQLView, HttpError
+from graphql.execution import ExecutionResult, execute
+from graphql.language import ast
+from graphql.utils.get_operation_ast import get_operation_ast
+from graphql_jwt.exceptions import JSONWebTokenError
+from graphql_jwt.utils import get_http_authorization
+from user_management.backends import get_user_by_token
+
+from .backend import document_errors
+from .metrics import DEBUG_HEADER, collect_metrics, current_metrics, track_queries, record_operation, export_metrics
+from .persisted_queries import PersistedQueryError, resolve_persisted_query
+from .routers import (
+    read_from_replicas, reading_from_replicas, replicas_enabled, pin_to_primary, is_pinned_to_primary
+)
+from .utils import (
+    response_cache_key, response_cache_tags, get_tag_versions, save_to_cache, get_from_cache, recently_invalidated
+)
 
 # Create your views here.
+
+logger = logging.getLogger(__name__)
+
+
+# root query fields whose results can be served from the response cache
+# (home_feed is left out, it is already served from redis and changes through the fan-out tasks)
+CACHEABLE_FIELDS = {
+    "profile",
+    "allProfiles",
+    "post",
+    "allPosts",
+    "allPostsIncludingComments",
+    "allDeletedPosts",
+    "postMedia",
+    "allPostMedia",
+    "interaction",
+    "allInteractions",
+    "follow",
+    "allFollows",
+    "bookmark",
+    "allBookmarks",
+}
+
+
+class CachedGraphQLView(GraphQLView):
+    """
+    GraphQLView serving read-only operations from the tag based response cache (see utils.py).
+    Results are cached per viewer, only successful results are stored.
+    Query operations read from the database replicas, if any (see routers.py).
+    """
+
+    def get_graphql_params(self, request, data):
+        query, variables, operation_name, id = super().get_graphql_params(request, data)
+        extensions = request.GET.get("extensions") or data.get("extensions")
+        if isinstance(extensions, str):
+            try:
+                extensions = json.loads(extensions)
+            except ValueError:
+                extensions = None
+        if isinstance(extensions, dict) and "persistedQuery" in extensions:
+            query = resolve_persisted_query(query, extensions["persistedQuery"])
+        return query, variables, operation_name, id
+
+    @staticmethod
+    def format_error(error):
+        if isinstance(error, PersistedQueryError):
+            return {"message": error.message, "extensions": {"code": error.code}}
+        return GraphQLView.format_error(error)
+
+    def get_viewer(self, request):
+        """
+        Cache scope of the request: the primary key of the user of the JWT, None when the request can't be cached.
+        Not the username: once renamed, another account could take it over and read the cached responses.
+        The user comes from the JWT user cache (see user_management/backends.py), no database query once cached.
+        """
+        token = get_http_authorization(request)
+        if token is None:
+            return "anonymous"
+        try:
+            user = get_user_by_token(token, request)
+        except JSONWebTokenError:
+            return None
+        return str(user.pk) if user is not None else None
+
+    def wants_debug_extensions(self, request):
+        """
+        Metrics are only returned to staff users (or anyone in DEBUG), they tell a lot about the backend.
+        """
+        if DEBUG_HEADER not in request.META:
+            return False
+        if settings.DEBUG:
+            return True
+        user = getattr(request, "user", None)
+        if user is None or not user.is_authenticated:
+            # the JWT middleware only authenticates the request when a resolver runs (not on cache hits)
+            user = authenticate(request=request)
+        return user is not None and user.is_staff
+
+    def get_operation_type(self, request, query, operation_name):
+        """
+        Type of the operation to execute ("query", "mutation"...), None when it can't be told.
+        """
+        if not query:
+            return None
+        try:
+            document = self.get_backend(request).document_from_string(self.schema, query)
+        except Exception:
+            return None
+        operation = get_operation_ast(document.document_ast, operation_name)
+        return operation.operation if operation is not None else None
+
+    def can_read_from_replicas(self, request):
+        """
+        Queries read from the replicas, unless the viewer ran a mutation in the last few seconds.
+        """
+        if not replicas_enabled():
+            return False
+        viewer = self.get_viewer(request)
+        return viewer is None or viewer == "anonymous" or not is_pinned_to_primary(viewer)
+
+    def execute_graphql_request(self, request, data, query, variables, operation_name, show_graphiql=False):
+        operation_type = self.get_operation_type(request, query, operation_name)
+        use_replicas = operation_type == "query" and self.can_read_from_replicas(request)
+        with collect_metrics(operation_name) as metrics, read_from_replicas(use_replicas):
+            result = self.execute_cached_graphql_request(
+                request, data, query, variables, operation_name, show_graphiql
+            )
+        if operation_type == "mutation":
+            # read your own writes: the replicas may not have them yet
+            pin_to_primary(self.get_viewer(request))
+        self.finish_metrics(request, metrics, query, result)
+        return result
+
+    def finish_metrics(self, request, metrics, query, result):
+        metrics.has_errors = bool(result is not None and result.errors)
+        if query:
+            record_operation(metrics)
+        if result is not None and self.wants_debug_extensions(request):
+            request.graphql_extensions = {"metrics": metrics.as_extensions()}
+
+    def json_encode(self, request, d, pretty=False):
+        # GraphQLView.get_response doesn't pass the extensions on, add them to the response here
+        extensions = getattr(request, "graphql_extensions", None)
+        if extensions is not None and ("data" in d or "errors" in d):
+            d = {**d, "extensions": extensions}
+            request.graphql_extensions = None
+        return super().json_encode(request, d, pretty)
+
+    def lookup_cached_response(self, request, query, variables, operation_name):
+        """
+        Return (cached data, cache key, tag versions). The cache key is None when the result can't be cached,
+        the tag versions are read before execution and stored with the result (see get_tag_versions).
+        """
+        if not query or not settings.GRAPHQL_RESPONSE_CACHE_TIMEOUT:
+            return None, None, None
+        viewer = self.get_viewer(request)
+        if viewer is None:
+            return None, None, None
+        try:
+            document = self.get_backend(request).document_from_string(self.schema, query)
+            tags = response_cache_tags(self.schema, document.document_ast, operation_name, variables, CACHEABLE_FIELDS)
+        except Exception:
+            # let the regular path report the error
+            tags = None
+        if tags is None:
+            return None, None, None
+
+        metrics = current_metrics()
+        if metrics is not None and metrics.operation is None:
+            # cache hits never reach the metrics middleware, name the operation here
+            operation = get_operation_ast(document.document_ast, operation_name)
+            metrics.operation_type = operation.operation
+            metrics.operation = operation.name.value if operation.name else None
+        try:
+            cache_key = response_cache_key(document.document_ast, variables, operation_name, viewer)
+            cached = get_from_cache(cache_key)
+            if cached is not None:
+                return cached, None, None
+            return None, cache_key, get_tag_versions(tags)
+        except Exception:
+            # cache unavailable, serve the request uncached
+            logger.warning("GraphQL response cache lookup failed", exc_info=True)
+            return None, None, None
+
+    def store_cached_response(self, cache_key, tag_versions, result):
+        if cache_key is None or result is None or result.errors or result.invalid:
+            return
+        try:
+            if reading_from_replicas() and recently_invalidated(tag_versions):
+                # the replica may not have the write that bumped the tags yet
+                return
+            save_to_cache(cache_key, result.data, tag_versions, timeout=settings.GRAPHQL_RESPONSE_CACHE_TIMEOUT)
+        except Exception:
+            logger.warning("GraphQL response cache write failed", exc_info=True)
+
+    def execute_cached_graphql_request(self, request, data, query, variables, operation_name, show_graphiql=False):
+        cached, cache_key, tag_versions = self.lookup_cached_response(request, query, variables, operation_name)
+        if cached is not None:
+            return ExecutionResult(data=cached)
+        result = super().execute_graphql_request(request, data, query, variables, operation_name, show_graphiql)
+        self.store_cached_response(cache_key, tag_versions, result)
+        return result
+
+
+class AsyncGraphQLView(CachedGraphQLView):
+    """
+    Async CachedGraphQLView for the ASGI server (uvicorn workers), a slow query no longer holds a whole worker.
+
+    The root fields of a query run concurrently, each in a worker thread (sync_to_async) with its own copy
+    of the request, so each one gets its own DataLoaders and database connection. Cache lookups and writes
+    are awaited in worker threads as well.
+    Mutations (serial by definition), GraphiQL and invalid requests go through the sync view in a worker thread.
+    """
+
+    async def get(self, request, *args, **kwargs):
+        return await self.dispatch(request, *args, **kwargs)
+
+    async def post(self, request, *args, **kwargs):
+        return await self.dispatch(request, *args, **kwargs)
+
+    async def dispatch(self, request, *args, **kwargs):
+        try:
+            if request.method.lower() in ("get", "post") and not self.batch:
+                data = self.parse_body(request)
+                if not (self.graphiql and self.can_display_graphiql(request, data)):
+                    response = await self.get_async_response(request, data)
+                    if response is not None:
+                        result, status_code = response
+                        return HttpResponse(status=status_code, content=result, content_type="application/json")
+        except HttpError as e:
+            response = e.response
+            response["Content-Type"] = "application/json"
+            response.content = self.json_encode(request, {"errors": [self.format_error(e)]})
+            return response
+        return await sync_to_async(super().dispatch, thread_sensitive=False)(request, *args, **kwargs)
+
+    async def get_async_response(self, request, data):
+        """
+        Return (response body, status code) of a query, None for the requests left to the sync view.
+        """
+        query, variables, operation_name, id = await sync_to_async(
+            self.get_graphql_params, thread_sensitive=False
+        )(request, data)
+        if not query:
+            return None
+        try:
+            document = self.get_backend(request).document_from_string(self.schema, query)
+        except Exception:
+            return None
+        operation = get_operation_ast(document.document_ast, operation_name)
+        if operation is None or operation.operation != "query":
+            return None
+
+        use_replicas = await sync_to_async(self.can_read_from_replicas, thread_sensitive=False)(request)
+        with collect_metrics(operation_name) as metrics, read_from_replicas(use_replicas):
+            cached, cache_key, tag_versions = await sync_to_async(
+                self.lookup_cached_response, thread_sensitive=False
+            )(request, query, variables, operation_name)
+            if cached is not None:
+                result = ExecutionResult(data=cached)
+            else:
+                result = await self.execute_concurrently(request, document, operation, variables, operation_name)
+                await sync_to_async(self.store_cached_response, thread_sensitive=False)(cache_key, tag_versions, result)
+        await sync_to_async(self.finish_metrics, thread_sensitive=False)(request, metrics, query, result)
+
+        response = {}
+        if result.errors:
+            response["errors"] = [self.format_error(e) for e in result.errors]
+        if not result.invalid:
+            response["data"] = result.data
+        return self.json_encode(request, response), 400 if result.invalid else 200
+
+    async def execute_concurrently(self, request, document, operation, variables, operation_name):
+        errors = document_errors(document, operation_name, variables)
+        if errors:
+            return ExecutionResult(errors=errors, invalid=True)
+
+        selections = operation.selection_set.selections
+        if len(selections) > 1 and all(isinstance(selection, ast.Field) for selection in selections):
+            fragments = [
+                definition for definition in document.document_ast.definitions
+                if isinstance(definition, ast.FragmentDefinition)
+            ]
+            parts = [
+                ast.Document(definitions=[
+                    ast.OperationDefinition(
+                        operation=operation.operation,
+                        name=operation.name,
+                        variable_definitions=operation.variable_definitions,
+                        directives=operation.directives,
+                        selection_set=ast.SelectionSet(selections=[selection]),
+                    ),
+                    *fragments,
+                ])
+                for selection in selections
+            ]
+        else:
+            parts = [document.document_ast]
+
+        results = await asyncio.gather(*(
+            sync_to_async(self.execute_part, thread_sensitive=False)(request, part, variables, operation_name)
+            for part in parts
+        ))
+        if len(results) == 1:
+            return results[0]
+        data, errors = {}, []
+        for result in results:
+            data.update(result.data or {})
+            errors.extend(result.errors or ())
+        return ExecutionResult(data=data, errors=errors)
+
+    def execute_part(self, request, document_ast, variables, operation_name):
+        """
+        Execute (part of) a validated query, in a worker thread.
+        """
+        close_old_connections()
+        try:
+            with track_queries():
+                return execute(
+                    self.schema,
+                    document_ast,
+                    root_value=self.get_root_value(request),
+                    # a copy per root field: the loaders and the user are attached to the context
+                    context_value=copy.copy(request),
+                    variable_values=variables,
+                    operation_name=operation_name,
+                    middleware=self.get_middleware(request),
+                )
+        except Exception as e:
+            return ExecutionResult(errors=[e], invalid=True)
+        finally:
+            close_old_connections()
+
+
+@require_GET
+def metrics_view(request):
+    """
+    Aggregated GraphQL metrics in the Prometheus text format.
+    Protected by a bearer token when GRAPHQL_METRICS_TOKEN is set, staff users only (or DEBUG) otherwise.
+    """
+    token = settings.GRAPHQL_METRICS_TOKEN
+    if token:
+        if request.META.get("HTTP_AUTHORIZATION") != "Bearer {}".format(token):
+            return HttpResponseForbidden()
+    elif not settings.DEBUG:
+        user = getattr(request, "user", None)
+        if user is None or not user.is_authenticated:
+            user = authenticate(request=request)
+        if user is None or not user.is_staff:
+            return HttpResponseForbidden()
+    try:
+        body = export_metrics()
+    except Exception:
+        logger.warning("Could not export GraphQL metrics", exc_info=True)
+        return HttpResponse(status=503)
+    return HttpResponse(body, content_type="text/plain; version=0.0.4; charset=utf-8")
@@ -11,7 +11,7 @@ https://docs.djangoproject.com/en/4.2/ref/settings/
 """
 
 from pathlib import Path
-from decouple import config
+from decouple import config, Csv
 from datetime import timedelta
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -40,6 +40,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres', # full text search / trigram lookups, see social_media/search.py
     'django', 
     # 'rest_framework',
     # 'rest_framework_simplejwt',
@@ -66,6 +67,7 @@ GRAPHENE = {
     "SCHEMA": "social_media_project.schema.schema",
     'MIDDLEWARE': [
         'graphql_jwt.middleware.JSONWebTokenMiddleware',
+        'social_media.metrics.MetricsMiddleware', # last = outermost, the JWT authentication is counted too
     ],
 }
 GRAPHQL_JWT = {
@@ -93,9 +95,12 @@ GRAPHQL_AUTH = {
 }
 
 AUTHENTICATION_BACKENDS = [
-    "graphql_auth.backends.GraphQLAuthBackend",
+    "user_management.backends.CachedJSONWebTokenBackend", # graphql_auth's backend, without the per-request user query
     "django.contrib.auth.backends.ModelBackend"
 ]
+# JWT user snapshots (see user_management/backends.py)
+JWT_USER_CACHE_TIMEOUT = config("JWT_USER_CACHE_TIMEOUT", default=60 * 5, cast=int) # in redis
+JWT_USER_LOCAL_CACHE_TIMEOUT = config("JWT_USER_LOCAL_CACHE_TIMEOUT", default=10, cast=int) # per process, how late the other workers see an invalidation
 
 if DEBUG:
     CORS_ALLOW_ALL_ORIGINS = True
@@ -168,12 +173,28 @@ if not DEBUG:
             'PASSWORD': config('PGPASSWORD'),
             'HOST': config('PGHOST'),
             'PORT': config('PGPORT', cast=int, default=5432),
+            # the async view runs queries from a pool of threads, each keeping its own connection
+            'CONN_MAX_AGE': config('CONN_MAX_AGE', cast=int, default=60),
+            'CONN_HEALTH_CHECKS': True,
             'OPTIONS': {
             'sslmode': 'require',
             },
         }
     }
 
+# read replicas of the primary (comma separated hosts, same database and credentials), GraphQL queries
+# read from them (see social_media/routers.py)
+DATABASE_REPLICAS = []
+if not DEBUG:
+    for index, host in enumerate(config('PGREPLICA_HOSTS', default='', cast=Csv())):
+        alias = 'replica_{}'.format(index)
+        DATABASES[alias] = {**DATABASES['default'], 'HOST': host, 'TEST': {'MIRROR': 'default'}}
+        DATABASE_REPLICAS.append(alias)
+
+DATABASE_ROUTERS = ['social_media.routers.PrimaryReplicaRouter']
+# a viewer reads from the primary for this long after a mutation (longer than the replication lag)
+DATABASE_REPLICA_PIN_SECONDS = config('DATABASE_REPLICA_PIN_SECONDS', default=5, cast=int)
+
 
 
 # Password validation
@@ -247,6 +268,54 @@ CACHES = {
 }
 
 
+# GraphQL response cache (see social_media/utils.py), 0 disables it
+GRAPHQL_RESPONSE_CACHE_TIMEOUT = config("GRAPHQL_RESPONSE_CACHE_TIMEOUT", default=60 * 5, cast=int)
+
+# GraphQL query budgets (see social_media/complexity.py), checked before execution
+GRAPHQL_QUERY_MAX_DEPTH = config("GRAPHQL_QUERY_MAX_DEPTH", default=10, cast=int)
+GRAPHQL_QUERY_MAX_COST = config("GRAPHQL_QUERY_MAX_COST", default=20000, cast=int) # estimated rows
+
+# serve /graphql with the async view (social_media/views.py AsyncGraphQLView), for the ASGI server
+GRAPHQL_ASYNC_VIEW = config("GRAPHQL_ASYNC_VIEW", default=not DEBUG, cast=bool)
+# parsed + validated documents kept per process (see social_media/backend.py)
+GRAPHQL_DOCUMENT_CACHE_SIZE = config("GRAPHQL_DOCUMENT_CACHE_SIZE", default=1000, cast=int)
+# automatic persisted queries (see social_media/persisted_queries.py)
+GRAPHQL_PERSISTED_QUERY_TIMEOUT = config("GRAPHQL_PERSISTED_QUERY_TIMEOUT", default=60 * 60 * 24 * 30, cast=int)
+
+# GraphQL metrics (see social_media/metrics.py), bearer token required by /metrics (staff users only when unset)
+GRAPHQL_METRICS_TOKEN = config("GRAPHQL_METRICS_TOKEN", default=None)
+GRAPHQL_METRICS_MAX_OPERATIONS = config("GRAPHQL_METRICS_MAX_OPERATIONS", default=200, cast=int) # distinct operation names, the others are counted as "other"
+GRAPHQL_METRICS_MAX_PATHS = config("GRAPHQL_METRICS_MAX_PATHS", default=2000, cast=int) # distinct operation + resolver path pairs
+
+# Home feed (fan-out-on-write into redis sorted sets, see social_media/feed.py)
+HOME_FEED_MAX_LENGTH = config("HOME_FEED_MAX_LENGTH", default=800, cast=int) # posts kept per feed
+HOME_FEED_FANOUT_FOLLOWER_LIMIT = config("HOME_FEED_FANOUT_FOLLOWER_LIMIT", default=10000, cast=int) # above this, fan-out-on-read
+HOME_FEED_TTL = 60 * 60 * 24 * 7 # feeds of inactive users expire after a week and get rebuilt on read
+
+# follower/following id sets in redis (see social_media/social_graph.py), rebuilt from the database once expired
+SOCIAL_GRAPH_TTL = 60 * 60 * 24
+
+# "people you may know" (see social_media/recommendations.py), recomputed by the compute_profile_suggestions task
+PROFILE_SUGGESTIONS_COUNT = config("PROFILE_SUGGESTIONS_COUNT", default=50, cast=int) # suggestions kept per user
+PROFILE_SUGGESTIONS_MAX_DEGREE = config("PROFILE_SUGGESTIONS_MAX_DEGREE", default=5000, cast=int) # accounts following more are not walked through
+PROFILE_SUGGESTIONS_TTL = 60 * 60 * 24 * 2 # outlives a missed run
+
+# trending posts (see social_media/trending.py), recomputed by the compute_trending_posts task
+TRENDING_POSTS_COUNT = config("TRENDING_POSTS_COUNT", default=500, cast=int) # posts kept in the trending set
+TRENDING_WINDOW_HOURS = config("TRENDING_WINDOW_HOURS", default=48, cast=int) # interactions older than this are ignored
+TRENDING_HALF_LIFE_HOURS = config("TRENDING_HALF_LIFE_HOURS", default=6, cast=float) # an interaction is worth half as much after this
+
+# thread query (see social_media/threads.py)
+THREAD_MAX_DEPTH = 10 # deepest maxDepth accepted
+THREAD_MAX_POSTS = 1000 # replies read per thread, shallowest levels first
+
+# attachment processing (see social_media/media.py), done by the process_post_media task on the media queue
+MEDIA_MAX_BYTES = config("MEDIA_MAX_BYTES", default=50 * 1024 * 1024, cast=int) # larger files are not processed
+MEDIA_MAX_PIXELS = config("MEDIA_MAX_PIXELS", default=50_000_000, cast=int) # larger images are not decoded
+MEDIA_FETCH_TIMEOUT = config("MEDIA_FETCH_TIMEOUT", default=10, cast=int) # seconds, for attachments hosted elsewhere
+MEDIA_THUMBNAIL_SIZES = config("MEDIA_THUMBNAIL_SIZES", default="160,480,1080", cast=Csv(int)) # longest side in pixels
+
+
 AUTH_USER_MODEL = "user_management.User"
 
 # Internationalization
@@ -282,6 +351,10 @@ STATIC_URL = 'static/'
 STATIC_ROOT = BASE_DIR / "staticfiles"
 STATICFILES_STORAGE = 'whitenoise.storage.CompressedManifestStaticFilesStorage'
 
+# Uploaded media and the generated thumbnails (local storage, served by django in DEBUG only)
+MEDIA_URL = config('MEDIA_URL', default='/media/')
+MEDIA_ROOT = config('MEDIA_ROOT', default=str(BASE_DIR / "media"))
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/4.2/ref/settings/#default-auto-field
 
@@ -290,6 +363,9 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 # Celery Configuration
 CELERY_BROKER_URL = config('CELERY_BROKER_URL', default='redis://redis:6379/1')
 CELERY_RESULT_BACKEND = config('CELERY_RESULT_BACKEND', default='redis://redis:6379/2')
+# don't retry the broker connection when queueing a task: the web requests would hang for seconds while it is down
+# (the workers' own connection keeps retrying, broker_connection_max_retries)
+CELERY_BROKER_TRANSPORT_OPTIONS = {'max_retries': 0}
 
 CELERY_ACCEPT_CONTENT = ['json']
 CELERY_TASK_SERIALIZER = 'json'
@@ -304,6 +380,10 @@ CELERY_WORKER_PREFETCH_MULTIPLIER = 1
 
 # Optional: default queue
 CELERY_TASK_DEFAULT_QUEUE = 'default'
+# decoding images is memory hungry, it gets its own worker pool (celery_media_worker in docker-compose.yml)
+CELERY_TASK_ROUTES = {
+    'social_media.tasks.process_post_media': {'queue': 'media'},
+}
 
 # Timezone handling
 CELERY_TIMEZONE = TIME_ZONE
@@ -318,6 +398,22 @@ CELERY_BEAT_SCHEDULE = {
         'task': 'social_media.tasks.clean_soft_deleted_posts',
         'schedule': crontab(day_of_week='sun', hour=1, minute=0), # every Sunday at 1:00 AM
     },
+    'reconcile_post_counters': {
+        'task': 'social_media.tasks.reconcile_post_counters',
+        'schedule': crontab(minute=30), # every hour
+    },
+    'reconcile_follow_counters': {
+        'task': 'social_media.tasks.reconcile_follow_counters',
+        'schedule': crontab(minute=45), # every hour
+    },
+    'compute_profile_suggestions': {
+        'task': 'social_media.tasks.compute_profile_suggestions',
+        'schedule': crontab(hour=3, minute=0), # every day at 3:00 AM
+    },
+    'compute_trending_posts': {
+        'task': 'social_media.tasks.compute_trending_posts',
+        'schedule': crontab(minute='*/5'), # every 5 minutes
+    },
 }
 
 
@@ -14,20 +14,30 @@ Including another URLconf
     1. Import the include() function: from django.urls import include, path
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
+from django.conf import settings
+from django.conf.urls.static import static
 from django.contrib import admin
 from django.urls import path, include
 from drf_spectacular.views import SpectacularAPIView, SpectacularRedocView, SpectacularSwaggerView
 from django.views.decorators.csrf import csrf_exempt
 
-from graphene_django.views import GraphQLView
+from social_media.backend import CachedDocumentBackend
+from social_media.views import CachedGraphQLView, AsyncGraphQLView, metrics_view
 
 urlpatterns = [
     path('admin/', admin.site.urls),
 ]
 
+# the async view when served by uvicorn (entrypoint.sh), the sync one under runserver / wsgi
+GraphQLViewClass = AsyncGraphQLView if settings.GRAPHQL_ASYNC_VIEW else CachedGraphQLView
+
 urlpatterns += [
     path('api/schema/', SpectacularAPIView.as_view(), name='schema'),
     path('api/schema/swagger-ui/', SpectacularSwaggerView.as_view(url_name='schema'), name='swagger-ui'),
     path('api/schema/redoc/', SpectacularRedocView.as_view(url_name='schema'), name='redoc'),
-     path("graphql", csrf_exempt(GraphQLView.as_view(graphiql=True))),
-]
\ No newline at end of file
+     path("graphql", csrf_exempt(GraphQLViewClass.as_view(graphiql=True, backend=CachedDocumentBackend()))),
+    path("metrics", metrics_view, name="metrics"),
+]
+if settings.DEBUG:
+    # uploaded media and thumbnails, a web server or object storage serves them in production
+    urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
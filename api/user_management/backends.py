@@ -0,0 +1,162 @@
+"""
+JWT authentication without a database query per request.
+
+graphql_jwt authenticates every request by decoding its token and loading the user by username. The
+CachedJSONWebTokenBackend keeps a snapshot of the user's columns (the password hash left out) in redis,
+shared by all the workers, behind a process-local cache keyed by the token itself: a token seen in the last
+JWT_USER_LOCAL_CACHE_TIMEOUT seconds is neither decoded again nor looked up anywhere.
+
+Every request gets its own User instance built from the snapshot, the password is loaded on first access.
+Snapshots are dropped when the user is saved or deleted, when one of their refresh tokens is revoked
+(RevokeToken, PasswordChange, PasswordReset) and under the old username after UpdateAccount (see signals.py
+and schema.py). The other processes drop their local copy within JWT_USER_LOCAL_CACHE_TIMEOUT.
+"""
+
+import hashlib
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from graphql_auth.backends import GraphQLAuthBackend
+from graphql_jwt.exceptions import JSONWebTokenError
+from graphql_jwt.settings import jwt_settings
+from graphql_jwt.utils import get_credentials, get_payload
+
+from social_media.routers import PRIMARY
+
+logger = logging.getLogger(__name__)
+
+
+CACHE_KEY_PREFIX = "jwt-user:"
+LOCAL_CACHE_SIZE = 10000
+
+UserModel = get_user_model()
+
+
+def snapshot_fields():
+    return [field.attname for field in UserModel._meta.concrete_fields if field.attname != "password"]
+
+
+# token digest: (expires at, username, snapshot)
+_local_tokens = OrderedDict()
+_local_lock = threading.Lock()
+
+
+def _token_digest(token):
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+def _remember(digest, expires_at, username, snapshot):
+    with _local_lock:
+        _local_tokens[digest] = (expires_at, username, snapshot)
+        _local_tokens.move_to_end(digest)
+        if len(_local_tokens) > LOCAL_CACHE_SIZE:
+            _local_tokens.popitem(last=False)
+
+
+def _recall(digest):
+    with _local_lock:
+        entry = _local_tokens.get(digest)
+        if entry is not None and entry[0] <= time.time():
+            del _local_tokens[digest]
+            return None
+    return entry
+
+
+def user_from_snapshot(snapshot):
+    # the columns left out (password) are deferred: loaded from the primary when accessed, not saved over
+    fields = [field.attname for field in UserModel._meta.concrete_fields if field.attname in snapshot]
+    return UserModel.from_db(PRIMARY, fields, [snapshot[name] for name in fields])
+
+
+def get_user_snapshot(username):
+    """
+    Columns of the user (without the password), from redis or the primary database. None for unknown users.
+    """
+    key = CACHE_KEY_PREFIX + username
+    try:
+        snapshot = cache.get(key)
+    except Exception:
+        logger.warning("Could not read the user snapshot of %s", username, exc_info=True)
+        snapshot = None
+    if snapshot is not None:
+        return snapshot
+
+    # the primary: a replica may not have the last password change or deactivation yet
+    snapshot = (
+        UserModel._default_manager.using(PRIMARY)
+        .filter(**{UserModel.USERNAME_FIELD: username})
+        .values(*snapshot_fields())
+        .first()
+    )
+    if snapshot is not None:
+        try:
+            cache.set(key, snapshot, timeout=settings.JWT_USER_CACHE_TIMEOUT)
+        except Exception:
+            logger.warning("Could not store the user snapshot of %s", username, exc_info=True)
+    return snapshot
+
+
+def get_user_by_token(token, context=None):
+    """
+    graphql_jwt.shortcuts.get_user_by_token served from the caches: same errors, same result.
+    """
+    digest = _token_digest(token)
+    entry = _recall(digest)
+    if entry is not None:
+        return user_from_snapshot(entry[2])
+
+    payload = get_payload(token, context)
+    username = jwt_settings.JWT_PAYLOAD_GET_USERNAME_HANDLER(payload)
+    if not username:
+        raise JSONWebTokenError("Invalid payload")
+    snapshot = get_user_snapshot(username)
+    if snapshot is None:
+        return None
+    if not snapshot.get("is_active", True):
+        raise JSONWebTokenError("User is disabled")
+
+    expires_at = time.time() + settings.JWT_USER_LOCAL_CACHE_TIMEOUT
+    if jwt_settings.JWT_VERIFY_EXPIRATION and "exp" in payload:
+        # never serve the token past its expiry
+        expires_at = min(expires_at, payload["exp"] + jwt_settings.JWT_LEEWAY)
+    _remember(digest, expires_at, username, snapshot)
+    return user_from_snapshot(snapshot)
+
+
+def invalidate_user(*usernames):
+    """
+    Drop the cached snapshots of these users, in redis and in this process.
+    """
+    usernames = {username for username in usernames if username}
+    if not usernames:
+        return
+    with _local_lock:
+        for digest in [digest for digest, entry in _local_tokens.items() if entry[1] in usernames]:
+            del _local_tokens[digest]
+    try:
+        cache.delete_many([CACHE_KEY_PREFIX + username for username in usernames])
+    except Exception:
+        logger.warning("Could not invalidate the user snapshots of %s", ", ".join(usernames), exc_info=True)
+
+
+class CachedJSONWebTokenBackend(GraphQLAuthBackend):
+    """
+    GraphQLAuthBackend (invalid tokens authenticate nobody instead of raising) using the cached user lookup.
+    """
+
+    def authenticate(self, request=None, **kwargs):
+        if request is None or getattr(request, "_jwt_token_auth", False):
+            return None
+
+        token = get_credentials(request, **kwargs)
+        if token is None:
+            return None
+        try:
+            return get_user_by_token(token, request)
+        except JSONWebTokenError:
+            return None
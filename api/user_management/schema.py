@@ -1,6 +1,21 @@
 import graphene
 from graphql_auth import mutations
 
+from .backends import invalidate_user
+
+
+class UpdateAccount(mutations.UpdateAccount):
+    __doc__ = mutations.UpdateAccount.__doc__
+
+    @classmethod
+    def resolve_mutation(cls, root, info, **kwargs):
+        # tokens carry the username: once renamed, the old one must stop authenticating
+        # (the save only invalidates the new one, see signals.py)
+        username = info.context.user.username
+        result = super().resolve_mutation(root, info, **kwargs)
+        invalidate_user(username)
+        return result
+
 
 
 
@@ -12,7 +27,7 @@ class AuthMutation(graphene.ObjectType):
     verify_token = mutations.VerifyToken.Field()
     refresh_token = mutations.RefreshToken.Field()
     revoke_token = mutations.RevokeToken.Field()
-    update_account = mutations.UpdateAccount.Field()
+    update_account = UpdateAccount.Field()
     resend_activation_email = mutations.ResendActivationEmail.Field()
     send_password_reset_email = mutations.SendPasswordResetEmail.Field()
     password_reset = mutations.PasswordReset.Field()
@@ -1,11 +1,41 @@
 
-from django.db.models.signals import post_save
+from django.db.models.signals import post_save, post_delete
 from django.dispatch import receiver
+from .backends import invalidate_user
 from .models import User
 from social_media.models import Profile
+from graphql_auth.models import UserStatus
+from graphql_jwt.refresh_token.signals import refresh_token_revoked
 
 
 @receiver(post_save, sender=User)
 def create_user_profile(sender, instance, created, *args, **kwargs):
     if created:
         Profile.objects.create(user=instance)
+
+
+@receiver(post_save, sender=User)
+def invalidate_user_cache(sender, instance, *args, **kwargs):
+    # usernames/emails are rendered inside cached post, follow and profile responses
+    from social_media.utils import cache_tag, invalidate_cache
+    invalidate_cache(cache_tag("UserNode"), cache_tag("UserNode", instance.pk))
+
+
+@receiver(post_save, sender=UserStatus)
+def invalidate_user_status_cache(sender, instance, *args, **kwargs):
+    # verified/archived are exposed on UserNode
+    from social_media.utils import cache_tag, invalidate_cache
+    invalidate_cache(cache_tag("UserNode"), cache_tag("UserNode", instance.user_id))
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_jwt_user(sender, instance, *args, **kwargs):
+    # password changes and deactivations must not wait for the snapshot to expire
+    invalidate_user(instance.username)
+
+
+@receiver(refresh_token_revoked)
+def invalidate_jwt_user_on_revoke(sender, refresh_token, *args, **kwargs):
+    # RevokeToken, and PasswordChange/PasswordReset which revoke all the refresh tokens of the user
+    invalidate_user(refresh_token.user.username)
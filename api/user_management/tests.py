@@ -1,3 +1,69 @@
-from django.test import TestCase
+from django.contrib.auth import authenticate, get_user_model
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
+from django.test import RequestFactory, TestCase, override_settings
+from graphql_auth.models import UserStatus
+from graphql_jwt.middleware import JSONWebTokenMiddleware
+from graphql_jwt.settings import jwt_settings
+from graphql_jwt.shortcuts import get_token
 
-# Create your tests here.
+from social_media_project.schema import schema
+from user_management import backends
+
+
+User = get_user_model()
+
+
+@override_settings(CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}})
+class CachedJSONWebTokenBackendTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        backends._local_tokens.clear()
+        self.user = User.objects.create_user("jwtuser", "jwtuser@example.com", "password")
+        self.token = get_token(self.user)
+
+    def request(self, token=None):
+        request = RequestFactory().post(
+            "/graphql", HTTP_AUTHORIZATION=f"{jwt_settings.JWT_AUTH_HEADER_PREFIX} {token or self.token}"
+        )
+        # what AuthenticationMiddleware would set, the JWT middleware replaces it
+        request.user = AnonymousUser()
+        return request
+
+    def test_cached_authentication_runs_no_query(self):
+        self.assertEqual(authenticate(request=self.request()), self.user)
+        with self.assertNumQueries(0):
+            user = authenticate(request=self.request())
+        self.assertEqual((user.pk, user.username, user.email), (self.user.pk, "jwtuser", "jwtuser@example.com"))
+
+        # another process: only the redis snapshot left
+        backends._local_tokens.clear()
+        with self.assertNumQueries(0):
+            self.assertEqual(authenticate(request=self.request()), self.user)
+
+    def test_snapshot_keeps_the_password(self):
+        user = authenticate(request=self.request())
+        user.is_staff = True
+        user.save()
+        self.assertTrue(user.check_password("password"))
+        self.assertTrue(User.objects.get(pk=self.user.pk).check_password("password"))
+
+    def test_deactivated_user(self):
+        authenticate(request=self.request())
+        self.user.is_active = False
+        self.user.save()
+        self.assertIsNone(authenticate(request=self.request()))
+
+    def test_renamed_user(self):
+        UserStatus.objects.filter(user=self.user).update(verified=True)
+        self.assertEqual(authenticate(request=self.request()), self.user)
+        result = schema.execute(
+            'mutation { updateAccount(username: "renamed") { success } }',
+            context_value=self.request(),
+            middleware=[JSONWebTokenMiddleware()],
+        )
+        self.assertIsNone(result.errors, result.errors)
+        self.assertTrue(result.data["updateAccount"]["success"])
+        # the old token names a user that no longer exists
+        self.assertIsNone(authenticate(request=self.request()))
+        self.assertEqual(authenticate(request=self.request(get_token(User.objects.get(pk=self.user.pk)))), self.user)